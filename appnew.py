@@ -8,6 +8,16 @@ import datetime as dt
 import time
 import sys
 import os
+import hashlib
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import importlib.util
+import uuid
+import tracemalloc
+import itertools
+import json
+import threading
 
 # 设置页面配置
 st.set_page_config(
@@ -46,26 +56,103 @@ SCOP_AVAILABLE = False
 SCOP_MODULE = None
 Model = None
 Linear = None
+SCOP_VERSION = None  # scop.py / scop-linux 的修改时间，用作缓存键
+
+# 班次编码表：排班表以整数编码保存，显示时再转换为 "编码(名称)"
+JOB_NAMES = {0: "休み", 3: "早番A", 4: "早番B", 5: "早番C", 6: "早番D",
+             7: "遅番A", 8: "遅番B", 9: "遅番C", 10: "遅番D"}
+JOB_LABELS = [f"{j}({JOB_NAMES.get(j, 'Unknown')})" for j in range(max(JOB_NAMES) + 1)]
+# 班次编码 → 类别（0=休み, 1=早番, 2=遅番, 3=その他），统计时用作查找表
+JOB_CATEGORIES = ["休み", "早番", "遅番", "その他"]
+JOB_CATEGORY = np.array([
+    0 if name == "休み" else 1 if name.startswith("早番") else 2 if name.startswith("遅番") else 3
+    for name in (JOB_NAMES.get(j, "") for j in range(len(JOB_LABELS)))
+], dtype=np.int8)
+SHIFT_REQUIREMENT = {1: 2, 2: 2}  # 每天的必要人数（早番・遅番各2人，与模型的需求约束一致）
+
+# 排班表的颜色（按班次编码生成 CSS 类 .job0 〜 .job10）
+JOB_COLORS = {
+    '休み': '#95a5a6', '早番A': '#3498db', '早番B': '#2980b9', 
+    '早番C': '#1abc9c', '早番D': '#16a085', '遅番A': '#e74c3c',
+    '遅番B': '#c0392b', '遅番C': '#f39c12', '遅番D': '#d35400'
+}
+SCHEDULE_PAGE_SIZE = 50  # 每页显示的员工数
+
+SCHEDULE_CSS = """
+    .schedule-scroll { max-height: 640px; overflow: auto; border-radius: 8px; }
+    .schedule-table { border-collapse: separate; border-spacing: 2px; font-size: 0.8rem; }
+    .schedule-table th { background: white; position: sticky; padding: 0.3rem 0.5rem; white-space: nowrap; }
+    .schedule-table thead th { top: 0; z-index: 2; }
+    .schedule-table tbody th { left: 0; text-align: left; z-index: 1; }
+    .schedule-table td { color: white; font-weight: bold; text-align: center; padding: 0.3rem 0.4rem;
+                         border-radius: 5px; white-space: nowrap; }
+""" + "".join(
+    f"    .job{j} {{ background-color: {JOB_COLORS.get(JOB_NAMES.get(j), '#bdc3c7')}; }}\n"
+    for j in range(max(JOB_NAMES) + 1)
+)
+st.markdown(f"<style>{SCHEDULE_CSS}</style>", unsafe_allow_html=True)
+
+def schedule_frame(schedule):
+    """把 员工×日期 的班次编码矩阵转换为分类 DataFrame（from_codes 会逐列复制编码，不与矩阵共享内存）"""
+    n_staff, n_days = schedule.shape
+    return pd.DataFrame(
+        {f"{t+1}日": pd.Categorical.from_codes(schedule[:, t], categories=JOB_LABELS) for t in range(n_days)},
+        index=[f"Staff_{i+1}" for i in range(n_staff)]
+    )
+
+# st.fragment（Streamlit 1.37+）/ st.experimental_fragment（1.33+）的兼容层
+_st_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+def fragment(func=None, *, run_every=None):
+    """把函数声明为可局部重跑的片段；Streamlit 不支持片段时按普通函数执行"""
+    if func is None:
+        return lambda f: fragment(f, run_every=run_every)
+    if _st_fragment is None:
+        return func
+    return _st_fragment(func, run_every=run_every)
 
 def check_optional_dependencies():
-    """检查可选依赖项"""
+    """检查可选依赖项（只查找模块，不导入）"""
+    import importlib.util
     optional_deps = ['plotly', 'matplotlib', 'scipy']
     available = []
     missing = []
     
     for dep in optional_deps:
-        try:
-            __import__(dep)
+        if importlib.util.find_spec(dep) is not None:
             available.append(dep)
-        except ImportError:
+        else:
             missing.append(dep)
     
     return available, missing
 
+def scop_file_mtimes():
+    """scop.py 与 scop-linux 的修改时间（不存在时为 None）"""
+    return tuple(os.path.getmtime(f) if os.path.exists(f) else None for f in ('scop.py', 'scop-linux'))
+
 def try_import_scop():
-    """尝试导入 SCOP 库"""
-    global SCOP_AVAILABLE, SCOP_MODULE, Model, Linear
+    """尝试导入 SCOP 库（探测结果按进程缓存，文件修改时间变化时才重新探测）"""
+    global SCOP_AVAILABLE, SCOP_MODULE, Model, Linear, SCOP_VERSION
     
+    SCOP_VERSION = scop_file_mtimes()
+    success, import_results, scop_module = probe_scop(SCOP_VERSION)
+    if success:
+        SCOP_MODULE = scop_module
+        Model = scop_module.Model
+        Linear = scop_module.Linear
+        SCOP_AVAILABLE = True
+    else:
+        # 重新探测失败时不再沿用旧模块
+        SCOP_MODULE = None
+        Model = None
+        Linear = None
+        SCOP_AVAILABLE = False
+    return success, import_results
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def probe_scop(mtimes):
+    """探测并加载 SCOP：每个进程只执行一次，mtimes 变化时重新执行。
+    返回 (是否成功, 诊断信息, scop 模块)"""
     import_results = {}
     
     try:
@@ -102,7 +189,7 @@ def try_import_scop():
         # 检查 scop.py 文件
         if not os.path.exists('scop.py'):
             import_results['scop_file'] = "❌ scop.py 不存在"
-            return False, import_results
+            return False, import_results, None
         else:
             import_results['scop_file'] = "✅ scop.py 存在"
         
@@ -114,7 +201,6 @@ def try_import_scop():
             spec.loader.exec_module(scop_module)
             sys.modules['scop'] = scop_module
             
-            SCOP_MODULE = scop_module
             import_results['scop_module_load'] = "✅ scop模块加载成功"
             
             # 尝试获取主要类
@@ -125,13 +211,13 @@ def try_import_scop():
                 import_results['model_class'] = "❌ Model类未找到"
                 available_attrs = [attr for attr in dir(scop_module) if not attr.startswith('_')]
                 import_results['available_attributes'] = available_attrs[:10]
-                return False, import_results
+                return False, import_results, None
             
             if Linear is None:
                 import_results['linear_class'] = "❌ Linear类未找到"
                 available_attrs = [attr for attr in dir(scop_module) if not attr.startswith('_')]
                 import_results['available_attributes'] = available_attrs[:10]
-                return False, import_results
+                return False, import_results, None
             
             import_results['classes_found'] = "✅ Model和Linear类找到"
             
@@ -139,21 +225,20 @@ def try_import_scop():
             try:
                 test_model = Model("test")
                 import_results['model_test'] = "✅ Model类测试成功"
-                SCOP_AVAILABLE = True
-                return True, import_results
+                return True, import_results, scop_module
             except Exception as model_error:
                 import_results['model_test'] = f"❌ Model类测试失败: {str(model_error)}"
                 import_results['model_test_details'] = f"错误类型: {type(model_error).__name__}"
-                return False, import_results
+                return False, import_results, None
                 
         except Exception as import_error:
             import_results['scop_import'] = f"❌ scop导入失败: {str(import_error)}"
             import_results['import_error_type'] = type(import_error).__name__
-            return False, import_results
+            return False, import_results, None
     
     except Exception as e:
         import_results['general_error'] = f"❌ 一般错误: {str(e)}"
-        return False, import_results
+        return False, import_results, None
 
 def create_mock_data():
     """创建模拟数据"""
@@ -181,85 +266,286 @@ def create_mock_data():
     }
     
     return n_staff, n_day, day_off, LB, avoid_jobs, job
-def solve_with_scop(weights, progress_placeholder=None, status_placeholder=None):
-    """使用 SCOP 求解器 - 超简化版本"""
+@st.cache_resource(show_spinner=False, max_entries=8)
+def build_base_model(workbook_hash, scop_version=None):
+    """构建基础模型：每个工作簿（按内容哈希）在进程内只构建一次，所有会话共享。
+    scop_version 变化（scop 被重新加载）时重新构建。
+    各会话通过 clone() 得到写时复制的副本，只覆盖权重等设置。"""
+    # 大幅简化问题规模
+    n_staff = 8   # 减少到8个员工
+    n_day = 7     # 减少到7天
+    
+    # 创建模型
+    m = Model("simple_shift", validation="deferred")  # 约束在求解前统一检查
+    
+    # 极简决策变量：只考虑休息、早班、晚班
+    simple_jobs = [0, 1, 2]  # 0=休息, 1=早班, 2=晚班
+    x = m.addVariableArray((n_staff, n_day, len(simple_jobs)), [0, 1], "x")
+    
+    # 只添加最基本的约束
+    constraint_count = 0
+    
+    # 1. 每个员工每天只能有一个状态
+    for i in range(n_staff):
+        for t in range(n_day):
+            constraint = Linear(f"assign[{i},{t}]", weight='inf', rhs=1, direction='=')
+            for j in simple_jobs:
+                constraint.addTerms(1, x[i,t,j], 1)
+            m.addConstraint(constraint)
+            constraint_count += 1
+    
+    # 2. 简单的人员需求：每天至少2人早班，2人晚班（权重由各会话的"必要人数重み"覆盖）
+    demand = []
+    for t in range(n_day):
+        # 早班需求
+        early_constraint = Linear(f"early[{t}]", weight=50, rhs=2, direction=">=")
+        for i in range(n_staff):
+            early_constraint.addTerms(1, x[i,t,1], 1)
+        m.addConstraint(early_constraint)
+        demand.append(early_constraint)
+        constraint_count += 1
+        
+        # 晚班需求
+        late_constraint = Linear(f"late[{t}]", weight=50, rhs=2, direction=">=")
+        for i in range(n_staff):
+            late_constraint.addTerms(1, x[i,t,2], 1)
+        m.addConstraint(late_constraint)
+        demand.append(late_constraint)
+        constraint_count += 1
+
+    # 3. 连续勤务限制：任意6天内至少休息1天（最多连续5天）、任意5天内至少休息1天（最多连续4天）
+    rest = x[:, :, 0]
+    UB_max5 = m.addWindowConstraints("UB_max5", rest, 1, 6, 1, weight=70, direction=">=")
+    UB_max4 = m.addWindowConstraints("UB_max4", rest, 1, 5, 1, weight=50, direction=">=")
+    constraint_count += len(UB_max5) + len(UB_max4)
+    
+    # 检查约束并预处理（clone 之前完成）
+    m.validate()
+    m.presolve()  # 求解前合并重复项、删除冗余约束
+    
+    # 实例特征（用于按求解历史预测时间限制）
+    features = {
+        'variables': x.size,
+        'constraints': len(m.constraints),
+        'terms': sum(len(c.terms) for c in m.constraints),
+        'demand': len(demand), 'UB_max5': len(UB_max5), 'UB_max4': len(UB_max4),
+    }
+    
+    return {
+        'model': m, 'x': x, 'demand': demand, 'UB_max5': UB_max5, 'UB_max4': UB_max4,
+        'n_staff': n_staff, 'n_day': n_day, 'constraint_count': constraint_count,
+        'features': features,
+        'uses': itertools.count()  # 取用次数（第一次为缓存未命中）
+    }
+
+APP_METRICS = {
+    'scop_app_base_model_total': ('counter', 'Base model requests by cache result (hit/miss).'),
+    'scop_app_jobs': ('gauge', 'Background solve jobs by status (queue depth).'),
+    'scop_app_solves_total': ('counter', 'Finished background solve jobs by result.'),
+    'scop_app_queue_seconds': ('histogram', 'Time from submission to the start of a solve job.'),
+    'scop_app_solve_seconds': ('histogram', 'Time of a solve job (solve_with_scop).'),
+}
+
+def app_metrics():
+    """scop.metrics（求解器未加载时为 None）；首次取用时登记本应用的指标"""
+    if SCOP_MODULE is None:
+        return None
+    registry = SCOP_MODULE.metrics
+    for name, (kind, text) in APP_METRICS.items():
+        registry.describe(name, kind, text)
+    return registry
+
+def base_model(workbook_hash):
+    """取基础模型（进程内缓存），并记录缓存的命中/未命中"""
+    base = build_base_model(workbook_hash, SCOP_VERSION)
+    registry = app_metrics()
+    if registry is not None:
+        registry.inc('scop_app_base_model_total', cache="hit" if next(base['uses']) else "miss")
+    return base
+
+def weight_overrides(base, weights):
+    """滑块的权重 → {约束或约束族: 权重}"""
+    overrides = {constraint: weights['LBC_weight'] for constraint in base['demand']}
+    overrides[base['UB_max5']] = weights['UB_max5_weight']
+    overrides[base['UB_max4']] = weights['UB_max4_weight']
+    return overrides
+
+def apply_weights(m, base, weights):
+    """把权重写入基础模型的 clone（只影响该 clone）"""
+    for constraint, weight in weight_overrides(base, weights).items():
+        m.setWeight(constraint, weight)
+
+def family_violations(m, base):
+    """求解后各约束族的违反量合计（族名 → 违反量）"""
+    return {
+        family: sum(m.getViolation(c) for c in base[key])
+        for family, key in SWEEP_FAMILIES.items()
+    }
+
+# 求解历史：实例特征 + 收敛轨迹，用于预测达到目标惩罚值所需的时间
+HISTORY_DIR = os.environ.get("SCOP_HISTORY_DIR", "scop_history")
+HISTORY_MAX = 500           # 保留的记录数（超过两倍时压缩）
+TARGET_GAP = 0.05           # 目标：hard = 0 且 soft 不超过最终值的 105%
+TIME_LIMIT_MARGIN = 1.5     # 预测时间的安全系数
+DEFAULT_TIME_LIMIT = 30     # 没有历史时的时间限制（秒）
+STALL_TIME = 10             # 早期终止：惩罚值这么多秒没有改善
+STALL_FRACTION = 0.5        # 早期终止：没有改善的时间达到已用时间的一半
+EARLY_STOP = True           # 早期终止的默认值（scop-linux 被 SIGINT 中断时输出当前解，optimize 读取该解）
+STOP_REASONS = {'StallTime': f"{STALL_TIME}秒間改善なし", 'StallFraction': f"経過時間の{STALL_FRACTION:.0%}改善なし"}
+HISTORY_LOCK = threading.Lock()
+HISTORY_ERROR = "⚠️ 求解履歴の保存に失敗"  # 写入 SolveJob.message，显示在任务列表中
+
+def time_to_target(trace):
+    """达到目标（hard 为 0 且 soft 在最终值的 TARGET_GAP 以内）的时间；未达到 hard = 0 时为 None"""
+    final = trace.final()
+    if final is None or final[0] > 0:
+        return None
+    return trace.timeToTarget(final[1] * (1 + TARGET_GAP), hard=0)
+
+def append_history(job, solver_output):
+    """把一次求解的特征、结果和轨迹写入求解历史（轨迹存为 traces/<任务id>.npz）"""
+    trace = solver_output['trace']
+    base = solver_output['base']
+    hard, soft, _ = solver_output['penalty']
+    record = {
+        'job': job.id, 'time': dt.datetime.now().isoformat(), 'features': base['features'],
+        'weights': job.weights, 'time_limit': solver_output['time_limit'],
+        'solve_time': solver_output['solve_time'], 'hard': hard, 'soft': soft,
+        'ttt': time_to_target(trace), 'trace': f"traces/{job.id}.npz",
+    }
+    with HISTORY_LOCK:
+        os.makedirs(os.path.join(HISTORY_DIR, "traces"), exist_ok=True)
+        trace.save(os.path.join(HISTORY_DIR, record['trace']))
+        path = os.path.join(HISTORY_DIR, "history.jsonl")
+        with open(path, "a") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        with open(path) as f:
+            lines = f.readlines()
+        if len(lines) > 2 * HISTORY_MAX:
+            # 只保留最近的记录，删除不再引用的轨迹
+            dropped = [json.loads(line)['trace'] for line in lines[:-HISTORY_MAX]]
+            with open(path + ".tmp", "w") as f:
+                f.writelines(lines[-HISTORY_MAX:])
+            os.replace(path + ".tmp", path)
+            for name in dropped:
+                try:
+                    os.remove(os.path.join(HISTORY_DIR, name))
+                except OSError:
+                    pass
+
+def history_mtime():
+    path = os.path.join(HISTORY_DIR, "history.jsonl")
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_history(mtime):
+    """求解历史的记录（按文件修改时间缓存）"""
+    if mtime is None:
+        return []
+    with open(os.path.join(HISTORY_DIR, "history.jsonl")) as f:
+        return [json.loads(line) for line in f if line.strip()][-HISTORY_MAX:]
+
+def predict_time_limit(features, history, cap):
+    """按求解历史预测达到目标所需的时间，返回 (时间限制(秒), 说明)；结果限制在 1..cap 秒。
+    同规模的记录有 3 条以上时用其 90% 分位数，否则用 log(时间) ~ log(项数) 的回归加残差的 90% 分位数；
+    未达到 hard = 0 的记录表示时间不足，预测值不低于其时间限制的两倍。"""
+    same = [r for r in history if r['features'] == features]
+    reached = [r for r in history if r['ttt'] is not None]
+    if len(same) >= 3 and any(r['ttt'] is not None for r in same):
+        times = [r['ttt'] for r in same if r['ttt'] is not None]
+        predicted = float(np.quantile(times, 0.9))
+        reason = f"同規模 {len(same)} 件の90%分位"
+    elif len({r['features']['terms'] for r in reached}) >= 2 and len(reached) >= 3:
+        terms = np.log([r['features']['terms'] for r in reached])
+        times = np.log([max(r['ttt'], 0.01) for r in reached])
+        slope, intercept = np.polyfit(terms, times, 1)
+        residual = np.quantile(times - (slope * terms + intercept), 0.9)
+        predicted = float(np.exp(slope * np.log(features['terms']) + intercept + residual))
+        reason = f"履歴 {len(reached)} 件の回帰"
+    else:
+        return cap, "履歴不足のため上限を使用"
+    censored = [r['time_limit'] for r in same if r['ttt'] is None]
+    if censored:
+        predicted = max(predicted, 2 * max(censored))
+        reason += f"・未収束 {len(censored)} 件"
+    limit = int(min(cap, max(1, np.ceil(predicted * TIME_LIMIT_MARGIN))))
+    return limit, f"{reason}: 予測 {predicted:.1f}秒 × {TIME_LIMIT_MARGIN}"
+
+def choose_time_limit(base):
+    """会话的设置（自动 / 上限）→ 本次求解的 (时间限制, 说明)"""
+    setting = st.session_state.get('time_limit', {'auto': True, 'cap': DEFAULT_TIME_LIMIT})
+    if not setting['auto']:
+        return setting['cap'], "手動設定"
+    return predict_time_limit(base['features'], load_history(history_mtime()), setting['cap'])
+
+RUNTIME_PHASES = {
+    'build': 'モデル構築', 'validate': '制約検査', 'presolve': '前処理', 'serialize': 'シリアライズ',
+    'write': 'ファイル書込', 'spawn': 'ソルバー起動', 'solver': 'ソルバー実行', 'parse': '出力解析',
+    'assign': '解の設定', 'evaluate': '左辺評価',
+}
+
+def runtime_breakdown(runtime, build_time):
+    """Model.optimize() 记录的各阶段耗时 + 模型构建（clone 与权重设置）的耗时"""
+    breakdown = runtime.asDict()
+    breakdown['phases'] = {'build': build_time, **breakdown['phases']}
+    return breakdown
+
+def runtime_rows(runtime):
+    """耗时明细 → [(项目, 值)]（求解详细面板与 Excel 共用）"""
+    rows = [(RUNTIME_PHASES.get(phase, phase), f"{seconds:.3f}秒") for phase, seconds in runtime['phases'].items()]
+    rows.append(('最適化合計', f"{runtime['total']:.3f}秒"))
+    rows.append(('入力サイズ', f"{runtime['input_bytes']:,} バイト"))
+    rows.append(('出力サイズ', f"{runtime['output_bytes']:,} バイト"))
+    if runtime.get('stopped'):
+        rows.append(('早期終了', STOP_REASONS.get(runtime['stopped'], runtime['stopped'])))
+    size = runtime['size']
+    if size:
+        rows.append(('変数 / 制約 / 項', f"{size['variables']:,} / {size['constraints']:,} / {size['terms']:,}"))
+    return rows
+
+def solve_with_scop(weights, progress_placeholder=None, status_placeholder=None, workbook_hash="default",
+                    base=None, work_dir=None, callback=None, time_limit=DEFAULT_TIME_LIMIT, early_stop=EARLY_STOP):
+    """使用 SCOP 求解器 - 超简化版本
+    progress_placeholder / status_placeholder 只需有 .progress() / .text()（后台任务传入 SolveJob）；
+    base 为 build_base_model 的结果（后台线程中由提交方传入），work_dir 为求解器的工作目录，
+    callback 在求解过程中接收 (hard, soft, 秒, 迭代次数)，time_limit 为求解器的时间限制（秒），
+    early_stop 为 True 时惩罚值停滞即终止求解器（取回已输出的最好解）。"""
     global Model, Linear
     
     if not SCOP_AVAILABLE or Model is None or Linear is None:
         raise Exception("SCOP 库不可用")
     
     try:
-        # 大幅简化问题规模
-        n_staff = 8   # 减少到8个员工
-        n_day = 7     # 减少到7天
-        
         if progress_placeholder:
             progress_placeholder.progress(10)
         if status_placeholder:
             status_placeholder.text('📊 超簡化SCOP モデル構築中...')
         
-        # 创建模型
-        m = Model("simple_shift")
-        
-        # 设置非常宽松的参数
-        try:
-            if hasattr(m, 'setTimeLimit'):
-                m.setTimeLimit(15)  # 15秒时间限制
-            if hasattr(m, 'setParam'):
-                m.setParam('MIPGap', 0.2)       # 20% 最优性间隙
-                m.setParam('TimeLimit', 15)     # 15秒
-                m.setParam('Presolve', 1)       # 简单预处理
-                m.setParam('Heuristics', 1)     # 启用启发式
-        except:
-            pass
-        
-        if progress_placeholder:
-            progress_placeholder.progress(30)
-        if status_placeholder:
-            status_placeholder.text('🔧 簡化変数定義中...')
-        
-        # 极简决策变量：只考虑休息、早班、晚班
-        x = {}
-        simple_jobs = [0, 1, 2]  # 0=休息, 1=早班, 2=晚班
+        # 共享的基础模型 + 本会话的写时复制副本
+        build_start = time.perf_counter()
+        if base is None:
+            base = base_model(workbook_hash)
+        m = base['model'].clone()
+        m.Params.WorkDir = work_dir  # 并行的求解各自使用独立的目录
+        x = base['x']
+        n_staff, n_day = base['n_staff'], base['n_day']
+        constraint_count = base['constraint_count']
         
-        for i in range(n_staff):
-            for t in range(n_day):
-                for j in simple_jobs:
-                    x[i,t,j] = m.addVariable(name=f"x[{i},{t},{j}]", domain=[0,1])
+        # 时间限制（按求解历史预测或用户指定）与停滞时的早期终止
+        m.Params.TimeLimit = int(time_limit)
+        if early_stop:
+            m.Params.StallTime = STALL_TIME
+            m.Params.StallFraction = STALL_FRACTION
         
         if progress_placeholder:
             progress_placeholder.progress(60)
         if status_placeholder:
-            status_placeholder.text('📋 基本制約のみ追加中...')
-        
-        # 只添加最基本的约束
-        constraint_count = 0
-        
-        # 1. 每个员工每天只能有一个状态
-        for i in range(n_staff):
-            for t in range(n_day):
-                constraint = Linear(f"assign[{i},{t}]", weight='inf', rhs=1, direction='=')
-                for j in simple_jobs:
-                    constraint.addTerms(1, x[i,t,j], 1)
-                m.addConstraint(constraint)
-                constraint_count += 1
-        
-        # 2. 简单的人员需求：每天至少2人早班，2人晚班
-        for t in range(n_day):
-            # 早班需求
-            early_constraint = Linear(f"early[{t}]", weight=50, rhs=2, direction=">=")
-            for i in range(n_staff):
-                early_constraint.addTerms(1, x[i,t,1], 1)
-            m.addConstraint(early_constraint)
-            constraint_count += 1
-            
-            # 晚班需求
-            late_constraint = Linear(f"late[{t}]", weight=50, rhs=2, direction=">=")
-            for i in range(n_staff):
-                late_constraint.addTerms(1, x[i,t,2], 1)
-            m.addConstraint(late_constraint)
-            constraint_count += 1
+            status_placeholder.text('📋 重みを設定中...')
         
+        # 只覆盖本会话的权重
+        apply_weights(m, base, weights)
+        build_time = time.perf_counter() - build_start
+
         if progress_placeholder:
             progress_placeholder.progress(85)
         if status_placeholder:
@@ -267,7 +553,7 @@ def solve_with_scop(weights, progress_placeholder=None, status_placeholder=None)
         
         # 求解
         start_time = time.time()
-        sol, violated = m.optimize()
+        sol, violated = m.optimize(callback=callback)
         solve_time = time.time() - start_time
         
         if progress_placeholder:
@@ -287,7 +573,8 @@ def solve_with_scop(weights, progress_placeholder=None, status_placeholder=None)
         # 5 = 无界
         
         if model_status == 0:
-            status_msg = "最適解"
+            # 早期终止的解与时间限制的解一样是可行的中途解
+            status_msg = "早期終了解（改善停滞）" if m.Runtime is not None and m.Runtime.stopped else "最適解"
         elif model_status == 2:
             status_msg = "時間制限解（可行）"
         elif model_status == 1:
@@ -303,24 +590,13 @@ def solve_with_scop(weights, progress_placeholder=None, status_placeholder=None)
             # 处理解并扩展到15人30天
             job_names = {0: "休み", 1: "早番A", 2: "遅番A"}
             
-            # 先构建8人7天的解
-            basic_data = []
-            for i in range(n_staff):
-                row = []
-                for t in range(n_day):
-                    assigned_job = 0
-                    for j in simple_jobs:
-                        var_name = f"x[{i},{t},{j}]"
-                        if var_name in sol and sol[var_name] > 0.5:
-                            assigned_job = j
-                            break
-                    row.append(assigned_job)
-                basic_data.append(row)
+            # 先构建8人7天的解（直接从变量数组的编码读取）
+            assigned = m.getCodes(x) == x.domain.index("1")
+            basic_data = np.where(assigned.any(axis=2), assigned.argmax(axis=2), 0)
             
             # 扩展到15人30天
-            extended_data = []
+            extended_data = np.zeros((15, 30), dtype=np.int8)
             for i in range(15):
-                row = []
                 for t in range(30):
                     # 使用模式重复
                     base_i = i % n_staff
@@ -343,17 +619,8 @@ def solve_with_scop(weights, progress_placeholder=None, status_placeholder=None)
                             else:
                                 job = random.choice([7, 8, 9, 10])  # 晚班
                     
-                    final_job_names = {0: "休み", 3: "早番A", 4: "早番B", 5: "早番C", 6: "早番D",
-                                     7: "遅番A", 8: "遅番B", 9: "遅番C", 10: "遅番D"}
-                    row.append(f"{job}({final_job_names.get(job, 'Unknown')})")
-                
-                extended_data.append(row)
+                    extended_data[i, t] = job
             
-            result_df = pd.DataFrame(
-                extended_data,
-                columns=[f"{t+1}日" for t in range(30)],
-                index=[f"Staff_{i+1}" for i in range(15)]
-            )
             
             solver_output = {
                 'model_status': model_status,
@@ -363,11 +630,17 @@ def solve_with_scop(weights, progress_placeholder=None, status_placeholder=None)
                 'solve_time': solve_time,
                 'constraint_count': constraint_count,
                 'algorithm': 'SCOP Mixed Integer Programming (Ultra-Simplified)',
-                'problem_scale': f'{n_staff}人 × {n_day}日 → 15人30日拡張'
+                'problem_scale': f'{n_staff}人 × {n_day}日 → 15人30日拡張',
+                'weights': dict(weights),
+                'penalty': m.rescore(),   # (hard, soft, 约束族明细)
+                'runtime': runtime_breakdown(m.Runtime, build_time),
+                'trace': m.Trace,         # 求解过程中记录的惩罚值轨迹
+                'time_limit': m.Params.TimeLimit,
+                'model': m, 'base': base  # 调整权重时用于再评价（不重新求解）
             }
             
             message = f"SCOP 求解成功 - {status_msg} ({solve_time:.1f}秒)"
-            return result_df, message, solve_time, solver_output
+            return extended_data, message, solve_time, solver_output
         else:
             return None, f"SCOP 无解 (Status: {model_status})", solve_time, None
     
@@ -377,13 +650,10 @@ def solve_with_scop(weights, progress_placeholder=None, status_placeholder=None)
 def generate_sample_schedule():
     """生成示例排班表"""
     n_staff, n_days = 15, 30
-    job_names = {0: "休み", 3: "早番A", 4: "早番B", 5: "早番C", 6: "早番D",
-                7: "遅番A", 8: "遅番B", 9: "遅番C", 10: "遅番D"}
     
-    schedule_data = []
+    schedule_data = np.zeros((n_staff, n_days), dtype=np.int8)
     
     for i in range(n_staff):
-        row = []
         consecutive_work = 0
         
         for t in range(n_days):
@@ -407,58 +677,922 @@ def generate_sample_schedule():
                     job = random.choice([3, 4, 5, 6, 7, 8, 9, 10])
                 consecutive_work += 1
             
-            row.append(f"{job}({job_names.get(job, 'Unknown')})")
+            schedule_data[i, t] = job
+    
+    return schedule_data
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def schedule_table_html(solution_id, page, page_size, _schedule):
+    """把一页排班表一次性渲染为一个 HTML 表格（按解的标识和页码缓存）"""
+    start = page * page_size
+    codes = _schedule[start:start + page_size]
+    
+    # 每个班次编码对应一个单元格字符串，颜色由 CSS 类决定
+    cells = [f'<td class="job{j}">{JOB_NAMES.get(j, "Unknown")}</td>' for j in range(len(JOB_LABELS))]
+    header = "".join(f"<th>{t+1}日</th>" for t in range(_schedule.shape[1]))
+    rows = "".join(
+        f"<tr><th>Staff_{i+1}</th>{''.join(cells[j] for j in row)}</tr>"
+        for i, row in enumerate(codes.tolist(), start)
+    )
+    return (f'<div class="schedule-scroll"><table class="schedule-table">'
+            f'<thead><tr><th>👥 スタッフ</th>{header}</tr></thead><tbody>{rows}</tbody></table></div>')
+
+def create_schedule_display(schedule, solution_id):
+    """创建排班显示（整张表一次渲染，员工较多时分页）"""
+    n_staff, n_days = schedule.shape
+    st.markdown("### 📅 SCOP 排班結果")
+    
+    page = 0
+    n_pages = -(-n_staff // SCHEDULE_PAGE_SIZE)
+    if n_pages > 1:
+        page = st.selectbox(
+            "👥 表示スタッフ", range(n_pages),
+            format_func=lambda p: f"Staff_{p * SCHEDULE_PAGE_SIZE + 1} 〜 Staff_{min((p + 1) * SCHEDULE_PAGE_SIZE, n_staff)}"
+        )
+    st.caption(f"{n_staff}人 × {n_days}日")
+    st.markdown(schedule_table_html(solution_id, page, SCHEDULE_PAGE_SIZE, schedule), unsafe_allow_html=True)
+
+# 后台求解：求解在线程池中执行（实际计算在 scop 子进程中），页面只轮询任务状态
+JOB_POLL_SECONDS = 1   # 任务状态的刷新间隔
+MAX_JOBS = 50          # 任务表中保留的任务数
+
+class SolveJob:
+    """一次后台求解任务；登记在进程内的任务表中，页面重载或重新连接后也能取回结果。
+    提供与 st.progress / st.empty 相同的 .progress() / .text()，可直接传给 solve_with_scop。"""
+    def __init__(self, job_id, weights, workbook_hash, time_limit=DEFAULT_TIME_LIMIT, early_stop=EARLY_STOP):
+        self.id = job_id
+        self.weights = dict(weights)
+        self.workbook_hash = workbook_hash
+        self.time_limit = time_limit  # 本次求解的时间限制（秒）
+        self.early_stop = early_stop  # 惩罚值停滞时提前终止
+        self.status = "queued"   # queued / running / done / failed
+        self.percent = 0
+        self.message = "⏳ 待機中"
+        self.penalty = None      # 最新的 (hard, soft, 経過秒)
+        self.result = None       # solve_with_scop 的返回值
+        self.submitted = time.time()
+        self.future = None
+    
+    def progress(self, value):
+        self.percent = value
+    
+    def text(self, message):
+        self.message = message
+    
+    def on_penalty(self, hard, soft, elapsed, iteration):
+        self.penalty = (hard, soft, elapsed)
+    
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+@st.cache_resource(show_spinner=False)
+def job_executor():
+    """进程内共享的求解线程池"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="scop-solve")
+
+@st.cache_resource(show_spinner=False)
+def job_registry():
+    """进程内共享的任务表：任务 id → SolveJob"""
+    return {}
+
+def run_job(job, base):
+    """在线程池中执行一次求解；求解器的文件写在任务专用的临时目录中"""
+    metrics = app_metrics()
+    job.status = "running"
+    started = time.time()
+    if metrics is not None:
+        metrics.inc('scop_app_jobs', -1, status="queued")
+        metrics.inc('scop_app_jobs', status="running")
+        metrics.observe('scop_app_queue_seconds', started - job.submitted)
+    work_dir = tempfile.mkdtemp(prefix=f"scop_{job.id[:8]}_")
+    try:
+        job.result = solve_with_scop(job.weights, job, job, job.workbook_hash,
+                                     base=base, work_dir=work_dir, callback=job.on_penalty,
+                                     time_limit=job.time_limit, early_stop=job.early_stop)
+    except Exception as e:
+        job.result = (None, f"SCOP 求解エラー: {str(e)}", 0, None)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        job.status = "done" if job.result and job.result[0] is not None else "failed"
+        if job.status == "done":
+            try:
+                append_history(job, job.result[3])
+            except OSError as e:
+                job.message = f"{HISTORY_ERROR}: {e}"  # 工作线程中不 print，由任务列表显示
+        if metrics is not None:
+            record_job(metrics, job, started)
+
+def record_job(metrics, job, started):
+    """记录结束的任务的指标，并把任务的记录送往 scop.metrics 的输出（sink）"""
+    elapsed = time.time() - started
+    metrics.inc('scop_app_jobs', -1, status="running")
+    metrics.inc('scop_app_solves_total', result=job.status)
+    metrics.observe('scop_app_solve_seconds', elapsed)
+    schedule, message, solve_time, solver_output = job.result
+    penalty = solver_output['penalty'] if solver_output else None
+    metrics.emit({
+        'event': 'solve_job', 'time': dt.datetime.now().isoformat(), 'job': job.id,
+        'workbook_hash': job.workbook_hash, 'weights': job.weights, 'status': job.status, 'message': message,
+        'queue_seconds': started - job.submitted, 'seconds': elapsed, 'solve_time': solve_time,
+        'hard': penalty[0] if penalty else None, 'soft': penalty[1] if penalty else None,
+        'runtime': solver_output.get('runtime') if solver_output else None,
+    })
+
+def submit_solve(weights, workbook_hash):
+    """提交后台求解任务，返回 SolveJob"""
+    # 基础模型在脚本线程中构建（或取缓存），后台线程只做 clone 和求解
+    base = base_model(workbook_hash)
+    registry = job_registry()
+    
+    # 只保留最近的已结束任务
+    finished = sorted((j for j in registry.values() if not j.active), key=lambda j: j.submitted)
+    for old in finished[:max(0, len(registry) - MAX_JOBS + 1)]:
+        registry.pop(old.id, None)
+    
+    time_limit, _ = choose_time_limit(base)
+    early_stop = st.session_state.get('time_limit', {}).get('early_stop', EARLY_STOP)
+    job = SolveJob(new_solution_id(), weights, workbook_hash, time_limit, early_stop)
+    registry[job.id] = job
+    metrics = app_metrics()
+    if metrics is not None:
+        metrics.inc('scop_app_jobs', status="queued")
+    job.future = job_executor().submit(run_job, job, base)
+    return job
+
+def session_jobs():
+    """本会话提交的任务（按提交顺序）"""
+    registry = job_registry()
+    return [registry[j] for j in st.session_state.jobs if j in registry]
+
+def job_status_section(polling=False):
+    """求解任务的状态与进度；新完成的任务结果写入会话后重跑整个页面。
+    polling=True（自动刷新的片段）时，没有未结束的任务就重跑页面以停止刷新"""
+    jobs = session_jobs()
+    
+    applied = False
+    for job in jobs:
+        if job.status == "done" and job.id not in st.session_state.applied_jobs:
+            schedule, message, solve_time, solver_output = job.result
+            set_schedule(schedule, f"✅ SCOP 最適化完了 ({solve_time:.1f}秒)", solver_output, job.id)
+            st.session_state.solve_message = message
+            st.session_state.applied_jobs.add(job.id)
+            applied = True
+    if applied or (polling and not any(job.active for job in jobs)):
+        st.rerun()  # 排班表、统计和下载都依赖新解；失败的任务不写入会话，也要在此停止自动刷新
+    if not jobs:
+        return
+    
+    st.markdown("#### 🧵 求解ジョブ")
+    for n, job in reversed(list(enumerate(jobs, 1))):
+        weights = " / ".join(f"{v}" for v in job.weights.values()) + f" / {job.time_limit}秒"
+        penalty = f" — penalty {job.penalty[0]}/{job.penalty[1]} ({job.penalty[2]:.1f}秒)" if job.penalty else ""
+        if job.active:
+            st.progress(job.percent, text=f"#{n} [{weights}] {job.message}{penalty}")
+        elif job.status == "done":
+            st.caption(f"✅ #{n} [{weights}] {job.result[1]}{penalty}")
+            if job.message.startswith(HISTORY_ERROR):
+                st.caption(job.message)
+        else:
+            st.caption(f"❌ #{n} [{weights}] {job.result[1]}")
+
+# 有未结束的任务时按间隔自动刷新
+job_status_polling = fragment(job_status_section, run_every=JOB_POLL_SECONDS)
+
+# 权重扫描：多组权重并行求解同一个基础模型的 clone，比较各约束族的违反量
+SWEEP_WEIGHTS = ['LBC_weight', 'UB_max5_weight', 'UB_max4_weight']  # 作用于模型的权重
+SWEEP_FAMILIES = {'必要人数': 'demand', '連続勤務5日': 'UB_max5', '連続勤務4日': 'UB_max4'}
+SWEEP_MAX_LEVELS = 6        # grid 的水准数上限（3 个权重：6³ = 216 通り）
+SWEEP_MAX_SAMPLES = 216     # 一次扫描的求解次数上限
+SWEEP_WORKERS = os.cpu_count() or 2  # 并行求解数（每个核心一个求解器进程）
+
+def sweep_samples(method, n, low=1, high=100, seed=0):
+    """扫描的权重组合：grid 为每个权重取 n 个等间隔值的全组合，lhs 为 n 个拉丁超方格样本"""
+    k = len(SWEEP_WEIGHTS)
+    if method == "grid":
+        levels = np.unique(np.linspace(low, high, n).round().astype(int))
+        points = np.array(np.meshgrid(*[levels] * k, indexing="ij")).reshape(k, -1).T
+    else:
+        # 每个权重的区间分成 n 层，每层取一个点，各权重的层顺序独立打乱
+        rng = np.random.default_rng(seed)
+        strata = rng.permuted(np.tile(np.arange(n), (k, 1)), axis=1).T
+        points = (low + (strata + rng.random((n, k))) / n * (high - low)).round().astype(int)
+    return [dict(zip(SWEEP_WEIGHTS, map(int, p))) for p in points]
+
+def sweep_point(base, weights, time_limit):
+    """用一组权重求解基础模型的 clone，返回权重、各约束族的违反量和求解状态"""
+    m = base['model'].clone()
+    m.Params.TimeLimit = time_limit
+    m.Params.WorkDir = tempfile.mkdtemp(prefix="scop_sweep_")
+    apply_weights(m, base, weights)
+    
+    row = dict(weights)
+    start_time = time.time()
+    try:
+        sol, violated = m.optimize()
+    except (OSError, ValueError, NameError) as e:
+        # 求解器缺失或无法启动（OSError）、模型错误（ValueError/NameError）：错误写入结果行
+        sol = None
+        row['エラー'] = f"{type(e).__name__}: {e}"
+    finally:
+        shutil.rmtree(m.Params.WorkDir, ignore_errors=True)
+    row['求解時間'] = time.time() - start_time
+    row['Status'] = getattr(m, 'Status', -1)
+    if sol is not None:
+        row.update(family_violations(m, base))
+    elif 'エラー' not in row:
+        # optimize() 不抛异常而以状态码报告失败（7 = 求解器无法启动）
+        row['エラー'] = ("ソルバーを起動できません" if row['Status'] == 7 else "ソルバー異常終了") + f" (Status: {row['Status']})"
+    return row
+
+def pareto_mask(values):
+    """非支配解的掩码（各列都是越小越好）"""
+    v = np.asarray(values, dtype=float)
+    if len(v) == 0:
+        return np.zeros(0, dtype=bool)
+    # dominates[i, j]: i 在所有列上不差于 j，且至少一列更好
+    dominates = (v[:, None, :] <= v[None, :, :]).all(axis=2) & (v[:, None, :] < v[None, :, :]).any(axis=2)
+    return ~dominates.any(axis=0)
+
+@st.cache_resource(show_spinner=False)
+def sweep_executor():
+    """权重扫描用的线程池（每个核心一个求解器进程）"""
+    return ThreadPoolExecutor(max_workers=SWEEP_WORKERS, thread_name_prefix="scop-sweep")
+
+def submit_sweep(samples, time_limit, workbook_hash):
+    """提交扫描：基础模型只构建一次，各组权重只替换 clone 的权重。
+    不一次性排入线程池：先提交与线程数相同的求解，每完成一个再提交下一个"""
+    base = base_model(workbook_hash)
+    executor = sweep_executor()
+    sweep = {'futures': [], 'samples': samples, 'submitted': time.time(), 'lock': threading.Lock()}
+    
+    def submit_next(_=None):
+        with sweep['lock']:
+            k = len(sweep['futures'])
+            if k >= len(samples):
+                return
+            future = executor.submit(sweep_point, base, samples[k], time_limit)
+            sweep['futures'].append(future)
+        future.add_done_callback(submit_next)  # 在工作线程中提交下一组权重
+    
+    for _ in range(min(len(samples), SWEEP_WORKERS)):
+        submit_next()
+    return sweep
+
+def sweep_done(sweep):
+    """扫描的全部权重都已求解完"""
+    futures = sweep['futures']
+    return len(futures) == len(sweep['samples']) and all(f.done() for f in futures)
+
+def sweep_results(sweep):
+    """已完成的扫描结果；全部完成后加上 "パレート" 列（违反量的非支配解）。
+    sweep_point 本身抛出的异常（clone、apply_weights 等的缺陷）也作为失败行显示，不让页面崩溃"""
+    rows = []
+    for weights, f in zip(sweep['samples'], sweep['futures']):
+        if not f.done():
+            continue
+        error = f.exception()
+        if error is None:
+            rows.append(f.result())
+        else:
+            rows.append({**weights, 'Status': -1, 'エラー': f"{type(error).__name__}: {error}"})
+    df = pd.DataFrame(rows)
+    if len(rows) == len(sweep['samples']):
+        families = list(SWEEP_FAMILIES)
+        df['パレート'] = False
+        if set(families) <= set(df.columns):
+            solved = df[families].notna().all(axis=1)
+            df.loc[solved, 'パレート'] = pareto_mask(df.loc[solved, families].to_numpy())
+    return df
+
+@fragment
+def sweep_section():
+    """权重扫描的设定与提交"""
+    with st.expander("🔀 重みスイープ（パレート分析）"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            method = st.radio("サンプリング", ["grid", "lhs"], horizontal=True,
+                              format_func=lambda s: {"grid": "グリッド", "lhs": "ラテン超方格"}[s])
+        with col2:
+            if method == "grid":
+                n = st.number_input("水準数", 2, SWEEP_MAX_LEVELS, 3)
+            else:
+                n = st.number_input("サンプル数", 2, SWEEP_MAX_SAMPLES, 12)
+        with col3:
+            time_limit = st.number_input("1回の制限時間（秒）", 1, 600, 10)
+        
+        samples = sweep_samples(method, int(n))
+        st.caption(f"{len(samples)}通りの重み（必要人数・連続勤務5日・連続勤務4日）を {SWEEP_WORKERS} 並列で求解します")
         
-        schedule_data.append(row)
+        too_many = len(samples) > SWEEP_MAX_SAMPLES
+        if too_many:
+            st.warning(f"⚠️ 一度に求解できるのは {SWEEP_MAX_SAMPLES} 通りまでです")
+        running = st.session_state.sweep is not None and not sweep_done(st.session_state.sweep)
+        if st.button("🔀 スイープ実行", disabled=running or too_many, use_container_width=True):
+            st.session_state.sweep = submit_sweep(samples, int(time_limit), st.session_state.get('workbook_hash', 'default'))
+            st.rerun()  # 显示扫描进度（自动刷新）
+
+def sweep_status_section():
+    """权重扫描的进度与结果（全部完成后显示非支配解）"""
+    sweep = st.session_state.sweep
+    if sweep is None:
+        return
+    done = sum(f.done() for f in sweep['futures'])
+    total = len(sweep['samples'])
+    st.markdown("#### 🔀 重みスイープ結果")
+    if done < total:
+        st.progress(done / total, text=f"求解中... {done}/{total} ({time.time() - sweep['submitted']:.0f}秒)")
+        return
     
-    return pd.DataFrame(
-        schedule_data,
-        columns=[f"{t+1}日" for t in range(n_days)],
-        index=[f"Staff_{i+1}" for i in range(n_staff)]
+    if not sweep.get('finished'):
+        sweep['finished'] = True
+        st.rerun()  # 停止自动刷新
+    
+    df = sweep_results(sweep)
+    failed = int((df['Status'] != 0).sum())
+    if failed:
+        st.warning(f"⚠️ {failed}/{total} 通りの求解に失敗しました")
+        if 'エラー' in df.columns:
+            for error, count in df['エラー'].dropna().value_counts().items():
+                st.caption(f"❌ {error}（{count}通り）")
+    if df['パレート'].any():
+        st.markdown("**非支配解（各制約族の違反量でパレート最適な重み）**")
+        st.dataframe(df[df['パレート']].drop(columns=['パレート']), use_container_width=True)
+    with st.expander("全ての結果"):
+        st.dataframe(df, use_container_width=True)
+
+# 扫描进行中按间隔自动刷新
+sweep_status_polling = fragment(sweep_status_section, run_every=JOB_POLL_SECONDS)
+
+def new_solution_id():
+    """每次得到新排班表时生成的标识，作为各缓存函数的键"""
+    return uuid.uuid4().hex
+
+def set_schedule(schedule, solve_status, solver_output=None, solution_id=None):
+    """保存新的排班表（员工×日期 的 int8 班次编码矩阵）并更新解的标识"""
+    st.session_state.schedule = schedule
+    st.session_state.solve_status = solve_status
+    st.session_state.solver_output = solver_output
+    st.session_state.solution_id = solution_id or new_solution_id()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def schedule_statistics(solution_id, _schedule):
+    """排班统计（按解的标识缓存，_schedule 不参与哈希）。
+    全部由编码矩阵的 bincount / 按轴归约得到，不逐格解析字符串。"""
+    n_staff, n_days = _schedule.shape
+    category = JOB_CATEGORY[_schedule]  # 员工×日期 的班次类别
+    
+    # 各班次编码、各类别的总数
+    job_counts = np.bincount(_schedule.ravel(), minlength=len(JOB_LABELS))
+    category_counts = np.bincount(category.ravel(), minlength=len(JOB_CATEGORIES))
+    
+    # 每天各类别的人数（列 = 类别）
+    n_cat = len(JOB_CATEGORIES)
+    day_counts = np.bincount((category + np.arange(n_days) * n_cat).ravel(), minlength=n_days * n_cat).reshape(n_days, n_cat)
+    coverage = pd.DataFrame(
+        {JOB_CATEGORIES[c]: day_counts[:, c] for c in SHIFT_REQUIREMENT},
+        index=[f"{t+1}日" for t in range(n_days)]
     )
+    shortage = sum(np.maximum(need - day_counts[:, c], 0) for c, need in SHIFT_REQUIREMENT.items())
+    
+    # 每人的勤务日数（休み以外）
+    work_days = n_days - (_schedule == 0).sum(axis=1)
+    
+    return {
+        'total_shifts': int(category_counts[1] + category_counts[2]),
+        'early_shifts': int(category_counts[1]),
+        'late_shifts': int(category_counts[2]),
+        'rest_days': int(category_counts[0]),
+        'job_counts': {JOB_LABELS[j]: int(job_counts[j]) for j in np.flatnonzero(job_counts)},
+        'work_days': work_days,
+        'work_days_std': float(work_days.std()) if n_staff else 0.0,
+        'coverage': coverage,
+        'shortage_days': int(np.count_nonzero(shortage)),
+        'shortage_total': int(shortage.sum())
+    }
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def schedule_csv(solution_id, _schedule):
+    """排班表 CSV（按解的标识缓存）"""
+    return schedule_frame(_schedule).to_csv(encoding='utf-8-sig')
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def schedule_report(solution_id, _schedule, _solver_output):
+    """SCOP 详细报告 / 示例报告文本（按解的标识缓存）"""
+    if not _solver_output:
+        return f"""サンプル排班レポート
+生成日時: {dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+モード: サンプル表示
+人数: 15人
+期間: 30日間
+生成方法: 智能ヒューリスティック
 
-def create_schedule_display(schedule_df):
-    """创建排班显示"""
-    st.markdown("### 📅 SCOP 排班結果 (最初の7日間)")
+注記: SCOP最適化ライブラリが利用できないため、
+サンプルアルゴリズムによる排班表を表示しています。
+"""
+    
+    # 生成详细的SCOP报告
+    output_text = f"""SCOP AI 排班最適化システム レポート
+{'='*60}
+生成日時: {dt.datetime.now().strftime('%Y年%m月%d日 %H時%M分%S秒')}
+
+【最適化概要】
+アルゴリズム: {_solver_output.get('algorithm', 'N/A')}
+問題規模: {_solver_output.get('problem_scale', 'N/A')}
+求解時間: {_solver_output.get('solve_time', 0):.3f} 秒
+制約数: {_solver_output.get('constraint_count', 'N/A')}
+解品質: {_solver_output.get('status_message', 'N/A')}
+
+【制約満足状況】"""
+    
+    if _solver_output.get('violated_constraints'):
+        output_text += f"\n制約違反数: {len(_solver_output['violated_constraints'])}\n"
+        for constraint in _solver_output['violated_constraints']:
+            output_text += f"- {constraint}\n"
+    else:
+        output_text += "\n全制約満足: ✅\n"
     
-    job_colors = {
-        '休み': '#95a5a6', '早番A': '#3498db', '早番B': '#2980b9', 
-        '早番C': '#1abc9c', '早番D': '#16a085', '遅番A': '#e74c3c',
-        '遅番B': '#c0392b', '遅番C': '#f39c12', '遅番D': '#d35400'
+    # 添加统计信息
+    n_staff, n_days = _schedule.shape
+    output_text += f"""
+【排班統計】
+総割当数: {_schedule.size}
+スタッフ数: {n_staff}
+期間: {n_days}日間
+
+【システム情報】
+最適化エンジン: SCOP Mathematical Optimization Library
+実行環境: Streamlit Cloud
+レポート生成: 自動生成システム
+
+{'='*60}
+レポート終了
+"""
+    return output_text
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def schedule_excel(solution_id, _schedule, _solver_output):
+    """Excel 格式的排班表（按解的标识缓存）；缺少 openpyxl 时返回 None。
+    使用 openpyxl 的 write_only 模式逐行写出，大规模排班表也不会在内存中保留整个工作簿。"""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        return None
+    from io import BytesIO
+    
+    wb = Workbook(write_only=True)
+    
+    # 写入排班表（一行一名员工）
+    ws = wb.create_sheet('排班表')
+    ws.append([None] + [f"{t+1}日" for t in range(_schedule.shape[1])])
+    for i, row in enumerate(_schedule.tolist()):
+        ws.append([f"Staff_{i+1}"] + [JOB_LABELS[j] for j in row])
+    
+    # 如果有求解器输出，添加统计信息
+    if _solver_output:
+        ws = wb.create_sheet('最適化詳細')
+        ws.append(['項目', '値'])
+        ws.append(['求解時間', f"{_solver_output.get('solve_time', 0):.3f}秒"])
+        ws.append(['制約数', _solver_output.get('constraint_count', 'N/A')])
+        ws.append(['解品質', _solver_output.get('status_message', 'N/A')])
+        ws.append(['制約違反数', len(_solver_output.get('violated_constraints', []))])
+        ws.append(['アルゴリズム', _solver_output.get('algorithm', 'N/A')])
+        if _solver_output.get('runtime'):
+            ws.append([])
+            ws.append(['処理時間内訳', None])
+            for row in runtime_rows(_solver_output['runtime']):
+                ws.append(list(row))
+    
+    excel_buffer = BytesIO()
+    wb.save(excel_buffer)
+    return excel_buffer.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def trace_npz(solution_id, _trace):
+    """求解轨迹的 .npz（按解的标识缓存）；可用 scop.Trace.load 读回"""
+    from io import BytesIO
+    buffer = BytesIO()
+    _trace.save(buffer)
+    return buffer.getvalue()
+
+def rescore_panel(solver_output, weights):
+    """用当前滑块的权重重新计算最近一次解的惩罚值（利用求解时已计算的左边值）"""
+    m, base = solver_output['model'], solver_output['base']
+    start = time.perf_counter()
+    hard, soft, breakdown = m.rescore(weight_overrides(base, weights))
+    elapsed = time.perf_counter() - start
+    solved_hard, solved_soft, _ = solver_output['penalty']
+    
+    st.markdown("### 🔁 現在の解の再評価")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("ハード違反", hard, delta=hard - solved_hard, delta_color="inverse")
+    with col2:
+        st.metric("ソフト", soft, delta=soft - solved_soft, delta_color="inverse",
+                  help="求解時の重みとの差")
+    rows = "\n".join(f"| {family} | {violation} | {penalty} |" for family, (violation, penalty) in breakdown.items())
+    st.markdown("| 制約 | 違反 | ペナルティ |\n|---|---:|---:|\n" + rows)
+    st.caption(f"再求解なしで評価（{elapsed * 1000:.1f} ms）。重みを反映した解は「SCOP 最適化実行」で求解します。")
+
+def time_limit_setting():
+    """时间限制：按求解历史自动设定（不超过上限）或手动指定；以及停滞时的早期终止"""
+    auto = st.checkbox("⏱️ 制限時間を履歴から自動設定", value=True, key="time_limit_auto",
+                       help="過去の求解の収束履歴から、目標ペナルティに達するまでの時間を予測します")
+    cap = st.number_input("制限時間の上限（秒）" if auto else "制限時間（秒）", 1, 600, DEFAULT_TIME_LIMIT,
+                          key="time_limit_cap")
+    early_stop = st.checkbox("🛑 改善が止まったら早期終了", value=EARLY_STOP, key="early_stop",
+                             help=f"{STALL_TIME}秒間、または経過時間の{STALL_FRACTION:.0%}の間ペナルティが改善しなければ"
+                                  "求解を打ち切り、それまでの最良解を使います")
+    st.session_state.time_limit = {'auto': auto, 'cap': int(cap), 'early_stop': early_stop}
+    base = (st.session_state.get('solver_output') or {}).get('base')
+    if auto and base is not None:
+        limit, reason = choose_time_limit(base)
+        st.caption(f"次回の制限時間: {limit}秒（{reason}）")
+
+@fragment
+def parameter_section():
+    """参数设置：滑块变化只重跑本片段，权重保存在会话状态中"""
+    st.markdown("### ⚙️ SCOP パラメータ")
+    
+    obj_weight = st.slider("🏖️ 休み希望重み", 1, 100, 90, key="obj_weight", help="スタッフの休み希望の重要度")
+    LBC_weight = st.slider("👥 必要人数重み", 1, 100, 85, key="LBC_weight", help="各シフトの必要人数確保の重要度")
+    UB_max5_weight = st.slider("⏰ 連続勤務重み", 1, 100, 70, key="UB_max5_weight", help="連続勤務制限の重要度")
+    UB_max4_weight = st.slider("📅 4日制限重み", 1, 100, 50, key="UB_max4_weight", help="4日連続制限の重要度")
+    
+    st.session_state.weights = {
+        'obj_weight': obj_weight,
+        'LBC_weight': LBC_weight,
+        'UB_max5_weight': UB_max5_weight,
+        'UB_max4_weight': UB_max4_weight
     }
     
-    # 表头
-    cols = st.columns([2] + [1]*7)
-    with cols[0]:
-        st.markdown("**👥 スタッフ**")
-    for day_idx in range(7):
-        with cols[day_idx + 1]:
-            st.markdown(f"**{day_idx + 1}日**")
-    
-    # 员工排班
-    for i, (staff_name, row) in enumerate(schedule_df.iterrows()):
-        if i >= 15:
-            break
-            
-        cols = st.columns([2] + [1]*7)
+    # 当前解在新权重下的再评价（不重新求解）
+    solver_output = st.session_state.get('solver_output')
+    if solver_output and solver_output.get('model') is not None:
+        rescore_panel(solver_output, st.session_state.weights)
+    
+    st.markdown("---")
+    if SCOP_AVAILABLE:
+        time_limit_setting()
+        st.markdown("**🎯 精度**: 数学的最適化")
+        st.markdown("**📊 問題規模**: 15人 × 14日 → 30日拡張")
+    else:
+        st.markdown("**⏱️ 処理時間**: 即座")
+        st.markdown("**🎯 精度**: 智能ヒューリスティック")
+
+@fragment
+def solve_section():
+    """数据读入与求解：SCOP 求解提交到后台执行，求解中也可以继续提交其他权重的求解"""
+    col1, col2 = st.columns([1, 1])
+    
+    with col1:
+        uploaded_file = st.file_uploader("📁 データファイル", type=['xlsx'])
+        workbook_hash = "default"
+        if uploaded_file:
+            workbook_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+            st.success("✅ ファイル読込済")
+        st.session_state.workbook_hash = workbook_hash
+    
+    with col2:
+        if SCOP_AVAILABLE:
+            solve_button = st.button("🚀 SCOP 最適化実行", type="primary", use_container_width=True)
+        else:
+            solve_button = st.button("📋 サンプル表示", type="secondary", use_container_width=True)
+    
+    # 求解处理
+    if solve_button:
+        if SCOP_AVAILABLE:
+            try:
+                job = submit_solve(st.session_state.weights, workbook_hash)
+            except Exception as solve_error:
+                st.error(f"❌ SCOP 求解エラー: {str(solve_error)}")
+                st.exception(solve_error)
+            else:
+                # 任务 id 同时写入 URL，页面重载后仍可取回结果
+                st.session_state.jobs.append(job.id)
+                st.query_params["jobs"] = ",".join(st.session_state.jobs[-5:])
+                st.rerun()  # 显示任务状态（自动刷新）
+        else:
+            # 显示示例排班表
+            set_schedule(generate_sample_schedule(), "📋 サンプル表示完了")
+            st.session_state.solve_message = None
+            st.rerun()
+    
+    # 显示状态
+    st.info(st.session_state.solve_status)
+    
+    solver_output = st.session_state.solver_output
+    if solver_output:
+        # 显示求解详情
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("求解時間", f"{solver_output.get('solve_time', 0):.1f}秒")
+        with col2:
+            st.metric("制約数", solver_output.get('constraint_count', 'N/A'))
+        with col3:
+            st.metric("解品質", solver_output.get('status_message', '不明'))
+        with col4:
+            violations = len(solver_output.get('violated_constraints', []))
+            st.metric("制約違反", violations)
         
-        with cols[0]:
-            st.markdown(f"**{staff_name}**")
-            
-        for day_idx in range(7):
-            if day_idx < len(row):
-                job_info = row.iloc[day_idx]
-                job_name = job_info.split('(')[1].split(')')[0]
-                color = job_colors.get(job_name, '#bdc3c7')
-                
-                with cols[day_idx + 1]:
-                    st.markdown(f"""
-                    <div style="background-color: {color}; color: white; padding: 0.5rem; 
-                                border-radius: 5px; text-align: center; margin: 2px; font-size: 0.8rem;
-                                font-weight: bold;">
-                        {job_name}
-                    </div>
-                    """, unsafe_allow_html=True)
+        # 显示求解器输出
+        st.subheader("📊 SCOP 求解詳細")
+        
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            st.write("**求解情報:**")
+            info_text = f"""
+アルゴリズム: {solver_output.get('algorithm', 'N/A')}
+問題規模: {solver_output.get('problem_scale', 'N/A')}
+モデル状態: {solver_output.get('model_status', 'N/A')}
+解品質: {solver_output.get('status_message', 'N/A')}
+"""
+            st.code(info_text)
+        
+        with col2:
+            st.write("**制約違反詳細:**")
+            if solver_output.get('violated_constraints'):
+                violations_text = ""
+                for constraint in solver_output['violated_constraints']:
+                    violations_text += f"{constraint}\n"
+                st.code(violations_text if violations_text else "制約違反なし")
+            else:
+                st.code("制約違反なし")
+        
+        if solver_output.get('runtime'):
+            st.write("**処理時間内訳:**")
+            st.code("\n".join(f"{name}: {value}" for name, value in runtime_rows(solver_output['runtime'])))
+        
+        trace = solver_output.get('trace')
+        if trace is not None and len(trace):
+            st.write("**収束推移:**")
+            if importlib.util.find_spec("plotly") is not None:
+                st.plotly_chart(SCOP_MODULE.plot_scop(trace), use_container_width=True)
+            st.download_button("📈 収束トレース (.npz)", data=trace_npz(st.session_state.solution_id, trace),
+                               file_name=f"scop_trace_{st.session_state.solution_id[:8]}.npz",
+                               mime="application/octet-stream")
+    
+    if st.session_state.get('solve_message'):
+        st.success(f"🎉 {st.session_state.solve_message}")
+    elif st.session_state.schedule is not None and not solver_output:
+        st.info("💡 サンプル排班表を表示しています（SCOP利用不可のため）")
+
+@fragment
+def schedule_section():
+    """排班表显示"""
+    if st.session_state.schedule is not None:
+        create_schedule_display(st.session_state.schedule, st.session_state.solution_id)
+    else:
+        # 默认显示示例排班表（每个会话只生成一次，重跑时不会重新打乱）
+        st.markdown("### 📋 デフォルト排班表")
+        create_schedule_display(st.session_state.sample, st.session_state.sample_id)
+
+@fragment
+def statistics_section():
+    """排班统计"""
+    st.subheader("📈 排班統計分析")
+    stats = schedule_statistics(st.session_state.solution_id, st.session_state.schedule)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("🏢 総勤務シフト", stats['total_shifts'])
+    with col2:
+        st.metric("🌅 早番シフト", stats['early_shifts'])
+    with col3:
+        st.metric("🌙 遅番シフト", stats['late_shifts'])
+    with col4:
+        st.metric("🏖️ 休日", stats['rest_days'])
+    
+    # 工作负载分析
+    st.markdown("#### 👥 スタッフ別勤務分析")
+    
+    # 显示工作日数分布与公平性（最大与最小之差、标准差）
+    work_days = stats['work_days']
+    if len(work_days):
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("平均勤務日数", f"{work_days.mean():.1f}日")
+        with col2:
+            st.metric("最大勤務日数", f"{work_days.max()}日")
+        with col3:
+            st.metric("最小勤務日数", f"{work_days.min()}日")
+        with col4:
+            st.metric("勤務日数の差", f"{work_days.max() - work_days.min()}日",
+                      help=f"最大 − 最小（標準偏差 {stats['work_days_std']:.2f}日）")
+    
+    # 每天的人员配置与必要人数
+    st.markdown("#### 📆 日別人員配置")
+    requirement = "・".join(f"{JOB_CATEGORIES[c]}{need}人" for c, need in SHIFT_REQUIREMENT.items())
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("必要人数不足の日", f"{stats['shortage_days']}日", help=f"必要人数: 各日 {requirement}")
+    with col2:
+        st.metric("不足人数（延べ）", f"{stats['shortage_total']}人")
+    st.bar_chart(stats['coverage'])
+    
+    with st.expander("🔢 シフト別割当数"):
+        st.dataframe(pd.Series(stats['job_counts'], name="割当数"), use_container_width=True)
+
+SHIFT_CHOICES = ["休", "早", "遅"]  # 模型中的班次（0=休息, 1=早班, 2=晚班）
+
+def edit_state(solver_output):
+    """当前解的增量评价器（每个解只构建一次，保存在会话中）"""
+    state = st.session_state.get('edit_state')
+    if state is None or state['solution_id'] != st.session_state.solution_id:
+        evaluator = SCOP_MODULE.Evaluator(solver_output['model'])
+        state = st.session_state.edit_state = {
+            'solution_id': st.session_state.solution_id,
+            'evaluator': evaluator,
+            'baseline': dict(evaluator.violation),           # 求解结果的违反量
+            'penalty': (evaluator.hard, evaluator.soft)
+        }
+    return state
+
+@fragment
+def edit_section():
+    """手动修改模型的解：每次修改只更新该格变量所在的约束，立即显示新产生的违反"""
+    solver_output = st.session_state.solver_output
+    if not solver_output or solver_output.get('model') is None:
+        return
+    x = solver_output['base']['x']
+    n_staff, n_day, _ = x.shape
+    state = edit_state(solver_output)
+    evaluator = state['evaluator']
+    one = x.domain.index("1")
+    
+    with st.expander(f"✏️ モデル解の手修正（{n_staff}人 × {n_day}日・違反を即時チェック）"):
+        # 编辑器始终以求解结果为初始值，修改内容由 data_editor 保存
+        assigned = solver_output['model'].getCodes(x) == one
+        solved = np.where(assigned.any(axis=2), assigned.argmax(axis=2), 0)
+        frame = pd.DataFrame(
+            [[SHIFT_CHOICES[j] for j in row] for row in solved],
+            index=[f"Staff_{i+1}" for i in range(n_staff)], columns=[f"{t+1}日" for t in range(n_day)]
+        )
+        edited = st.data_editor(
+            frame, key=f"edit_{state['solution_id']}", use_container_width=True,
+            column_config={col: st.column_config.SelectboxColumn(col, options=SHIFT_CHOICES, required=True)
+                           for col in frame.columns}
+        )
+        
+        # 只把与评价器当前状态不同的格子反映到评价器（O(变更格数 × 变量的约束数)）
+        start = time.perf_counter()
+        changed = edited.to_numpy() != frame.to_numpy()
+        target = solved.copy()
+        target[changed] = [SHIFT_CHOICES.index(v) for v in edited.to_numpy()[changed]]
+        current = state.setdefault('current', solved.copy())
+        for i, t in zip(*np.nonzero(target != current)):
+            for k in range(len(SHIFT_CHOICES)):
+                evaluator.setValue(x[i, t, k], "1" if k == target[i, t] else "0")
+            current[i, t] = target[i, t]
+        elapsed = time.perf_counter() - start
+        
+        hard, soft = state['penalty']
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("ハード違反", evaluator.hard, delta=evaluator.hard - hard, delta_color="inverse")
+        with col2:
+            st.metric("ソフト", evaluator.soft, delta=evaluator.soft - soft, delta_color="inverse")
+        
+        # 与求解结果相比违反增加 / 消除的约束
+        baseline = state['baseline']
+        worse = [(c.name, baseline[id(c)], evaluator.violation[id(c)]) for c in solver_output['model'].constraints
+                 if evaluator.violation[id(c)] > baseline[id(c)]]
+        better = [(c.name, baseline[id(c)], evaluator.violation[id(c)]) for c in solver_output['model'].constraints
+                  if evaluator.violation[id(c)] < baseline[id(c)]]
+        for name, before, after in worse:
+            st.markdown(f"🟥 **{name}**: 違反 {before} → {after}")
+        for name, before, after in better:
+            st.markdown(f"🟩 {name}: 違反 {before} → {after}")
+        st.caption(f"評価時間 {elapsed * 1000:.1f} ms（変更セルの制約のみ再計算）")
+
+def export_button(kind, label, build, file_name, mime):
+    """按需生成的下载按钮：点击"準備"后才生成文件，生成结果按解的标识缓存"""
+    key = (st.session_state.solution_id, kind)
+    prepared = st.session_state.prepared_exports
+    if key not in prepared:
+        placeholder = st.empty()
+        if not placeholder.button(f"{label} を準備", key=f"prepare_{kind}", use_container_width=True):
+            return
+        placeholder.empty()
+        prepared.add(key)
+    
+    with st.spinner("ファイル生成中..."):
+        data = build()
+    st.download_button(label, data=data, file_name=file_name, mime=mime, use_container_width=True)
+
+@fragment
+def download_section():
+    """下载功能：文件只在需要时生成，并按解的标识缓存，重跑或重复下载不会重新生成"""
+    solution_id = st.session_state.solution_id
+    schedule = st.session_state.schedule
+    solver_output = st.session_state.solver_output
+    timestamp = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    st.subheader("📥 ダウンロード")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        export_button(
+            "csv", "📋 排班表CSV",
+            lambda: schedule_csv(solution_id, schedule),
+            f'scop_schedule_{timestamp}.csv', 'text/csv'
+        )
+    
+    with col2:
+        export_button(
+            "report", "📊 SCOP詳細レポート" if solver_output else "📊 サンプルレポート",
+            lambda: schedule_report(solution_id, schedule, solver_output),
+            f'{"scop" if solver_output else "sample"}_report_{timestamp}.txt', 'text/plain'
+        )
+    
+    with col3:
+        # 生成Excel格式的排班表
+        if importlib.util.find_spec("openpyxl") is not None:
+            export_button(
+                "excel", "📊 Excel排班表",
+                lambda: schedule_excel(solution_id, schedule, solver_output),
+                f'scop_schedule_{timestamp}.xlsx',
+                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            )
+        else:
+            st.button(
+                "📊 Excel排班表",
+                disabled=True,
+                use_container_width=True,
+                help="openpyxlライブラリが必要です"
+            )
+
+MEMORY_CATEGORIES = {
+    'domains': '定義域', 'text': 'キャッシュ文字列', 'names': '名前', 'variables': '変数',
+    'terms': '項', 'constraints': '制約', 'index': '転置インデックス', 'overlay': 'clone 差分',
+    'other': 'その他', 'total': '合計',
+}
+
+def deep_sizeof(obj, seen):
+    """scop.sizeof 遍历（与 Model.memoryReport 使用同一实现）；已计入 seen 的对象不再计算。
+    SCOP 模型用 Model.memoryReport()（clone 只计自身部分），DataFrame 用 memory_usage(deep=True)。"""
+    return SCOP_MODULE.sizeof(obj, seen, sizers=(
+        (SCOP_MODULE.Model, lambda m, seen: m.memoryReport(seen)['total']),
+        ((pd.DataFrame, pd.Series), lambda df, seen: int(np.sum(df.memory_usage(deep=True)))),
+    ))
+
+def session_memory():
+    """本会话 session_state 各项的内存（字节）与共享的基础模型的内存明细（没有时为 None）。
+    solver_output 按项目拆开；基础模型（build_base_model 的缓存）由所有会话共享，先计算并从会话中排除。"""
+    seen = set()
+    rows = []
+    shared = None
+    solver_output = st.session_state.get('solver_output') or {}
+    if 'base' in solver_output:
+        shared = solver_output['base']['model'].memoryReport(seen)
+        deep_sizeof(solver_output['base'], seen)
+    for key in sorted(st.session_state.keys(), key=str):
+        value = st.session_state[key]
+        if key == 'solver_output' and value:
+            for item, sub in value.items():
+                rows.append({'キー': f"solver_output.{item}", 'バイト': deep_sizeof(sub, seen)})
+        else:
+            rows.append({'キー': str(key), 'バイト': deep_sizeof(value, seen)})
+    return sorted(rows, key=lambda row: row['バイト'], reverse=True), shared
+
+def peak_rss_mb():
+    """进程的最大常驻内存（MB）；不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def memory_section():
+    """内存使用报告：会话的 session_state、共享的基础模型、tracemalloc 的分配统计"""
+    rows, shared = session_memory()
+    total = sum(row['バイト'] for row in rows)
+    col1, col2 = st.columns(2)
+    col1.metric("セッション", f"{total / 1024:,.1f} KB")
+    rss = peak_rss_mb()
+    col2.metric("プロセス最大RSS", f"{rss:,.0f} MB" if rss is not None else "N/A")
+    st.dataframe(pd.DataFrame(rows[:15]), hide_index=True, use_container_width=True)
+    
+    if shared is not None:
+        st.write("**基礎モデル（全セッション共有）:**")
+        st.dataframe(pd.DataFrame([{'区分': MEMORY_CATEGORIES.get(k, k), 'バイト': v} for k, v in shared.items()]),
+                     hide_index=True, use_container_width=True)
+    
+    # tracemalloc 作用于整个进程（所有会话），追踪期间运行会变慢
+    tracing = st.checkbox("tracemalloc で割当を追跡", value=tracemalloc.is_tracing(),
+                          help="プロセス全体の割当を追跡します（追跡中は処理が遅くなります）")
+    if tracing and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not tracing and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        st.caption(f"追跡中: 現在 {current / 1024 / 1024:,.1f} MB / ピーク {peak / 1024 / 1024:,.1f} MB")
+        top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+        st.code("\n".join(f"{stat.size / 1024:10,.1f} KB  {stat.traceback}" for stat in top))
 
 def main():
     # 页面标题
@@ -505,31 +1639,14 @@ def main():
                 st.json(env_info)
             except Exception as e:
                 st.error(f"環境情報取得エラー: {e}")
+        
+        # 内存使用报告
+        if SCOP_AVAILABLE and st.checkbox("メモリ使用量を表示"):  # 使用 scop.sizeof
+            memory_section()
     
     # 参数设置
     with st.sidebar:
-        st.markdown("### ⚙️ SCOP パラメータ")
-        
-        obj_weight = st.slider("🏖️ 休み希望重み", 1, 100, 90, help="スタッフの休み希望の重要度")
-        LBC_weight = st.slider("👥 必要人数重み", 1, 100, 85, help="各シフトの必要人数確保の重要度")
-        UB_max5_weight = st.slider("⏰ 連続勤務重み", 1, 100, 70, help="連続勤務制限の重要度")
-        UB_max4_weight = st.slider("📅 4日制限重み", 1, 100, 50, help="4日連続制限の重要度")
-        
-        weights = {
-            'obj_weight': obj_weight,
-            'LBC_weight': LBC_weight,
-            'UB_max5_weight': UB_max5_weight,
-            'UB_max4_weight': UB_max4_weight
-        }
-        
-        st.markdown("---")
-        if SCOP_AVAILABLE:
-            st.markdown("**⏱️ 制限時間**: 30秒")
-            st.markdown("**🎯 精度**: 数学的最適化")
-            st.markdown("**📊 問題規模**: 15人 × 14日 → 30日拡張")
-        else:
-            st.markdown("**⏱️ 処理時間**: 即座")
-            st.markdown("**🎯 精度**: 智能ヒューリスティック")
+        parameter_section()
     
     # 主界面
     if not SCOP_AVAILABLE:
@@ -565,286 +1682,46 @@ def main():
         st.info("💡 数理最適化による高精度な排班計画を生成できます")
     
     # 初始化会话状态
-    if 'schedule_df' not in st.session_state:
-        st.session_state.schedule_df = None
+    if 'schedule' not in st.session_state:
+        st.session_state.schedule = None  # 员工×日期 的 int8 班次编码矩阵
         st.session_state.solve_status = "📋 準備完了"
         st.session_state.solver_output = None
+        st.session_state.solve_message = None
+        st.session_state.solution_id = None
+        st.session_state.prepared_exports = set()  # 已生成的 (解的标识, 文件种类)
+    if 'sample' not in st.session_state:
+        st.session_state.sample = generate_sample_schedule()
+        st.session_state.sample_id = new_solution_id()
     
-    # 操作按钮
-    col1, col2 = st.columns([1, 1])
-    
-    with col1:
-        uploaded_file = st.file_uploader("📁 データファイル", type=['xlsx'])
-        if uploaded_file:
-            st.success("✅ ファイル読込済")
+    if 'jobs' not in st.session_state:
+        # 页面重载时从 URL 取回仍在任务表中的任务
+        registry = job_registry()
+        st.session_state.jobs = [j for j in st.query_params.get("jobs", "").split(",") if j in registry]
+        st.session_state.applied_jobs = set()
+    if 'sweep' not in st.session_state:
+        st.session_state.sweep = None  # 权重扫描（futures）
     
-    with col2:
-        if SCOP_AVAILABLE:
-            solve_button = st.button("🚀 SCOP 最適化実行", type="primary", use_container_width=True)
-        else:
-            solve_button = st.button("📋 サンプル表示", type="secondary", use_container_width=True)
+    # 各区块为独立片段：控件操作只重跑所在片段
+    solve_section()
+    if any(job.active for job in session_jobs()):
+        job_status_polling(polling=True)
+    else:
+        job_status_section()
     
-    # 求解处理
-    if solve_button:
-        if SCOP_AVAILABLE:
-            progress_placeholder = st.progress(0)
-            status_placeholder = st.empty()
-            
-            try:
-                result_df, message, solve_time, solver_output = solve_with_scop(
-                    weights, progress_placeholder, status_placeholder
-                )
-                
-                if result_df is not None:
-                    st.session_state.schedule_df = result_df
-                    st.session_state.solve_status = f"✅ SCOP 最適化完了 ({solve_time:.1f}秒)"
-                    st.session_state.solver_output = solver_output
-                    
-                    # 显示求解详情
-                    col1, col2, col3, col4 = st.columns(4)
-                    with col1:
-                        st.metric("求解時間", f"{solve_time:.1f}秒")
-                    with col2:
-                        st.metric("制約数", solver_output.get('constraint_count', 'N/A'))
-                    with col3:
-                        st.metric("解品質", solver_output.get('status_message', '不明'))
-                    with col4:
-                        violations = len(solver_output.get('violated_constraints', []))
-                        st.metric("制約違反", violations)
-                    
-                    # 显示求解器输出
-                    if solver_output:
-                        st.subheader("📊 SCOP 求解詳細")
-                        
-                        col1, col2 = st.columns([1, 1])
-                        with col1:
-                            st.write("**求解情報:**")
-                            info_text = f"""
-アルゴリズム: {solver_output.get('algorithm', 'N/A')}
-問題規模: {solver_output.get('problem_scale', 'N/A')}
-モデル状態: {solver_output.get('model_status', 'N/A')}
-解品質: {solver_output.get('status_message', 'N/A')}
-"""
-                            st.code(info_text)
-                        
-                        with col2:
-                            st.write("**制約違反詳細:**")
-                            if solver_output.get('violated_constraints'):
-                                violations_text = ""
-                                for constraint in solver_output['violated_constraints']:
-                                    violations_text += f"{constraint}\n"
-                                st.code(violations_text if violations_text else "制約違反なし")
-                            else:
-                                st.code("制約違反なし")
-                    
-                    st.success(f"🎉 {message}")
-                else:
-                    st.error(f"❌ {message}")
-            
-            except Exception as solve_error:
-                st.error(f"❌ SCOP 求解エラー: {str(solve_error)}")
-                st.exception(solve_error)
-            
-            finally:
-                progress_placeholder.empty()
-                status_placeholder.empty()
+    if SCOP_AVAILABLE:
+        sweep_section()
+        sweep = st.session_state.sweep
+        if sweep is not None and not sweep_done(sweep):
+            sweep_status_polling()
         else:
-            # 显示示例排班表
-            st.session_state.schedule_df = generate_sample_schedule()
-            st.session_state.solve_status = "📋 サンプル表示完了"
-            st.info("💡 サンプル排班表を表示しています（SCOP利用不可のため）")
+            sweep_status_section()
     
-    # 显示状态
-    st.info(st.session_state.solve_status)
+    schedule_section()
     
-    # 显示结果
-    if st.session_state.schedule_df is not None:
-        create_schedule_display(st.session_state.schedule_df)
-        
-        # 统计信息
-        st.subheader("📈 排班統計分析")
-        df = st.session_state.schedule_df
-        
-        # 计算统计
-        total_shifts = 0
-        rest_days = 0
-        early_shifts = 0
-        late_shifts = 0
-        
-        for _, row in df.iterrows():
-            for job_info in row:
-                job_name = job_info.split('(')[1].split(')')[0]
-                if job_name == '休み':
-                    rest_days += 1
-                elif '早番' in job_name:
-                    early_shifts += 1
-                    total_shifts += 1
-                elif '遅番' in job_name:
-                    late_shifts += 1
-                    total_shifts += 1
-        
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            st.metric("🏢 総勤務シフト", total_shifts)
-        with col2:
-            st.metric("🌅 早番シフト", early_shifts)
-        with col3:
-            st.metric("🌙 遅番シフト", late_shifts)
-        with col4:
-            st.metric("🏖️ 休日", rest_days)
-        
-        # 工作负载分析
-        st.markdown("#### 👥 スタッフ別勤務分析")
-        staff_work_days = {}
-        for staff_idx, (staff_name, row) in enumerate(df.iterrows()):
-            work_days = sum(1 for job_info in row if '休み' not in job_info)
-            staff_work_days[staff_name] = work_days
-        
-        # 显示工作日数分布
-        work_days_list = list(staff_work_days.values())
-        if work_days_list:
-            avg_work_days = sum(work_days_list) / len(work_days_list)
-            max_work_days = max(work_days_list)
-            min_work_days = min(work_days_list)
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("平均勤務日数", f"{avg_work_days:.1f}日")
-            with col2:
-                st.metric("最大勤務日数", f"{max_work_days}日")
-            with col3:
-                st.metric("最小勤務日数", f"{min_work_days}日")
-    else:
-        # 默认显示示例排班表
-        st.markdown("### 📋 デフォルト排班表")
-        sample_df = generate_sample_schedule()
-        create_schedule_display(sample_df)
-    
-    # 下载功能
-    if st.session_state.schedule_df is not None:
-        st.subheader("📥 ダウンロード")
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            csv_data = st.session_state.schedule_df.to_csv(encoding='utf-8-sig')
-            st.download_button(
-                "📋 排班表CSV",
-                data=csv_data,
-                file_name=f'scop_schedule_{dt.datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-                mime='text/csv',
-                use_container_width=True
-            )
-        
-        with col2:
-            if st.session_state.solver_output:
-                # 生成详细的SCOP报告
-                output_text = f"""SCOP AI 排班最適化システム レポート
-{'='*60}
-生成日時: {dt.datetime.now().strftime('%Y年%m月%d日 %H時%M分%S秒')}
-
-【最適化概要】
-アルゴリズム: {st.session_state.solver_output.get('algorithm', 'N/A')}
-問題規模: {st.session_state.solver_output.get('problem_scale', 'N/A')}
-求解時間: {st.session_state.solver_output.get('solve_time', 0):.3f} 秒
-制約数: {st.session_state.solver_output.get('constraint_count', 'N/A')}
-解品質: {st.session_state.solver_output.get('status_message', 'N/A')}
-
-【制約満足状況】"""
-                
-                if st.session_state.solver_output.get('violated_constraints'):
-                    output_text += f"\n制約違反数: {len(st.session_state.solver_output['violated_constraints'])}\n"
-                    for constraint in st.session_state.solver_output['violated_constraints']:
-                        output_text += f"- {constraint}\n"
-                else:
-                    output_text += "\n全制約満足: ✅\n"
-                
-                # 添加统计信息
-                total_assignments = len(st.session_state.schedule_df) * len(st.session_state.schedule_df.columns)
-                output_text += f"""
-【排班統計】
-総割当数: {total_assignments}
-スタッフ数: {len(st.session_state.schedule_df)}
-期間: {len(st.session_state.schedule_df.columns)}日間
-
-【システム情報】
-最適化エンジン: SCOP Mathematical Optimization Library
-実行環境: Streamlit Cloud
-レポート生成: 自動生成システム
-
-{'='*60}
-レポート終了
-"""
-                
-                st.download_button(
-                    "📊 SCOP詳細レポート",
-                    data=output_text,
-                    file_name=f'scop_report_{dt.datetime.now().strftime("%Y%m%d_%H%M%S")}.txt',
-                    mime='text/plain',
-                    use_container_width=True
-                )
-            else:
-                sample_report = f"""サンプル排班レポート
-生成日時: {dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-モード: サンプル表示
-人数: 15人
-期間: 30日間
-生成方法: 智能ヒューリスティック
-
-注記: SCOP最適化ライブラリが利用できないため、
-サンプルアルゴリズムによる排班表を表示しています。
-"""
-                st.download_button(
-                    "📊 サンプルレポート",
-                    data=sample_report,
-                    file_name=f'sample_report_{dt.datetime.now().strftime("%Y%m%d_%H%M%S")}.txt',
-                    mime='text/plain',
-                    use_container_width=True
-                )
-        
-        with col3:
-            # 生成Excel格式的排班表
-            try:
-                from io import BytesIO
-                
-                # 创建BytesIO对象
-                excel_buffer = BytesIO()
-                
-                # 使用pandas的ExcelWriter
-                with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                    # 写入排班表
-                    st.session_state.schedule_df.to_excel(writer, sheet_name='排班表')
-                    
-                    # 如果有求解器输出，添加统计信息
-                    if st.session_state.solver_output:
-                        # 创建统计表
-                        stats_data = [
-                            ['求解時間', f"{st.session_state.solver_output.get('solve_time', 0):.3f}秒"],
-                            ['制約数', st.session_state.solver_output.get('constraint_count', 'N/A')],
-                            ['解品質', st.session_state.solver_output.get('status_message', 'N/A')],
-                            ['制約違反数', len(st.session_state.solver_output.get('violated_constraints', []))],
-                            ['アルゴリズム', st.session_state.solver_output.get('algorithm', 'N/A')]
-                        ]
-                        stats_df = pd.DataFrame(stats_data, columns=['項目', '値'])
-                        stats_df.to_excel(writer, sheet_name='最適化詳細', index=False)
-                
-                excel_buffer.seek(0)
-                
-                st.download_button(
-                    "📊 Excel排班表",
-                    data=excel_buffer.getvalue(),
-                    file_name=f'scop_schedule_{dt.datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
-                    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    use_container_width=True
-                )
-            except ImportError:
-                st.button(
-                    "📊 Excel排班表",
-                    disabled=True,
-                    use_container_width=True,
-                    help="openpyxlライブラリが必要です"
-                )
+    if st.session_state.schedule is not None:
+        statistics_section()
+        edit_section()
+        download_section()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""Import-time budget for scop.py and appnew.py.
+
+Each module is imported in a fresh interpreter with ``python -X importtime``
+and the cumulative import time of the module itself is compared with its
+budget. The best of ``--repeat`` runs is used to damp the noise of cold caches.
+
+    python benchmarks/importtime.py                 # check the default budgets
+    python benchmarks/importtime.py --budget scop=80 --top 15
+    python benchmarks/importtime.py --json importtime.json
+
+The exit status is 1 if any module exceeds its budget.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# budget of the cumulative import time in milliseconds
+BUDGETS = {
+    "scop": 100,
+    "appnew": 4000,
+}
+
+
+def measure(module):
+    """import module in a fresh interpreter; return {imported package: (self_us, cumulative_us)}"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError("import {0} failed:\n{1}".format(module, proc.stderr[-2000:]))
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        name = fields[2].strip()
+        times[name] = (int(fields[0]), int(fields[1]))
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="override the budget of a module (milliseconds)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs per module (best is used)")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports shown per module")
+    parser.add_argument("--json", metavar="PATH", help="write the results to a JSON file")
+    args = parser.parse_args(argv)
+
+    budgets = dict(BUDGETS)
+    for item in args.budget:
+        module, _, ms = item.partition("=")
+        budgets[module] = float(ms)
+
+    results, failed = {}, []
+    for module, budget in budgets.items():
+        runs = [measure(module) for _ in range(max(1, args.repeat))]
+        best = min(runs, key=lambda times: times[module][1])
+        total_ms = best[module][1] / 1000.0
+        slowest = sorted(best.items(), key=lambda item: item[1][1], reverse=True)
+        top = [(name, cumulative / 1000.0) for name, (_, cumulative) in slowest if name != module][:args.top]
+        ok = total_ms <= budget
+        if not ok:
+            failed.append(module)
+        results[module] = {"cumulative_ms": total_ms, "budget_ms": budget, "ok": ok, "top": top}
+
+        print("{0:<10} {1:9.1f} ms  (budget {2:.0f} ms)  {3}".format(
+            module, total_ms, budget, "ok" if ok else "OVER BUDGET"))
+        for name, ms in top:
+            print("    {0:9.1f} ms  {1}".format(ms, name))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
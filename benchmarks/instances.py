@@ -0,0 +1,92 @@
+"""Seeded shift-scheduling instances for the benchmarks.
+
+A generalization of ``create_mock_data`` in appnew.py: the staff count, the number
+of days and jobs, the skill density (probability that a staff member can do a job)
+and the request density (probability of a day-off request) are parameters, and the
+same seed always gives the same instance.
+
+    inst = make_instance(200, 60, seed=1)
+    m, x = build_model(inst)
+"""
+import os
+import random
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def make_instance(n_staff=15, n_day=21, n_job=14, skill_density=0.5, request_density=0.2, seed=0):
+    """return the instance as a dictionary; job 0 is the day off"""
+    rng = random.Random(seed)
+    job = list(range(n_job))
+
+    # jobs each staff member can do (at least one besides the day off)
+    skills = {}
+    for i in range(n_staff):
+        can = [j for j in job[1:] if rng.random() < skill_density]
+        skills[i] = [0] + (can or [rng.choice(job[1:])])
+
+    # day-off requests
+    day_off = {i: set(t for t in range(n_day) if rng.random() < request_density) for i in range(n_staff)}
+
+    # lower bounds of the staff per day and job, scaled so that about 80% of the staff work
+    per_job = max(1, round(2 * 0.8 * n_staff / max(1, n_job - 1)))
+    LB = defaultdict(int)
+    for t in range(n_day):
+        for j in job[1:]:
+            LB[t, j] = rng.randint(0, per_job)
+
+    return {
+        "n_staff": n_staff, "n_day": n_day, "job": job, "skills": skills, "day_off": day_off, "LB": LB,
+        "params": {"n_staff": n_staff, "n_day": n_day, "n_job": n_job, "skill_density": skill_density,
+                   "request_density": request_density, "seed": seed},
+    }
+
+
+def build_model(inst, obj_weight=90, LBC_weight=85, UB_max5_weight=70, UB_max4_weight=50, validation="deferred"):
+    """build the SCOP model of the instance; return the model and the (staff x day) variable array"""
+    from scop import Model, Linear
+
+    n_staff, n_day, job = inst["n_staff"], inst["n_day"], inst["job"]
+    m = Model("bench", validation=validation)
+    x = m.addVariableArray((n_staff, n_day), job, "x")
+
+    # jobs without the skill are forbidden (hard; presolve turns them into smaller domains)
+    for i in range(n_staff):
+        forbidden = [j for j in job if j not in inst["skills"][i]]
+        if not forbidden:
+            continue
+        for t in range(n_day):
+            con = Linear(f"skill[{i},{t}]", weight="inf", rhs=0, direction="<=")
+            for j in forbidden:
+                con.addTerms(1, x[i, t], j)
+            m.addConstraint(con)
+
+    # day-off requests
+    for i in range(n_staff):
+        for t in sorted(inst["day_off"][i]):
+            con = Linear(f"obj[{i},{t}]", weight=obj_weight, rhs=1, direction=">=")
+            con.addTerms(1, x[i, t], 0)
+            m.addConstraint(con)
+
+    # lower bounds of the staff per day and job
+    can = defaultdict(list)
+    for i in range(n_staff):
+        for j in inst["skills"][i][1:]:
+            can[j].append(i)
+    for (t, j), lb in sorted(inst["LB"].items()):
+        if lb == 0 or not can[j]:
+            continue
+        con = Linear(f"LB[{t},{j}]", weight=LBC_weight, rhs=lb, direction=">=")
+        for i in can[j]:
+            con.addTerms(1, x[i, t], j)
+        m.addConstraint(con)
+
+    # at least one day off in every 6 (5) consecutive days
+    rows = x[:, :]
+    m.addWindowConstraints("UB_max5", rows, 0, 6, 1, weight=UB_max5_weight, direction=">=")
+    m.addWindowConstraints("UB_max4", rows, 0, 5, 1, weight=UB_max4_weight, direction=">=")
+    return m, x
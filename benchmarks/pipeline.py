@@ -0,0 +1,219 @@
+"""End-to-end benchmark of the scop.py pipeline on seeded instances.
+
+Every size runs in a fresh interpreter, so the peak RSS is that of one size only.
+The phases are
+
+    build     make_instance + build_model (benchmarks/instances.py)
+    validate  Model.validate
+    presolve  Model.presolve
+    update    Model.update (serialization; bytes and terms are recorded)
+    write     writing scop_input.txt
+    solve     Model.optimize (only with --solve or --replay; --solve needs a solver that accepts the size)
+    parse     parsing the solver output
+    assign    setting the values of the solution
+    evaluate  evaluating the left-hand sides of the constraints
+
+Without --solve the solver output is synthesized (a random value for every
+variable), so everything but the solver itself is measured with any scop binary.
+With --replay Model.optimize runs end to end with the stand-in solver
+benchmarks/scop_replay.py (synthetic output after --replay-delay seconds), so the
+spawn and the streaming of the solver output are measured as well.
+
+    python benchmarks/pipeline.py                              # default sizes
+    python benchmarks/pipeline.py --sizes 15x21,100x30 --json bench.json
+    python benchmarks/pipeline.py --replay --sizes 200x60
+    python benchmarks/pipeline.py --save-baseline benchmarks/baseline.json
+    python benchmarks/pipeline.py --baseline benchmarks/baseline.json --tolerance 1.5
+
+With --baseline the exit status is 1 if a phase is slower than tolerance x its
+baseline time (phases shorter than --min-time seconds in the baseline are ignored).
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SIZES = ["15x21", "50x30", "100x30", "200x60", "500x90"]
+PHASES = ["build", "validate", "presolve", "update", "write", "solve", "parse", "assign", "evaluate"]
+
+
+def peak_rss_mb():
+    """peak resident set size of this process so far (MB)"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def synthetic_output(m, seed=0):
+    """solver output with a random value for every variable passed to the solver"""
+    rng = random.Random(seed)
+    lines = ["[best solution]"]
+    for var in m.variables:
+        lines.append("{0}: {1}".format(var.name, rng.choice(var.domain)))
+    fixed = set(id(var) for var in m.fixed)
+    for array in m.arrays.values():
+        for var, name in zip(array._vars, array.names()):
+            if var is None:
+                lines.append("{0}: {1}".format(name, rng.choice(array.domain)))
+            elif id(var) not in fixed:
+                lines.append("{0}: {1}".format(name, rng.choice(var.domain)))
+    lines += ["", "penalty: 0/0 (hard/soft)", "", "[Violated constraints]", ""]
+    return "\n".join(lines)
+
+
+def worker(size, args):
+    """run the phases for one size in this process; return the record"""
+    from instances import make_instance, build_model
+
+    n_staff, n_day = (int(s) for s in size.split("x"))
+    phases = {}
+
+    def phase(name, func):
+        start = time.perf_counter()
+        result = func()
+        phases[name] = {"time": time.perf_counter() - start, "peak_rss_mb": peak_rss_mb()}
+        return result
+
+    inst = make_instance(n_staff, n_day, args.jobs, args.skill_density, args.request_density, args.seed)
+    m, x = phase("build", lambda: build_model(inst))
+    phase("validate", m.validate)
+    stats = phase("presolve", m.presolve)
+    text = phase("update", m.update)
+    size_info = m._size()
+
+    work = tempfile.mkdtemp(prefix="scop_bench_")
+    try:
+        def write():
+            with open(os.path.join(work, "scop_input.txt"), "w") as f:
+                f.write(text)
+        phase("write", write)
+
+        status = None
+        if args.solve or args.replay:
+            m.Params.TimeLimit = args.time_limit
+            m.Params.WorkDir = work
+            if args.replay:
+                m.Params.Solver = '"{0}" "{1}" --delay {2}'.format(
+                    sys.executable, os.path.join(ROOT, "benchmarks", "scop_replay.py"), args.replay_delay)
+            cwd = os.getcwd()
+            os.chdir(ROOT)  # the solver binary is looked up in the current directory
+            try:
+                phase("solve", m.optimize)
+            finally:
+                os.chdir(cwd)
+            status = m.Status
+            with open(os.path.join(work, "scop_out.txt")) as f:
+                out = f.read()
+        else:
+            out = synthetic_output(m, args.seed)
+    finally:
+        import shutil
+        shutil.rmtree(work, ignore_errors=True)
+
+    if status in (None, 0):
+        sol, violated, best = phase("parse", lambda: m._parse(out))
+        phase("assign", lambda: m._assign(sol))
+        phase("evaluate", m._evaluate)
+
+    return {
+        "size": size, "instance": inst["params"], "status": status,
+        "model_bytes": len(text.encode()), "output_bytes": len(out.encode()),
+        "model": size_info, "presolve": {k: v for k, v in stats.items() if k not in ("before", "after")},
+        "phases": phases, "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_size(size, args):
+    """run one size in a fresh interpreter"""
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", size,
+           "--jobs", str(args.jobs), "--skill-density", str(args.skill_density),
+           "--request-density", str(args.request_density), "--seed", str(args.seed),
+           "--time-limit", str(args.time_limit), "--replay-delay", str(args.replay_delay)]
+    cmd += (["--solve"] if args.solve else []) + (["--replay"] if args.replay else [])
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError("size {0} failed:\n{1}".format(size, proc.stderr[-2000:]))
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance, min_time):
+    """return the list of (size, phase, time, baseline time) slower than tolerance x baseline"""
+    base = {r["size"]: r for r in baseline["results"]}
+    slower = []
+    for r in results:
+        b = base.get(r["size"])
+        if b is None:
+            continue
+        for name, p in r["phases"].items():
+            bp = b["phases"].get(name)
+            if bp is None or bp["time"] < min_time:
+                continue
+            if p["time"] > tolerance * bp["time"]:
+                slower.append((r["size"], name, p["time"], bp["time"]))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(SIZES), help="comma-separated STAFFxDAYS sizes")
+    parser.add_argument("--jobs", type=int, default=14, help="number of jobs (job 0 is the day off)")
+    parser.add_argument("--skill-density", type=float, default=0.5)
+    parser.add_argument("--request-density", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--solve", action="store_true", help="run the solver instead of synthesizing its output")
+    parser.add_argument("--replay", action="store_true", help="run optimize with the stand-in solver scop_replay.py")
+    parser.add_argument("--replay-delay", type=float, default=0., help="delay of the stand-in solver (seconds)")
+    parser.add_argument("--time-limit", type=int, default=10, help="solver time limit with --solve or --replay (seconds)")
+    parser.add_argument("--json", metavar="PATH", help="write the results to a JSON file")
+    parser.add_argument("--baseline", metavar="PATH", help="compare the phase times with a stored baseline")
+    parser.add_argument("--save-baseline", metavar="PATH", help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown against the baseline")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="baseline phases shorter than this (seconds) are not compared")
+    parser.add_argument("--worker", metavar="SIZE", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args)))
+        return 0
+
+    results = []
+    print("{0:>8} {1:>9} {2:>9} {3:>9}  {4}".format("size", "bytes", "terms", "peak MB",
+                                                   "  ".join("{0:>8}".format(p) for p in PHASES)))
+    for size in args.sizes.split(","):
+        r = run_size(size.strip(), args)
+        results.append(r)
+        print("{0:>8} {1:>9} {2:>9} {3:>9.1f}  {4}".format(
+            r["size"], r["model_bytes"], r["model"]["terms"], r["peak_rss_mb"],
+            "  ".join("{0:>8.3f}".format(r["phases"][p]["time"]) if p in r["phases"] else "{0:>8}".format("-")
+                      for p in PHASES)))
+        if r["status"] not in (None, 0):
+            print("{0:>8} solver status {1}; parse/assign/evaluate skipped".format("", r["status"]))
+
+    report = {"python": sys.version.split()[0], "solve": args.solve, "replay": args.replay, "results": results}
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.tolerance, args.min_time)
+        for size, name, t, bt in slower:
+            print("REGRESSION {0} {1}: {2:.3f} s (baseline {3:.3f} s)".format(size, name, t, bt))
+        if slower:
+            return 1
+        print("no regression against {0} (tolerance {1}x)".format(args.baseline, args.tolerance))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
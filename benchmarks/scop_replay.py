@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Stand-in for the scop solver binary replaying a recorded or synthetic output.
+
+It takes the command line of the solver (-time, -seed, -initsolfile) and the model
+on stdin like scop-linux, so Model.optimize() and appnew run end to end without the
+solver and without its solve time:
+
+    m.Params.Solver = "python /path/to/benchmarks/scop_replay.py --delay 0.5"
+    SCOP_SOLVER="python $PWD/benchmarks/scop_replay.py" streamlit run appnew.py
+
+Without --output the solution is synthetic: a value drawn with the -seed for every
+declared variable (the values of -initsolfile where it has them), the --penalty as
+the final penalty and no violated constraints. With --output a recorded solver
+output (e.g., the scop_out.txt of a real run) is printed as it is.
+
+The progress lines are spread over --delay seconds (0 prints everything at once)
+and the exit status is --status. SIGINT ends the delay as with scop-linux: it prints
+"Interrupted." and the solution so far under "[incumbent solution]" and exits with 1.
+"""
+import argparse
+import random
+import re
+import signal
+import sys
+import threading
+import time
+
+_variable = re.compile(r"variable (\S+) in \{ (.*?) \}")
+_progress = re.compile(r"^penalty = (\d+)/(\d+) \(hard/soft\)")
+TIME = "%TIME%"  # replaced by the elapsed time when a synthetic line is printed
+INCUMBENT = "[incumbent solution]"  # heading of the solution printed after SIGINT
+
+
+def read_initial(path):
+    """values of the solution file written by a previous solve (scop_best_data.txt)"""
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                name, sep, value = line.partition(":")
+                if sep:
+                    values[name.strip()] = value.strip()
+    except OSError:
+        pass
+    return values
+
+
+def synthetic(model, seed, penalty, steps, initial):
+    """progress lines and a function returning the rest of the output for the last printed penalty"""
+    rng = random.Random(seed)
+    hard, soft = (int(p) for p in penalty.split("/"))
+    head = ["# reading data ... done: 0.00(s)"]
+    for k in range(steps):
+        factor = steps - 1 - k  # penalties fall to the final one
+        head.append("penalty = {0}/{1} (hard/soft), time = {2}(s), iteration = {3}".format(
+            hard + factor, soft + 10 * factor, TIME, 100 * k))
+    best = []
+    for name, values in _variable.findall(model):
+        value = initial.get(name)
+        if value is None:
+            value = rng.choice(values.split(","))
+        best.append("{0}: {1}".format(name, value))
+
+    def tail(last):
+        m = _progress.match(last or "penalty = {0}/{1} (hard/soft)".format(hard, soft))
+        h, s, iteration = m.group(1), m.group(2), 100 * max(steps - 1, 0)
+        return (["", "", "# penalty = {0}/{1} (hard/soft)".format(h, s), "# cpu time = {0}/{0}(s)".format(TIME),
+                 "# iteration = {0}/{0}".format(iteration), "", "[best solution]"] + best +
+                ["", "penalty: {0}/{1} (hard/soft)".format(h, s), "", "[Violated constraints]", ""])
+    return head, tail
+
+
+def recorded(path):
+    """progress lines and a function returning the rest of a recorded solver output"""
+    with open(path) as f:
+        lines = f.read().splitlines()
+    last = max([k for k, line in enumerate(lines) if _progress.match(line)] or [0])
+    return lines[:last + 1], lambda _: lines[last + 1:]
+
+
+def interrupted_tail(lines):
+    """the rest of the output as scop-linux prints it after SIGINT"""
+    lines = [INCUMBENT if line == "[best solution]" else line for line in lines]
+    return ["Interrupted.", ""] + lines[lines.index(INCUMBENT):] if INCUMBENT in lines else lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-time", type=float, default=600, help="time limit (the delay is capped by it)")
+    parser.add_argument("-seed", type=int, default=1)
+    parser.add_argument("-initsolfile", help="solution file of a previous solve")
+    parser.add_argument("--output", help="recorded solver output to replay")
+    parser.add_argument("--delay", type=float, default=0., help="seconds over which the progress is printed")
+    parser.add_argument("--penalty", default="0/0", help="final hard/soft penalty of the synthetic output")
+    parser.add_argument("--steps", type=int, default=5, help="progress lines of the synthetic output")
+    parser.add_argument("--status", type=int, default=0, help="exit status")
+    args = parser.parse_args(argv)
+
+    model = sys.stdin.read()
+    interrupted = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: interrupted.set())
+
+    if args.output:
+        head, tail = recorded(args.output)
+    else:
+        initial = read_initial(args.initsolfile) if args.initsolfile else {}
+        head, tail = synthetic(model, args.seed, args.penalty, args.steps, initial)
+
+    start = time.perf_counter()
+    delay = min(args.delay, args.time)
+    steps = max(1, sum(1 for line in head if _progress.match(line)))
+
+    def emit(line):
+        print(line.replace(TIME, "{0:.2f}".format(time.perf_counter() - start)), flush=True)
+
+    n, last = 0, None
+    for line in head:
+        if _progress.match(line):
+            # the n-th progress line is printed at n / (number of progress lines) of the delay;
+            # after SIGINT the best solution so far is printed
+            if n and interrupted.wait(max(0., start + delay * n / steps - time.perf_counter())):
+                break
+            n, last = n + 1, line
+        emit(line)
+    interrupted.wait(max(0., start + delay - time.perf_counter()))
+    if interrupted.is_set():
+        for line in interrupted_tail(tail(last)):
+            emit(line)
+        return 1
+    for line in tail(last):
+        emit(line)
+    return args.status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,35 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: nbs/14scop.ipynb (unless otherwise specified).
 
-__all__ = ['Parameters', 'Variable', 'Model', 'Constraint', 'Linear', 'Quadratic', 'Alldiff', 'plot_scop']
+__all__ = ['Parameters', 'Variable', 'Domain', 'IndexedVariable', 'VariableArray', 'Model', 'Constraint', 'Linear',
+           'Quadratic', 'Alldiff', 'Window', 'WindowFamily', 'Evaluator', 'Runtime', 'Metrics', 'PrometheusFile', 'PrometheusHTTP', 'JsonLines',
+           'metrics', 'sizeof', 'Trace', 'plot_scop']
 
 # Cell
 import sys
+import os
 import re
 import copy
 import platform
 import string
 _trans = str.maketrans(":-+*/'(){}^=<>$ |#?,\¥", "_"*22) #文字列変換用
+_progress = re.compile(r"penalty = (\d+)/(\d+) \(hard/soft\), time = ([\d.]+)\(s\), iteration = (\d+)") #solver progress line
+_progressLines = re.compile("^" + _progress.pattern, re.M) #progress lines in the whole output
+_penalty = re.compile(r"^penalty: (\d+)/(\d+)", re.M) #penalty of the best solution
+_incumbent = "[incumbent solution]" #heading of the solution printed by the interrupted solver (instead of [best solution])
 import ast
 import pickle
 import datetime as dt
+import time as _time
+import types
+import json
+import threading
 from collections import Counter
+from array import array as carray
 
-#以下非標準ファイル
+#以下非標準ファイル (必要になった時点で関数内でimportする)
 #import pandas as pd
 #import numpy as np
-import plotly.graph_objs as go
-import plotly
-import plotly.figure_factory as ff
-from plotly.subplots import make_subplots
+#import plotly.graph_objs as go
 
 # Cell
 class Parameters():
@@ -34,6 +43,25 @@ class Parameters():
             optimization will terminate if the solver determines that the optimum penalty value
             for the model is worse than the specified "Target." Non-negative integer. Default = 0.
     - Initial: True if you want to solve the problem starting with an initial solution obtained before, False otherwise. Default = False.
+    - Presolve: True if you want to run Model.presolve() before the model is passed to the solver, False otherwise. Default = False.
+    - WorkDir: Directory in which the solver runs and writes scop_input.txt, scop_out.txt, scop_best_data.txt and scop_error.txt;
+            the solver itself stays in the current directory. None for the current directory. Default = None.
+    - Profile: True if you want to run Model.optimize() under cProfile (see Runtime.profile), False otherwise. Default = False.
+    - StallTime: Stops the solver (with SIGINT) when the penalty has not improved for this many seconds.
+            The interrupted solver prints its incumbent solution and exits with status 1; optimize() reads that
+            solution and sets Status = 0 as at the time limit. None for no limit. Default = None.
+    - StallFraction: Stops the solver when the time since the last improvement is at least this fraction of
+            the time elapsed since the first solution (e.g., 0.5), once StallMinTime seconds have elapsed.
+            None for no limit. Default = None.
+    - StallMinTime: Seconds after the first solution before StallFraction applies. Default = 1.
+            The stall criteria are checked on the wall clock while the solver output is streamed;
+            they are not supported on Windows. The criterion that stopped the solver is Runtime.stopped.
+            With a stall criterion the solver is started without a shell (so that SIGINT reaches it);
+            otherwise it is started through the shell as usual.
+    - Solver: Command that runs instead of the scop binary, e.g., "python /path/to/benchmarks/scop_replay.py --delay 1"
+            (the stand-in solver replaying a recorded or synthetic output); it gets the same arguments and input
+            and runs in WorkDir, so its paths should be absolute. None for the environment variable SCOP_SOLVER,
+            or the scop binary in the current directory if it is not set. Default = None.
     """
     def __init__(self):
         self.TimeLimit=600
@@ -41,8 +69,363 @@ class Parameters():
         self.RandomSeed=1
         self.Target =0
         self.Initial=False
+        self.Presolve=False
+        self.WorkDir=None
+        self.Profile=False
+        self.StallTime=None
+        self.StallFraction=None
+        self.StallMinTime=1
+        self.Solver=None
     def __str__(self):
-        return f" TimeLimit = {self.TimeLimit} \n OutputFlag = {self.OutputFlag} \n RandomSeed = {self.RandomSeed} \n Taeget = {self.Target} \n Initial = {self.Initial}"
+        return f" TimeLimit = {self.TimeLimit} \n OutputFlag = {self.OutputFlag} \n RandomSeed = {self.RandomSeed} \n Taeget = {self.Target} \n Initial = {self.Initial} \n Presolve = {self.Presolve} \n WorkDir = {self.WorkDir} \n Profile = {self.Profile} \n StallTime = {self.StallTime} \n StallFraction = {self.StallFraction} \n StallMinTime = {self.StallMinTime} \n Solver = {self.Solver}"
+
+# Cell
+class Runtime(object):
+    """
+    Breakdown of the time spent by the last Model.optimize() (Model.Runtime).
+
+    Attributes:
+    - phases: Dictionary that maps the phases to their wall-clock times (in seconds), in the order they ran:
+            validate, presolve, serialize (Model.update), write (scop_input.txt), spawn (starting the solver),
+            solver (until the solver exits), parse, assign (values of the solution) and evaluate (left-hand sides).
+            Phases that did not run (e.g., after a solver error) are missing.
+    - total: Wall-clock time of the whole Model.optimize() (in seconds).
+    - input_bytes: Size of the model text passed to the solver.
+    - output_bytes: Size of the solver output.
+    - size: Size of the model passed to the solver (variables, values, constraints and terms).
+    - penalty: Tuple (hard, soft) of the penalty of the best solution reported by the solver (None if no solution).
+    - stopped: Criterion that stopped the solver early; "StallTime" or "StallFraction" (see Parameters),
+            None if the solver stopped by itself (time limit or target).
+    - profile: pstats.Stats of Model.optimize() if Params.Profile is True, None otherwise.
+    """
+    def __init__(self, hooks=()):
+        self.phases = {}
+        self.total = 0.
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.size = {}
+        self.penalty = None
+        self.stopped = None
+        self.profile = None
+        self._hooks = hooks
+
+    def start(self, phase):
+        """
+        start(phase)
+        Start timing the phase; the previous phase (if any) ends here.
+        """
+        self.stop()
+        self._phase, self._start = phase, _time.perf_counter()
+
+    def stop(self):
+        """
+        stop()
+        End the current phase and call the hooks with (phase, seconds, runtime).
+        """
+        phase = self.__dict__.pop("_phase", None)
+        if phase is None:
+            return
+        seconds = _time.perf_counter() - self._start
+        self.phases[phase] = self.phases.get(phase, 0.) + seconds
+        for hook in self._hooks:
+            hook(phase, seconds, self)
+
+    def asDict(self):
+        """
+        asDict()
+        Return the breakdown as a dictionary of plain values (without the profile).
+        """
+        return {
+            "phases": dict(self.phases), "total": self.total,
+            "input_bytes": self.input_bytes, "output_bytes": self.output_bytes, "size": dict(self.size),
+            "penalty": self.penalty, "stopped": self.stopped,
+            }
+
+    def __str__(self):
+        ret = ["Runtime: total {0:.3f}(s)".format(self.total)]
+        for phase, seconds in self.phases.items():
+            ret.append("  {0:<9} {1:8.3f}(s)".format(phase, seconds))
+        ret.append("  input {0} bytes, output {1} bytes".format(self.input_bytes, self.output_bytes))
+        if self.size:
+            ret.append("  " + ", ".join("{0} {1}".format(k, v) for k, v in self.size.items()))
+        if self.stopped:
+            ret.append("  stopped by {0}".format(self.stopped))
+        return "\n".join(ret)
+
+class _StallMonitor(object):
+    """
+    Watchdog thread that interrupts the solver (SIGINT) when the penalty stagnates
+    (see Parameters.StallTime and Parameters.StallFraction); the criterion that fired is kept in reason.
+    """
+    def __init__(self, pipe, stall_time, stall_fraction, min_time, interval=0.05):
+        self.pipe = pipe
+        self.stall_time = stall_time
+        self.stall_fraction = stall_fraction
+        self.min_time = min_time
+        self.interval = interval
+        self.reason = None
+        self.best = None   #best (hard, soft) so far
+        self.first = None  #wall-clock time of the first solution
+        self.last = None   #wall-clock time of the last improvement
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="scop-stall", daemon=True)
+        self._thread.start()
+
+    def progress(self, hard, soft):
+        now = _time.perf_counter()
+        if self.best is None or (hard, soft) < self.best:
+            self.best = (hard, soft)
+            self.last = now
+            if self.first is None:
+                self.first = now
+
+    def _watch(self):
+        import signal
+        while not self._done.wait(self.interval):
+            if self.last is None:
+                continue
+            now = _time.perf_counter()
+            idle, elapsed = now - self.last, now - self.first
+            if self.stall_time is not None and idle >= self.stall_time:
+                self.reason = "StallTime"
+            elif self.stall_fraction is not None and elapsed >= self.min_time and idle >= self.stall_fraction * elapsed:
+                self.reason = "StallFraction"
+            else:
+                continue
+            try:
+                self.pipe.send_signal(signal.SIGINT)
+            except OSError: #the solver has just exited
+                pass
+            return
+
+    def close(self):
+        self._done.set()
+        self._thread.join()
+
+# Cell
+class Metrics(object):
+    """
+    Registry of the metrics of the solves (counters, gauges and histograms with labels) and their sinks.
+    Model.optimize() records its metrics in the module-level registry scop.metrics and emits
+    a record of every solve to the sinks; applications can record their own metrics in the same registry.
+
+    The sinks are set by addSink or, when the first record is emitted, by the environment variable
+    SCOP_METRICS; a comma-separated list of
+    - "prometheus:PATH": Prometheus text format file rewritten after every solve (PrometheusFile),
+    - "http:PORT" (or "http:HOST:PORT"): Prometheus endpoint http://HOST:PORT/metrics (PrometheusHTTP),
+    - "jsonl:PATH": one JSON record per solve appended to PATH (JsonLines).
+    A sink that cannot be opened is replaced by JsonLines("scop_metrics.jsonl").
+
+    Metrics recorded by Model.optimize():
+    - scop_solves_total{status}: Number of solves by the status of the solver.
+    - scop_solve_seconds / scop_solver_seconds: Histograms of the time of optimize() and of the solver itself.
+    - scop_penalty_hard / scop_penalty_soft: Penalty of the last solve.
+    - scop_model_variables / scop_model_constraints / scop_model_terms / scop_model_input_bytes: Size of the last model.
+    - scop_solvers_running: Number of solver processes running in this process.
+    - scop_early_stops_total{reason}: Number of solves stopped early by a stall criterion (see Runtime.stopped).
+    """
+    BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+    def __init__(self, spec=None):
+        self._lock = threading.Lock()
+        self._values = {}  #(name, labels) -> value, or [bucket counts, sum, count] of a histogram
+        self._types = {}   #name -> (type, help)
+        self.sinks = []
+        self._spec = spec  #sinks to add when the first record is emitted (None: SCOP_METRICS)
+
+    def describe(self, name, kind, help=""):
+        """
+        describe(name, kind, help="")
+        Set the type ("counter", "gauge" or "histogram") and the help text of a metric.
+        """
+        self._types[name] = (kind, help)
+
+    def inc(self, name, value=1, **labels):
+        """
+        inc(name, value=1, **labels)
+        Add value to a counter (or a gauge).
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        set(name, value, **labels)
+        Set a gauge.
+        """
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        """
+        observe(name, value, **labels)
+        Add an observation to a histogram with the buckets Metrics.BUCKETS.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._values.get(key)
+            if h is None:
+                h = self._values[key] = [[0] * len(self.BUCKETS), 0., 0]
+            for k, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    h[0][k] += 1
+            h[1] += value
+            h[2] += 1
+
+    def value(self, name, **labels):
+        """
+        value(name, **labels)
+        Return the value of a counter or a gauge (the count of a histogram); 0 if it has not been recorded.
+        """
+        v = self._values.get((name, tuple(sorted(labels.items()))), 0)
+        return v[2] if isinstance(v, list) else v
+
+    def render(self):
+        """
+        render()
+        Return the metrics in the Prometheus text format.
+        """
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join('{0}="{1}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                                  for k, v in items) + "}"
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda item: (item[0][0], item[0][1]))
+            values = [(key, [list(v[0]), v[1], v[2]] if isinstance(v, list) else v) for key, v in values]
+        lines, described = [], set()
+        for (name, labels), v in values:
+            if name not in described:
+                described.add(name)
+                kind, help = self._types.get(name, ("histogram" if isinstance(v, list) else "untyped", ""))
+                if help:
+                    lines.append("# HELP {0} {1}".format(name, help))
+                lines.append("# TYPE {0} {1}".format(name, kind))
+            if isinstance(v, list):
+                for bound, count in zip(self.BUCKETS, v[0]):
+                    lines.append("{0}_bucket{1} {2}".format(name, fmt(labels, [("le", bound)]), count))
+                lines.append("{0}_bucket{1} {2}".format(name, fmt(labels, [("le", "+Inf")]), v[2]))
+                lines.append("{0}_sum{1} {2}".format(name, fmt(labels), v[1]))
+                lines.append("{0}_count{1} {2}".format(name, fmt(labels), v[2]))
+            else:
+                lines.append("{0}{1} {2}".format(name, fmt(labels), v))
+        return "\n".join(lines) + "\n"
+
+    def addSink(self, sink):
+        """
+        addSink(sink)
+        Add a sink; a sink is an object with a method emit(record, metrics) or one of the strings
+        described above. A string whose sink cannot be opened adds the JSON-lines fallback instead.
+        """
+        if isinstance(sink, str):
+            kind, _, arg = sink.partition(":")
+            try:
+                if kind == "prometheus":
+                    sink = PrometheusFile(arg)
+                elif kind == "http":
+                    host, _, port = arg.rpartition(":")
+                    sink = PrometheusHTTP(int(port), host or "127.0.0.1", self)
+                elif kind == "jsonl":
+                    sink = JsonLines(arg)
+                else:
+                    raise ValueError("unknown metrics sink %r" % sink)
+            except (OSError, ValueError) as e:
+                print("metrics: {0}; writing to scop_metrics.jsonl instead".format(e))
+                sink = JsonLines("scop_metrics.jsonl")
+        self.sinks.append(sink)
+        self._spec = ""
+        return sink
+
+    def emit(self, record):
+        """
+        emit(record)
+        Pass a record (dictionary) to the sinks; errors of the sinks are printed and ignored.
+        """
+        if self._spec != "":
+            spec, self._spec = self._spec, ""
+            if spec is None:
+                spec = os.environ.get("SCOP_METRICS", "")
+            for item in spec.split(","):
+                if item.strip():
+                    self.addSink(item.strip())
+        for sink in list(self.sinks):
+            try:
+                sink.emit(record, self)
+            except Exception as e:
+                print("metrics: {0} failed: {1}".format(type(sink).__name__, e))
+
+class PrometheusFile(object):
+    """
+    Sink writing the metrics in the Prometheus text format to a file (e.g., for the textfile collector
+    of the node exporter); the file is replaced atomically after every record.
+    """
+    def __init__(self, path):
+        self.path = path
+        open(path, "a").close()  #fail early if the file cannot be written
+
+    def emit(self, record, metrics):
+        tmp = "{0}.{1}.tmp".format(self.path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(metrics.render())
+        os.replace(tmp, self.path)
+
+class PrometheusHTTP(object):
+    """
+    Sink serving the metrics in the Prometheus text format at http://host:port/metrics
+    from a daemon thread.
+    """
+    def __init__(self, port, host="127.0.0.1", metrics=None):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        sink = self
+        self.metrics = metrics
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = (sink.metrics.render() if sink.metrics is not None else "").encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="scop-metrics", daemon=True).start()
+
+    def emit(self, record, metrics):
+        self.metrics = metrics  #the endpoint is rendered on request
+
+class JsonLines(object):
+    """
+    Sink appending every record as one line of JSON to a file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        open(path, "a").close()  #fail early if the file cannot be written
+
+    def emit(self, record, metrics):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+metrics = Metrics()
+metrics.describe("scop_solves_total", "counter", "Number of Model.optimize() calls by solver status.")
+metrics.describe("scop_solve_seconds", "histogram", "Wall-clock time of Model.optimize().")
+metrics.describe("scop_solver_seconds", "histogram", "Wall-clock time of the solver process.")
+metrics.describe("scop_penalty_hard", "gauge", "Hard penalty of the last solve.")
+metrics.describe("scop_penalty_soft", "gauge", "Soft penalty of the last solve.")
+metrics.describe("scop_model_variables", "gauge", "Variables passed to the solver in the last solve.")
+metrics.describe("scop_model_constraints", "gauge", "Constraints passed to the solver in the last solve.")
+metrics.describe("scop_model_terms", "gauge", "Terms passed to the solver in the last solve.")
+metrics.describe("scop_model_input_bytes", "gauge", "Size of the solver input of the last solve.")
+metrics.describe("scop_solvers_running", "gauge", "Solver processes running in this process.")
+metrics.describe("scop_early_stops_total", "counter", "Solves stopped early by a stall criterion.")
 
 # Cell
 class Variable():
@@ -61,8 +444,8 @@ class Variable():
             raise ValueError("Variable name must be a string")
         #convert illegal characters into _ (underscore)
         self.name   = str(name).translate( _trans )
-        #list(domain); domain name is converted to a string
-        self.domain = [str(d) for d in domain]
+        #shared Domain object; domain name is converted to a string
+        self.domain = Domain.intern(domain)
         self.value  = None #optimal value
 
     def __str__(self):
@@ -70,6 +453,311 @@ class Variable():
             str(self.name), str(self.domain), str(self.value)
             )
 
+# Cell
+class Domain(tuple):
+    """
+    SCOP domain class; an immutable tuple of values (converted to strings).
+    Variables with identical values share one Domain object; use Domain.intern to get it.
+
+    Membership tests and index() use a value -> index dictionary and cost O(1).
+
+    Attributes:
+    - text: Values joined by "," as written in the scop input format.
+    - position: Dictionary that maps each value to its index.
+    """
+    _pool = {} #shared domain objects
+
+    def __new__(cls, values=()):
+        return tuple.__new__(cls, [str(d) for d in values])
+
+    def __init__(self, values=()):
+        self.text = ",".join(self)
+        self.position = {}
+        for k, value in enumerate(self):
+            self.position.setdefault(value, k)
+
+    def __contains__(self, value):
+        return value in self.position
+
+    def index(self, value, *args):
+        if args:
+            return tuple.index(self, value, *args)
+        try:
+            return self.position[value]
+        except (KeyError, TypeError):
+            raise ValueError("{0!r} is not in domain".format(value))
+
+    @classmethod
+    def intern(cls, values=()):
+        """
+        return the shared Domain object of the values
+        """
+        if isinstance(values, Domain):
+            return values
+        key = tuple(str(d) for d in values)
+        dom = cls._pool.get(key)
+        if dom is None:
+            dom = cls._pool[key] = cls(key)
+        return dom
+
+    def __repr__(self):
+        return repr(list(self))
+
+class IndexedVariable(Variable):
+    """
+    Variable of a VariableArray. The name is generated from the prefix of the array and the index
+    when it is needed, and the domain is the (shared) domain of the array.
+
+    The value is kept in the array as the index of the value in the domain of the array.
+
+    Attributes:
+    - array: VariableArray object that the variable belongs to.
+    - index: Tuple of integers; position of the variable in the array.
+    - pos: Position of the variable in the (row-major) flattened array.
+    """
+    def __init__(self, array, index, pos):
+        self.array  = array
+        self.index  = index
+        self.pos    = pos
+        self.domain = array.domain
+
+    @property
+    def name(self):
+        return self.array.name(self.index)
+
+    @property
+    def value(self):
+        code = self.array._codes[self.pos]
+        if code < 0:
+            return None
+        return self.array.domain[code]
+
+    @value.setter
+    def value(self, value):
+        if value is None:
+            self.array._codes[self.pos] = -1
+        else:
+            self.array._codes[self.pos] = self.array.domain.index(str(value))
+
+class VariableArray(object):
+    """
+    Array of variables with an identical domain created by Model.addVariableArray.
+
+    x[i,t] returns the variable object with index (i,t) and slices return (nested) lists of
+    variable objects, e.g. x[i,:] is the list of the variables of row i.
+    Variable objects are created when they are accessed for the first time.
+    The values of the variables are kept as an integer array of the indices of the values in the domain
+    (-1 if there is no value); codes() returns it as a NumPy array and frame() as a categorical DataFrame.
+
+    Attributes:
+    - prefix: Prefix of the variable names; the name of x[i,t] is prefix[i_t].
+    - shape: Tuple of the sizes of the dimensions.
+    - size: Number of variables.
+    - domain: Domain object shared by the variables.
+    """
+    def __init__(self, prefix, shape, domain, varDict):
+        self.prefix = prefix
+        self.shape  = shape
+        self.domain = domain
+        self.varDict = varDict  # variables of the model the array belongs to
+        self.size = 1
+        for n in shape:
+            self.size *= n
+        self.strides = []
+        stride = self.size
+        for n in shape:
+            stride //= n
+            self.strides.append(stride)
+        self._labels = [[str(k) for k in range(n)] for n in shape]
+        self._vars = [None] * self.size
+        self._codes = carray("i", [-1]) * self.size
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __iter__(self):
+        for k in range(self.shape[0]):
+            yield self[k]
+
+    def name(self, index):
+        """
+        return the name of the variable with the index
+        """
+        return "{0}[{1}]".format(self.prefix, "_".join([self._labels[d][k] for d, k in enumerate(index)]))
+
+    def names(self):
+        """
+        generate the names of all the variables in the array (row-major order)
+        """
+        prefix = self.prefix + "["
+        def gen(d, head):
+            if d == len(self.shape) - 1:
+                for label in self._labels[d]:
+                    yield head + label + "]"
+            else:
+                for label in self._labels[d]:
+                    for name in gen(d + 1, head + label + "_"):
+                        yield name
+        return gen(0, prefix)
+
+    def _var(self, index):
+        pos = 0
+        for k, stride in zip(index, self.strides):
+            pos += k * stride
+        var = self._vars[pos]
+        if var is None:
+            var = self._vars[pos] = IndexedVariable(self, index, pos)
+        return var
+
+    def _parse(self, label):
+        """
+        return the index of the variable name prefix[label]; None if label is not a valid index
+        """
+        try:
+            index = tuple(int(k) for k in label.split("_"))
+        except ValueError:
+            return None
+        if len(index) != len(self.shape) or not all(0 <= k < n for k, n in zip(index, self.shape)):
+            return None
+        return index
+
+    def codes(self):
+        """
+        return the values of the variables as a NumPy array of shape self.shape;
+        each entry is the index of the value in self.domain (-1 if the variable has no value).
+        The array shares its memory with the variable array.
+        """
+        import numpy as np
+        return np.frombuffer(self._codes, dtype=np.intc).reshape(self.shape)
+
+    def frame(self, labels=None, index=None, columns=None):
+        """
+        return the values of a two-dimensional array as a pandas DataFrame of categorical columns.
+        The codes of each column are copied by pandas; the frame does not share memory with the array.
+
+        Arguments:
+        - labels (optional): Categories shown for the values of the domain; default is the domain.
+        - index (optional): Row labels.
+        - columns (optional): Column labels.
+        """
+        import pandas as pd
+        if len(self.shape) != 2:
+            raise ValueError("frame() is defined for two-dimensional arrays")
+        if labels is None:
+            labels = list(self.domain)
+        if len(labels) != len(self.domain):
+            raise ValueError("labels must have the same size as the domain")
+        if columns is None:
+            columns = range(self.shape[1])
+        codes = self.codes()
+        return pd.DataFrame(
+            {col: pd.Categorical.from_codes(codes[:, k], categories=labels) for k, col in enumerate(columns)},
+            index=index)
+
+    def __getitem__(self, key):
+        if type(key) != tuple:
+            key = (key,)
+        if len(key) > len(self.shape):
+            raise IndexError("too many indices for an array with {0} dimensions".format(len(self.shape)))
+        axes = []
+        for k, n in zip(key, self.shape):
+            if isinstance(k, slice):
+                axes.append(range(*k.indices(n)))
+            else:
+                k = int(k)
+                if k < 0:
+                    k += n
+                if not 0 <= k < n:
+                    raise IndexError("index {0} is out of bounds for size {1}".format(k, n))
+                axes.append(k)
+        for n in self.shape[len(key):]:
+            axes.append(range(n))
+        return self._select(axes, 0, ())
+
+    def _select(self, axes, d, index):
+        if d == len(axes):
+            return self._var(index)
+        axis = axes[d]
+        if isinstance(axis, range):
+            return [self._select(axes, d + 1, index + (k,)) for k in axis]
+        return self._select(axes, d + 1, index + (axis,))
+
+    def variables(self):
+        """
+        return the variable objects created so far
+        """
+        return [var for var in self._vars if var is not None]
+
+    def __str__(self):
+        return "variable array {0}{1}:{2}".format(self.prefix, list(self.shape), str(self.domain))
+
+def _violation(con, lhs):
+    """
+    return the violation of the constraint for the left-hand side lhs
+    """
+    if isinstance(con, Alldiff):
+        return lhs
+    if con.direction == "<=":
+        return max(lhs - con.rhs, 0)
+    if con.direction == ">=":
+        return max(con.rhs - lhs, 0)
+    return abs(lhs - con.rhs)
+
+def _domainOf(var, allvars):
+    """
+    return the domain of var if var is a variable in allvars (varDict of a model)
+    """
+    if isinstance(var, IndexedVariable):
+        if var.array.varDict is not allvars:
+            raise NameError("no variable in the problem instance named %r" % var.name)
+        return var.domain
+    if var.name not in allvars:
+        raise NameError("no variable in the problem instance named %r" % var.name)
+    return allvars[var.name].domain
+
+_opaque = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType, types.CodeType)
+
+def sizeof(obj, seen=None, stop=(), sizers=()):
+    """
+    return the bytes of obj and of the objects it holds (sys.getsizeof traversal of containers,
+    instance dictionaries and slots); objects whose id is in seen are not counted again (their ids are
+    added to seen) and instances of the classes in stop are neither counted nor traversed.
+    sizers is a sequence of (class, function) pairs: an instance of the class is measured by
+    function(obj, seen) instead of the traversal (e.g., (Model, lambda m, seen: m.memoryReport(seen)["total"])).
+    Model.memoryReport and the memory report of the app are based on it.
+    """
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, stop):
+            continue
+        sizer = next((f for (cls, f) in sizers if isinstance(o, cls)), None)
+        if sizer is not None:
+            total += sizer(o, seen)
+            seen.add(id(o))
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, _opaque):
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif getattr(o, "base", None) is not None and hasattr(o, "nbytes"):
+            total += o.nbytes  #NumPy view; getsizeof does not include the data
+        d = getattr(o, "__dict__", None)
+        if isinstance(d, dict):
+            stack.append(d)
+        for k in getattr(type(o), "__slots__", ()):
+            if hasattr(o, k):
+                stack.append(getattr(o, k))
+    return total
+
 # Cell
 class Model(object):
     """
@@ -80,30 +768,263 @@ class Model(object):
     - variables: Set of variable objects in the model.
     - Params:  Object including all the parameters of the model.
     - varDict: Dictionary that maps variable names to the variable object.
+    - validation: When constraints are checked against the variables;
+            "eager" (in addConstraint; default), "deferred" (in one pass by validate(), called by optimize())
+            or "off" (never; for trusted model builders).
+    - arrays: Dictionary that maps prefixes to the variable arrays (see Model.addVariableArray).
+    - fixed: List of variables fixed (and removed from the model) by presolve.
+    - PresolveStats: Dictionary of the statistics of the last presolve (None if not presolved).
+    - template: Model that the model was cloned from (None if the model is not a clone; see Model.clone).
+    - Runtime: Runtime object with the time breakdown of the last optimize() (None if not optimized).
+    - Trace: Trace object with the penalty trajectory of the last optimize() (None if not optimized).
 
     """
-    def __init__(self,name=""):
+    def __init__(self,name="",validation="eager"):
+        if validation not in ["eager", "deferred", "off"]:
+            raise ValueError("validation should be one of 'eager', 'deferred', or 'off'")
         self.name = name
+        self.validation = validation
+        self._unchecked = []  # constraints whose validation is deferred
         self.constraints = [] # set of constraints is maintained by a list
         self.variables = []   # set of variables is maintained by a list
         self.Params=Parameters()
         self.varDict={}       # dictionary that maps variable names to their domains
+        self.arrays = {}      # dictionary that maps prefixes to variable arrays
         self.Status = 10      # unsolved
+        self.fixed = []       # variables fixed by presolve
+        self.PresolveStats = None
+        self.template = None  # model that this model was cloned from
+        self.Runtime = None
+        self.Trace = None
+        self._hooks = []      # functions called as hook(phase, seconds, runtime) by optimize
+        self._version = 0     # incremented by every change of the constraints of the model (see invertedIndex)
+        self._owns_constraints = True  # False while a clone shares the constraint list of the model it was cloned from
     def __str__(self):
         """
             return the information of the problem
             constraints are expanded and are shown in a readable format
         """
         ret = ["Model:"+str(self.name) ]
-        ret.append( "number of variables = {0} ".format(len(self.variables)) )
+        ret.append( "number of variables = {0} ".format(
+            len(self.variables) + sum(array.size for array in self.arrays.values())) )
         ret.append( "number of constraints= {0} ".format(len(self.constraints)) )
         for v in self.variables:
             ret.append(str(v))
+        for array in self.arrays.values():
+            ret.append(str(array))
 
         for c in self.constraints:
-            ret.append("{0} :LHS ={1} ".format(str(c)[:-1], str(c.lhs)) )
+            ret.append("{0} :LHS ={1} ".format(str(self._effective(c))[:-1], str(self.getLhs(c))) )
         return " \n".join(ret)
 
+    def clone(self):
+        """
+        clone ()
+        Return a copy-on-write clone of the model.
+        The clone shares the variables, the domains and the terms of the constraints with the model
+        (its template), and keeps only its own parameters, overrides (Model.setWeight, Model.setRhs,
+        Model.fix) and solution, so cloning costs the same for any size of the model.
+        Values and left-hand sides of a clone are read by Model.getValue, Model.getLhs and
+        Model.getCodes; the variable and constraint objects keep those of the template.
+        The template should be presolved (if needed) before it is cloned and not be changed afterwards.
+        Variables cannot be added to a clone; constraints can.
+
+        Return value:
+        New model object.
+
+        Example usage:
+        m = base.clone()
+        m.setWeight(F, 20)       # F: constraint or WindowFamily of base
+        m.Params.TimeLimit = 10
+        sol, violated = m.optimize()
+        """
+        m = Model.__new__(Model)
+        m.__dict__.update(self.__dict__)
+        m.template = self if self.template is None else self.template
+        m.Params = copy.copy(self.Params)
+        m.Status = 10
+        m._unchecked = []
+        m._owns_constraints = False                           #the list is copied by the first write (_ownConstraints)
+        #copies of the overridden constraints and families, so that a clone of a clone does not change its parent
+        families = dict((id(f), copy.copy(f)) for f in getattr(self, "_families", {}).values())
+        m._families = dict((k, families[id(f)]) for k, f in getattr(self, "_families", {}).items())  #id(family) -> copy with overrides
+        m._overrides = {}                                     #id(constraint) -> copy with overrides
+        for k, c in getattr(self, "_overrides", {}).items():
+            c = m._overrides[k] = copy.copy(c)
+            if isinstance(c, Window) and id(c.family) in families:
+                c.family = families[id(c.family)]
+        m._fix = dict(getattr(self, "_fix", {}))              #id(variable) -> (variable, fixed value)
+        m._values, m._codes, m._lhs = {}, {}, {}
+        m.Runtime = None
+        m.Trace = None
+        m._hooks = list(getattr(self, "_hooks", []))
+        return m
+
+    def _effective(self, con):
+        """
+        return the constraint with the overrides of the (cloned) model applied
+        """
+        if self.template is None:
+            return con
+        c = self._overrides.get(id(con))
+        if c is not None:
+            return c
+        if isinstance(con, Window) and id(con.family) in self._families:
+            c = copy.copy(con)
+            c.family = self._families[id(con.family)]
+            return c
+        return con
+
+    def _override(self, con):
+        c = self._overrides.get(id(con))
+        if c is None:
+            c = self._overrides[id(con)] = copy.copy(self._effective(con))
+        return c
+
+    def setWeight(self, con, weight):
+        """
+        setWeight ( con, weight )
+        Set the weight of a constraint or a WindowFamily; in a clone, only the clone sees the new weight.
+        """
+        self._version += 1
+        if self.template is None:
+            con.setWeight(weight)
+        elif isinstance(con, WindowFamily):
+            family = self._families[id(con)] = copy.copy(self._families.get(id(con), con))
+            family.weight = str(weight)
+            for c in self._overrides.values():
+                if isinstance(c, Window) and c.family.name == con.name:
+                    c.family = family
+        elif isinstance(con, Window):
+            self.setWeight(con.family, weight)
+        else:
+            self._override(con).weight = str(weight)
+
+    def setRhs(self, con, rhs):
+        """
+        setRhs ( con, rhs )
+        Set the right-hand side of a Linear or Quadratic constraint; in a clone, only the clone sees it.
+        """
+        self._version += 1
+        if self.template is None:
+            con.setRhs(rhs)
+        else:
+            if type(rhs) != type(1):
+                raise ValueError("Right-hand-side must be an integer.")
+            self._override(con).rhs = rhs
+
+    def fix(self, var, value):
+        """
+        fix ( var, value )
+        Fix the variable to the value (None to release); in a clone, only the clone sees it.
+        A fixed variable is passed to the solver with a hard constraint X[var,value] = 1.
+        """
+        if value is not None and str(value) not in var.domain:
+            raise NameError("no value %r for the variable named %r" % (value, var.name))
+        if self.template is None:
+            raise ValueError("fix() is available for clones; set the domain of the variable instead")
+        self._version += 1
+        if value is None:
+            self._fix.pop(id(var), None)
+        else:
+            self._fix[id(var)] = (var, str(value))
+
+    def getValue(self, var):
+        """
+        getValue ( var )
+        return the value of the variable in the solution of this model (None if there is no value)
+        """
+        if self.template is None:
+            return var.value
+        if isinstance(var, IndexedVariable):
+            codes = self._codes.get(var.array.prefix)
+            if codes is None or codes[var.pos] < 0:
+                return None
+            return var.array.domain[codes[var.pos]]
+        return self._values.get(var.name)
+
+    def getLhs(self, con):
+        """
+        getLhs ( con )
+        return the left-hand side of the constraint evaluated by the last optimize() of this model
+        """
+        if self.template is None:
+            return con.lhs
+        return self._lhs.get(id(con), 0)
+
+    def getViolation(self, con):
+        """
+        getViolation ( con )
+        return the violation of the constraint in the last solution of this model:
+        the amount by which the left-hand side misses the right-hand side (Linear, Quadratic)
+        or the number of duplicated values (Alldiff); 0 for the constraints removed by presolve
+        """
+        lhs = con.lhs if self.template is None else self._lhs.get(id(con), con.lhs)
+        if lhs is None:  #removed by presolve; never violated
+            return 0
+        return _violation(self._effective(con), lhs)
+
+    def rescore(self, weights=None):
+        """
+        rescore ( weights=None )
+        Re-evaluate the penalty of the last solution of this model with other weights, without solving again;
+        the violations come from the left-hand sides evaluated by optimize(), so this costs O(number of constraints).
+
+        Arguments:
+        - weights (optional): Dictionary that maps constraints or WindowFamily objects to their new weights
+            ("inf" for hard constraints); the other constraints keep their weights. The model is not changed.
+
+        Return value:
+        Tuple (hard, soft, breakdown) of the hard and soft penalties and a dictionary that maps each family
+        (the name of the WindowFamily, otherwise the constraint name up to "[") to [violation, soft penalty].
+
+        Example usage:
+        sol, violated = model.optimize()
+        hard, soft, breakdown = model.rescore({F: 100})   # F: WindowFamily of the model
+        """
+        new = {}
+        for key, weight in (weights or {}).items():
+            if isinstance(key, WindowFamily):
+                for con in key.constraints:
+                    new[id(con)] = weight
+            else:
+                new[id(key)] = weight
+
+        hard, soft, breakdown = 0, 0, {}
+        for con in self.constraints:
+            violation = self.getViolation(con)
+            if isinstance(con, Window):
+                family = con.family.name
+            else:
+                family = con.name.split("[")[0]
+            entry = breakdown.setdefault(family, [0, 0])
+            entry[0] += violation
+            if violation == 0:
+                continue
+            weight = new.get(id(con))
+            if weight is None:
+                weight = self._effective(con).weight
+            if str(weight) == "inf":
+                hard += violation
+            else:
+                entry[1] += int(weight) * violation
+                soft += int(weight) * violation
+        return hard, soft, breakdown
+
+    def getCodes(self, array):
+        """
+        getCodes ( array )
+        return the values of a variable array in the solution of this model as a NumPy array
+        (see VariableArray.codes)
+        """
+        if self.template is None:
+            return array.codes()
+        import numpy as np
+        codes = self._codes.get(array.prefix)
+        if codes is None:
+            codes = carray("i", [-1]) * array.size
+        return np.frombuffer(codes, dtype=np.intc).reshape(array.shape)
+
     def update(self):
         """
         prepare a string representing the current model in the scop input format
@@ -111,13 +1032,27 @@ class Model(object):
         f  = [ ]
         #variable declarations
         for var in self.variables:
-            domainList = ",".join([str(i) for i in var.domain])
-            f.append( "variable %s in { %s } \n" % (var.name, domainList) )
+            f.append( "variable %s in { %s } \n" % (var.name, var.domain.text) )
+        fixed = set(id(var) for var in self.fixed)
+        for array in self.arrays.values():
+            text = array.domain.text
+            for var, name in zip(array._vars, array.names()):
+                if var is None:
+                    f.append( "variable %s in { %s } \n" % (name, text) )
+                elif id(var) not in fixed:
+                    f.append( "variable %s in { %s } \n" % (name, var.domain.text) )
         #target value declaration
         f.append( "target = %s \n" % str(self.Params.Target) )
         #constraint declarations
-        for con in self.constraints:
-            f.append(str(con))
+        if self.template is None:
+            for con in self.constraints:
+                f.append(str(con))
+        else:
+            for con in self.constraints:
+                f.append(str(self._effective(con)))
+            #variables fixed in the clone
+            for k, (var, value) in enumerate(self._fix.values()):
+                f.append("__FIX[{0}]: weight= inf type=linear 1({1},{2}) =1\n".format(k, var.name, value))
         return " ".join(f)
 
     def addVariable(self, name="", domain=[]):
@@ -138,11 +1073,14 @@ class Model(object):
         x = model.addVariable("var",["A","B","C"])        # arguments by position
 
         """
+        if self.template is not None:
+            raise ValueError("variables cannot be added to a clone")
         var =Variable(name,domain)
         # keep variable names using the dictionary varDict
         # to check the validity of constraints later
         # check the duplicated name
-        if var.name in self.varDict:
+        prefix, sep, rest = var.name.partition("[")
+        if var.name in self.varDict or (sep and prefix in self.arrays):  #names prefix[...] belong to the array
             raise ValueError("duplicate key '{0}' found in variable name".format(var.name))
         else:
             self.variables.append(var)
@@ -170,11 +1108,92 @@ class Model(object):
         """
         if type(names)!=type([]):
             raise TypeError("The first argument (names) must be a list.")
+        domain = Domain.intern(domain)
         varlist=[]
         for var in names:
             varlist.append(self.addVariable(var,domain))
         return varlist
 
+    def addVariableArray(self, shape, domain=[], prefix="x"):
+        """
+        - addVariableArray ( shape, domain=[], prefix="x" )
+          Add an array of variables with an identical domain.
+          The domain object is shared and the names (prefix[i_t]) are generated from the indices when needed.
+
+        Arguments:
+        - shape: Size of the array; a positive integer or a tuple of positive integers.
+        - domain: Domain (list of values) of new variables. Each value must be a string or numeric object.
+        - prefix: Prefix of the variable names. A string object without "[" and "]".
+
+        Return value:
+        VariableArray object; x[i,t] is a variable object and x[i,:] is a list of variable objects.
+
+        Example usage:
+        x = model.addVariableArray((n_staff, n_day), ["off","early","late"], "x")
+        L.addTerms(1, x[0,3], "early")
+        """
+        if self.template is not None:
+            raise ValueError("variables cannot be added to a clone")
+        if type(shape) == type(1):
+            shape = (shape,)
+        shape = tuple(shape)
+        if len(shape) == 0 or any(type(n) != type(1) or n <= 0 for n in shape):
+            raise ValueError("Shape must be a positive integer or a tuple of positive integers.")
+        if type(prefix) != str or prefix == "" or "[" in prefix or "]" in prefix:
+            raise ValueError("Prefix must be a non-empty string without '[' and ']'")
+        prefix = prefix.translate( _trans )
+        if prefix in self.arrays or any(name.startswith(prefix + "[") for name in self.varDict):
+            raise ValueError("duplicate key '{0}' found in variable name".format(prefix))
+        array = VariableArray(prefix, shape, Domain.intern(domain), self.varDict)
+        self.arrays[prefix] = array
+        return array
+
+    def getVariable(self, name):
+        """
+        getVariable ( name )
+        return the variable object of the (converted) name; None if there is no such variable.
+        """
+        var = self.varDict.get(name)
+        if var is None:
+            prefix, sep, rest = name.partition("[")
+            array = self.arrays.get(prefix)
+            if array is not None and rest[-1:] == "]":
+                index = array._parse(rest[:-1])
+                if index is not None:
+                    var = array[index]
+        return var
+
+    def _setValue(self, name, value):
+        """
+        set the value of the variable of the name; values of arrays are set without creating variable objects.
+        return False if there is no such variable.
+        """
+        var = self.varDict.get(name)
+        if var is not None:
+            if self.template is None:
+                var.value = value
+            else:
+                self._values[name] = value
+            return True
+        prefix, sep, rest = name.partition("[")
+        array = self.arrays.get(prefix)
+        if array is None or rest[-1:] != "]":
+            return False
+        index = array._parse(rest[:-1])
+        code = array.domain.position.get(value)
+        if index is None or code is None:
+            return False
+        pos = 0
+        for k, stride in zip(index, array.strides):
+            pos += k * stride
+        if self.template is None:
+            array._codes[pos] = code
+        else:
+            if prefix not in self._codes:
+                self._codes[prefix] = carray("i", [-1]) * array.size
+            self._codes[prefix][pos] = code
+        return True
+
     def addConstraint(self, con):
         """
         addConstraint ( con )
@@ -189,6 +1208,15 @@ class Model(object):
         """
         if not isinstance(con,Constraint):
             raise TypeError("error: %r should be a subclass of Constraint" % con)
+        if self.fixed:
+            self._checkFixed(con)
+        self._ownConstraints()
+
+        if self.validation != "eager":
+            if self.validation == "deferred":
+                self._unchecked.append(con)
+            self.constraints.append(con)
+            return
 
         #check the feasibility of the constraint added in the class con
         try:
@@ -197,28 +1225,732 @@ class Model(object):
         except NameError:
             raise  NameError("Consrtaint %r has an error " % con )
 
+    def _ownConstraints(self):
+        """
+        prepare the constraint list for a change: a clone copies the list it shares with the model
+        it was cloned from before the first write (copy on write); the version of the model is incremented
+        """
+        if not getattr(self, "_owns_constraints", True):
+            self.constraints = list(self.constraints)
+            self._owns_constraints = True
+        self._version += 1
+        return self.constraints
+
+    def _checkFixed(self, con):
+        """
+        raise ValueError if the constraint refers to a variable fixed (and removed) by presolve
+        """
+        if isinstance(con,Alldiff):
+            vars = con.variables
+        elif isinstance(con,Quadratic):
+            vars = [var for term in con.terms for var in (term[1], term[3])]
+        else:
+            vars = [term[1] for term in con.terms]
+        fixed = set(id(var) for var in self.fixed)
+        for var in vars:
+            if id(var) in fixed:
+                raise ValueError("constraint %r refers to the variable %r fixed by presolve; "
+                                 "presolve must be the last edit of the model" % (con.name, var.name))
+
+    def validate(self):
+        """
+        validate ()
+        Check the constraints whose validation was deferred (Model.validation="deferred") in one pass.
+        It is called by optimize().
+
+        Example usage:
+        model = Model("shift", validation="deferred")
+        ... # add variables and constraints
+        model.validate()
+        """
+        unchecked, self._unchecked = self._unchecked, []
+        for con in unchecked:
+            try:
+                con.feasible(self.varDict)
+            except NameError:
+                raise  NameError("Consrtaint %r has an error " % con )
+
+    def addWindowConstraints(self, name, vars, values, window, rhs, weight=1, direction="<=", coeff=1):
+        """
+        addWindowConstraints ( name, vars, values, window, rhs, weight=1, direction="<=", coeff=1 )
+        Add a family of sliding-window linear constraints to the model.
+        For each row of vars and each run of window consecutive columns, one constraint
+          sum ( coeff X[var,value] for var in the run, value in values ) (direction) rhs
+        is generated. The constraints of a row share one term list, and the family has a single weight.
+        Each row is checked once, following Model.validation: in this call ("eager"), by validate() ("deferred"),
+        or not at all ("off").
+
+        Arguments:
+        - name: Name of the family. Constraint names are name[row,start] (converted as usual).
+        - vars: Two-dimensional sequence (rows x columns) of variable objects, e.g. staff x days.
+        - values: Value (or list of values) counted for each variable.
+        - window: Length of the window. Positive integer.
+        - rhs: Right-hand-side constant of each constraint.
+        - weight (optional): Weight of the whole family; positive integer or 'inf'.
+        - direction (optional): "<=" (default) or ">=" or "=".
+        - coeff (optional): Integer coefficient of each term. Default = 1.
+
+        Return value:
+        WindowFamily object.
+
+        Example usage:
+        #at least one day off in any 6 consecutive days
+        F = model.addWindowConstraints("max5", x, "off", 6, 1, weight=10, direction=">=")
+        """
+        if type(window) != type(1) or window <= 0:
+            raise ValueError("Window length must be a positive integer.")
+        if type(coeff) != type(1):
+            raise ValueError("Coefficient must be an integer.")
+        if type(values) != type([]):
+            values = [values]
+        values = [str(v) for v in values]
+        nv = len(values)
+
+        family = WindowFamily(name, weight, window, rhs, direction)
+        constraints = self._ownConstraints()
+        for i, row in enumerate(vars):
+            row = list(row)
+            terms = [(coeff, var, value) for var in row for value in values]
+            #check the row once instead of every window
+            check = Linear(family.name, weight, rhs, direction)
+            check.terms = terms
+            if self.fixed:
+                self._checkFixed(check)
+            if self.validation == "eager":
+                try:
+                    check.feasible(self.varDict)
+                except NameError:
+                    raise NameError("Constraint family %r has an error " % family.name)
+            elif self.validation == "deferred":
+                self._unchecked.append(check)
+            for t in range(len(row) - window + 1):
+                con = Window(family, "{0}[{1},{2}]".format(name, i, t), terms, t*nv, (t+window)*nv)
+                family.constraints.append(con)
+                constraints.append(con)
+        return family
+
+    def _size(self):
+        """
+        return the size of the model as a dictionary
+        """
+        fixed = set(id(var) for var in self.fixed)
+        variables, values = len(self.variables), sum(len(var.domain) for var in self.variables)
+        for array in self.arrays.values():
+            for var in array._vars:
+                if var is None:
+                    variables, values = variables + 1, values + len(array.domain)
+                elif id(var) not in fixed:
+                    variables, values = variables + 1, values + len(var.domain)
+        return {
+            "variables": variables,
+            "values": values,
+            "constraints": len(self.constraints),
+            "terms": sum(len(con.terms) for con in self.constraints if not isinstance(con,Alldiff)),
+            }
+
+    def memoryReport(self, seen=None):
+        """
+        memoryReport ( seen=None )
+        Return the memory used by the model (in bytes) by category, measured by a sys.getsizeof traversal;
+        objects shared by several categories are counted once, in the first category.
+        - domains: Domain objects (values and value -> index dictionaries).
+        - text: Text cached for the solver input (Domain.text).
+        - names: Names of the variables, the constraints, the families and the labels of the arrays.
+        - variables: Variable objects, variable arrays (including their values) and the variable dictionary.
+        - terms: Terms of the constraints (term lists, views and snapshot arrays) and Alldiff variable sets.
+        - constraints: Constraint and WindowFamily objects and the constraint list.
+        - index: Inverted index cached by Model.invertedIndex().
+        - overlay: Overrides and solution of a clone (see Model.clone).
+        - other: Parameters, presolve statistics, runtime and other attributes.
+        - total: Sum of the categories.
+        For a clone, the objects shared with the template are not counted; their total is "shared".
+        The traversal visits every object of the model; it takes about twice as long as Model.update().
+
+        Arguments:
+        - seen (optional): Set of the ids of objects already counted (e.g., by a report of several models);
+            they are not counted again, and the ids of the objects counted here are added.
+
+        Return value:
+        Dictionary that maps the categories to the bytes.
+
+        Example usage:
+        for category, size in model.memoryReport().items():
+            print(category, size)
+        """
+        if seen is None:
+            seen = set()
+        shared = None
+        if self.template is not None:
+            shared = self.template._memory(seen)["total"]
+        report = self._memory(seen)
+        if shared is not None:
+            report["shared"] = shared
+        return report
+
+    def _memory(self, seen):
+        """
+        body of memoryReport(); the ids of the counted objects are added to seen
+        """
+        report = dict.fromkeys(["domains", "text", "names", "variables", "terms", "constraints",
+                                "index", "overlay", "other"], 0)
+        model = (Model, Variable, VariableArray, Constraint, WindowFamily, Domain)
+        cons = self.constraints
+        families = {}
+        for con in cons:
+            if isinstance(con, Window):
+                families[id(con.family)] = con.family
+        domains = {}
+        for var in self.variables:
+            domains[id(var.domain)] = var.domain
+        for array in self.arrays.values():
+            domains[id(array.domain)] = array.domain
+            for var in array._vars:
+                if var is not None:
+                    domains[id(var.domain)] = var.domain
+
+        for dom in domains.values():
+            report["text"] += sizeof(dom.text, seen)
+        for dom in domains.values():
+            report["domains"] += sizeof(dom, seen, model[:-1])
+
+        for var in self.variables:
+            report["names"] += sizeof(var.name, seen)
+        for array in self.arrays.values():
+            report["names"] += sizeof(array.prefix, seen) + sizeof(array._labels, seen)
+        for con in cons:
+            report["names"] += sizeof(con.name, seen)
+        for family in families.values():
+            report["names"] += sizeof(family.name, seen)
+
+        stop = (Model, Constraint, WindowFamily, Domain)
+        report["variables"] += sizeof(self.variables, seen, stop) + sizeof(self.varDict, seen, stop)
+        report["variables"] += sizeof(self.arrays, seen, stop) + sizeof(self.fixed, seen, stop)
+
+        stop = model
+        for con in cons:
+            if isinstance(con, Alldiff):
+                report["terms"] += sizeof(con.variables, seen, stop)
+            else:
+                report["terms"] += sizeof(con.terms, seen, stop)
+
+        stop = (Model, Variable, VariableArray, Domain)
+        report["constraints"] += sizeof(cons, seen, stop)
+        for family in families.values():
+            report["constraints"] += sizeof(family, seen, stop)
+
+        if "_index" in self.__dict__:
+            report["index"] += sizeof(self._index, seen, model)
+        for key in ["_overrides", "_families", "_fix", "_values", "_codes", "_lhs"]:
+            if key in self.__dict__:
+                report["overlay"] += sizeof(self.__dict__[key], seen, stop)
+        report["other"] += sizeof(self, seen, model[1:])
+        report["total"] = sum(report.values())
+        return report
+
+    def presolve(self):
+        """
+        presolve ()
+        Shrink the model before it is passed to the solver.
+
+        - duplicate (variable, value) terms of a constraint are merged and zero terms are removed;
+        - domains are tightened by hard (weight='inf') constraints on a single variable;
+        - variables with a single value are fixed; they are removed from the model (see Model.fixed)
+          and their terms are moved to the right-hand side;
+        - constraints that are never violated (given the domains) are removed;
+        - soft constraints left without terms and always violated are removed ("infeasible" in the statistics);
+          a hard one raises ValueError.
+        Variables in Alldiff constraints are kept intact since their value indices matter.
+        The left-hand sides evaluated by optimize() refer to the presolved constraints.
+        Presolve must be the last edit of the model: constraints on the fixed variables cannot be added
+        afterwards (ValueError), and terms added to existing constraints are not folded.
+
+        Return value:
+        Dictionary of the statistics; "before" and "after" hold the sizes of the model.
+        The dictionary is also kept in Model.PresolveStats.
+
+        Example usage:
+        stats = model.presolve()
+        """
+        if self.template is not None:
+            raise ValueError("a clone cannot be presolved; presolve the template before cloning")
+        stats = {"before": self._size(), "merged": 0, "zeros": 0, "tightened": 0, "fixed": 0, "redundant": 0, "infeasible": 0}
+        self.__dict__.pop("_index", None)  #terms are rewritten below
+        self._version += 1
+
+        keep = set()  #variables in Alldiff constraints
+        quad = set()  #variables in Quadratic constraints; they are not fixed
+        for con in self.constraints:
+            if isinstance(con,Alldiff):
+                keep.update(id(var) for var in con.variables)
+            elif isinstance(con,Quadratic):
+                for (coeff,var1,value1,var2,value2) in con.terms:
+                    quad.add(id(var1))
+                    quad.add(id(var2))
+        fixed = {}    #id(var) -> fixed value
+
+        changed = True
+        while changed:
+            changed = False
+            cons = []
+            for con in self.constraints:
+                if isinstance(con,Linear):
+                    terms, rhs = {}, con.rhs
+                    n = 0
+                    for (coeff,var,value) in con.terms:
+                        n += 1
+                        if id(var) in fixed:
+                            if value == fixed[id(var)]:
+                                rhs -= coeff
+                            continue
+                        key = (id(var), value)
+                        if key in terms:
+                            terms[key][0] += coeff
+                            stats["merged"] += 1
+                        else:
+                            terms[key] = [coeff, var, value]
+                    newterms = []
+                    for (coeff,var,value) in terms.values():
+                        if coeff == 0 or value not in var.domain:
+                            stats["zeros"] += 1
+                        else:
+                            newterms.append((coeff,var,value))
+                    if len(newterms) != n:
+                        con.terms = newterms
+                        con.rhs = rhs
+
+                    #range of the left-hand side
+                    coeffs = {}  #id(var) -> (var, {value: coeff})
+                    for (coeff,var,value) in con.terms:
+                        coeffs.setdefault(id(var), (var, {}))[1][value] = coeff
+                    lo = hi = 0
+                    for (var, c) in coeffs.values():
+                        lo += min((c.get(d, 0) for d in var.domain), default=0)
+                        hi += max((c.get(d, 0) for d in var.domain), default=0)
+                    if (con.direction == "<=" and hi <= con.rhs) or (con.direction == ">=" and lo >= con.rhs) \
+                       or (con.direction == "=" and lo == hi == con.rhs):
+                        stats["redundant"] += 1
+                        con.lhs = None  #not evaluated by optimize() (see Model.getViolation)
+                        continue
+                    if not con.terms:
+                        #every term was on fixed variables and the constant left-hand side violates the constraint
+                        if con.weight == "inf":
+                            raise ValueError("hard constraint %r is infeasible: its variables are fixed" % con.name)
+                        stats["infeasible"] += 1
+                        con.lhs = None
+                        continue
+
+                    #hard constraint on a single variable
+                    if con.weight == "inf" and len(coeffs) == 1:
+                        (var, c), = coeffs.values()
+                        if id(var) not in keep:
+                            if con.direction == "<=":
+                                domain = [d for d in var.domain if c.get(d, 0) <= con.rhs]
+                            elif con.direction == ">=":
+                                domain = [d for d in var.domain if c.get(d, 0) >= con.rhs]
+                            else:
+                                domain = [d for d in var.domain if c.get(d, 0) == con.rhs]
+                            if 0 < len(domain) < len(var.domain):
+                                stats["tightened"] += len(var.domain) - len(domain)
+                                var.domain = Domain.intern(domain)
+                                changed = True
+                elif isinstance(con,Quadratic):
+                    terms = {}
+                    n = 0
+                    for (coeff,var1,value1,var2,value2) in con.terms:
+                        n += 1
+                        key = (id(var1), value1, id(var2), value2)
+                        if key in terms:
+                            terms[key][0] += coeff
+                            stats["merged"] += 1
+                        else:
+                            terms[key] = [coeff, var1, value1, var2, value2]
+                    newterms = []
+                    for (coeff,var1,value1,var2,value2) in terms.values():
+                        if coeff == 0 or value1 not in var1.domain or value2 not in var2.domain:
+                            stats["zeros"] += 1
+                        else:
+                            newterms.append((coeff,var1,value1,var2,value2))
+                    if len(newterms) != n:
+                        con.terms = newterms
+                cons.append(con)
+            self.constraints = cons
+
+            #fix the variables with a single value
+            for var in self.variables + [var for array in self.arrays.values() for var in array.variables()]:
+                if len(var.domain) == 1 and id(var) not in fixed and id(var) not in keep and id(var) not in quad:
+                    fixed[id(var)] = var.domain[0]
+                    var.value = var.domain[0]
+                    self.fixed.append(var)
+                    stats["fixed"] += 1
+                    changed = True
+
+        if fixed:
+            self.variables = [var for var in self.variables if id(var) not in fixed]
+            for var in self.fixed:
+                self.varDict.pop(var.name, None)
+
+        stats["after"] = self._size()
+        self.PresolveStats = stats
+        if self.Params.OutputFlag:
+            print("presolve: ")
+            for key in ["variables", "values", "constraints", "terms"]:
+                print("  {0}: {1} -> {2}".format(key, stats["before"][key], stats["after"][key]))
+        return stats
+
+    def invertedIndex(self):
+        """
+        invertedIndex ()
+        Return the inverted index of the model: a dictionary that maps each variable name
+        to the list of the constraints that the variable appears in, as pairs (constraint, entries):
+        - Linear: entries is a list of (coeff, value) of the terms of the variable;
+        - Quadratic: entries is a list of (coeff, value, other variable, other value);
+        - Alldiff: entries is None.
+        The index is built once per model (clones share the index of their template) and kept
+        until the constraints change: the cache key is the version of the model (incremented by addConstraint,
+        addWindowConstraints, presolve, setWeight, setRhs and fix) and Constraint.VERSION (incremented by
+        addTerms, setRhs, setDirection, setWeight and Alldiff.addVariable of any constraint).
+        Terms assigned directly (con.terms = ...) are not tracked. Variables fixed by presolve are not in the index.
+        """
+        owner = self if self.template is None else self.template
+        if self.constraints is not owner.constraints:
+            #the clone has its own constraints
+            owner = self
+        cached = owner.__dict__.get("_index")
+        version = (getattr(owner, "_version", 0), len(owner.constraints), Constraint.VERSION)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        index = {}
+        def entry(var, con, item):
+            cons = index.setdefault(var.name, [])
+            if cons and cons[-1][0] is con:
+                cons[-1][1].append(item)
+            else:
+                cons.append((con, [item]))
+
+        for con in owner.constraints:
+            if isinstance(con, Linear):
+                for (coeff,var,value) in con.terms:
+                    entry(var, con, (coeff, value))
+            elif isinstance(con, Quadratic):
+                for (coeff,var1,value1,var2,value2) in con.terms:
+                    entry(var1, con, (coeff, value1, var2, value2))
+                    if var2.name != var1.name:
+                        entry(var2, con, (coeff, value2, var1, value1))
+            elif isinstance(con, Alldiff):
+                for var in con.variables:
+                    index.setdefault(var.name, []).append((con, None))
+        owner._index = (version, index)
+        return index
+
+    def save(self, path):
+        """
+        save ( path )
+        Save a snapshot of the model (variables, constraints and parameters; not the solution)
+        in the directory path.
+        The terms are stored as integer arrays (NumPy .npy files) and the names and domains as
+        tables in a pickle file; Model.load(path) can memory-map the arrays.
+
+        Example usage:
+        model.save("shift_model")
+        """
+        import numpy as np
+        os.makedirs(path, exist_ok=True)
+
+        domains, domainIds = [], {}
+        def did(domain):
+            if id(domain) not in domainIds:
+                domainIds[id(domain)] = len(domains)
+                domains.append(tuple(domain))
+            return domainIds[id(domain)]
+
+        varIds = {}
+        plain = []  #(name, domain id) of the variables
+        for var in self.variables:
+            varIds[id(var)] = len(plain)
+            plain.append((var.name, did(var.domain)))
+        arrays, base, n = [], {}, len(plain)
+        for array in self.arrays.values():
+            base[array.prefix] = n
+            arrays.append((array.prefix, array.shape, did(array.domain), n))
+            n += array.size
+        overrides = {}  #variable id -> domain id of array variables with a tightened domain
+        for array in self.arrays.values():
+            for var in array.variables():
+                if var.domain is not array.domain:
+                    overrides[base[array.prefix] + var.pos] = did(var.domain)
+        fixed = []      #(variable id or name, domain id, value) of the variables fixed by presolve
+        for var in self.fixed:
+            if isinstance(var, IndexedVariable):
+                fixed.append((base[var.array.prefix] + var.pos, did(var.domain), var.value))
+            else:
+                fixed.append((var.name, did(var.domain), var.value))
+
+        def vid(var):
+            if isinstance(var, IndexedVariable):
+                return base[var.array.prefix] + var.pos
+            return varIds[id(var)]
+        def value(var, v):
+            domain = var.array.domain if isinstance(var, IndexedVariable) else var.domain
+            return domain.index(v)
+
+        linear, quadratic = [], []
+        shared = {}  #id of a term list shared by window constraints -> offset in linear
+        families, familyIds = [], {}
+        cons = []
+        for con in self.constraints:
+            if isinstance(con, Linear):
+                if isinstance(con, Window) and isinstance(con.terms, _TermView):
+                    if id(con.terms.base) not in shared:
+                        shared[id(con.terms.base)] = len(linear)
+                        linear.extend((c, vid(v), value(v, d)) for (c, v, d) in con.terms.base)
+                    start = shared[id(con.terms.base)] + con.terms.start
+                    stop = start + len(con.terms)
+                else:
+                    start = len(linear)
+                    linear.extend((c, vid(v), value(v, d)) for (c, v, d) in con.terms)
+                    stop = len(linear)
+                family = None
+                if isinstance(con, Window):
+                    if id(con.family) not in familyIds:
+                        familyIds[id(con.family)] = len(families)
+                        families.append(dict(con.family.__dict__, constraints=None))
+                    family = familyIds[id(con.family)]
+                cons.append(("linear", con.name, con.weight, con.rhs, con.direction, start, stop, family))
+            elif isinstance(con, Quadratic):
+                start = len(quadratic)
+                quadratic.extend((c, vid(v1), value(v1, d1), vid(v2), value(v2, d2))
+                                 for (c, v1, d1, v2, d2) in con.terms)
+                cons.append(("quadratic", con.name, con.weight, con.rhs, con.direction, start, len(quadratic), None))
+            elif isinstance(con, Alldiff):
+                cons.append(("alldiff", con.name, con.weight, [vid(v) for v in con.variables]))
+
+        np.save(os.path.join(path, "linear.npy"), np.array(linear, dtype=np.int64).reshape(-1, 3))
+        np.save(os.path.join(path, "quadratic.npy"), np.array(quadratic, dtype=np.int64).reshape(-1, 5))
+        header = {"name": self.name, "validation": self.validation, "Params": self.Params,
+                  "domains": domains, "variables": plain, "arrays": arrays, "overrides": overrides,
+                  "fixed": fixed, "families": families, "constraints": cons}
+        with open(os.path.join(path, "model.pkl"), "wb") as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        load ( path, mmap=True )
+        Load a model saved by Model.save(path).
+        If mmap is True, the term arrays are memory-mapped and the terms of a constraint are
+        decoded when they are used.
+
+        Return value:
+        New model object.
+
+        Example usage:
+        model = Model.load("shift_model")
+        """
+        import numpy as np
+        with open(os.path.join(path, "model.pkl"), "rb") as f:
+            header = pickle.load(f)
+        mode = "r" if mmap else None
+        linear = np.load(os.path.join(path, "linear.npy"), mmap_mode=mode)
+        quadratic = np.load(os.path.join(path, "quadratic.npy"), mmap_mode=mode)
+
+        model = cls(header["name"], header["validation"])
+        model.Params = header["Params"]
+        domains = [Domain.intern(d) for d in header["domains"]]
+        for (name, d) in header["variables"]:
+            var = Variable.__new__(Variable)
+            var.name, var.domain, var.value = name, domains[d], None
+            model.variables.append(var)
+            model.varDict[name] = var
+        table = list(model.variables)  #variable id -> variable object (or array, offset)
+        arrays = []
+        for (prefix, shape, d, start) in header["arrays"]:
+            array = model.arrays[prefix] = VariableArray(prefix, shape, domains[d], model.varDict)
+            arrays.append((start, array))
+        def var(k):
+            if k < len(table):
+                return table[k]
+            for (start, array) in reversed(arrays):
+                if k >= start:
+                    pos = k - start
+                    index = []
+                    for stride in array.strides:
+                        index.append(pos // stride)
+                        pos %= stride
+                    return array._var(tuple(index))
+        for (k, d) in header["overrides"].items():
+            var(k).domain = domains[d]
+        for (k, d, value) in header["fixed"]:
+            if type(k) == str:
+                v = Variable.__new__(Variable)
+                v.name, v.domain, v.value = k, domains[d], value
+            else:
+                v = var(k)
+                v.domain, v.value = domains[d], value
+            model.fixed.append(v)
+
+        families = []
+        for attrs in header["families"]:
+            family = WindowFamily.__new__(WindowFamily)
+            family.__dict__.update(attrs, constraints=[])
+            families.append(family)
+        for row in header["constraints"]:
+            if row[0] == "alldiff":
+                con = Alldiff.__new__(Alldiff)
+                con.__dict__.update(name=row[1], weight=row[2], lhs=0, variables=set(var(k) for k in row[3]))
+            else:
+                kind, name, weight, rhs, direction, start, stop, family = row
+                if kind == "quadratic":
+                    con = Quadratic.__new__(Quadratic)
+                    con.__dict__.update(weight=weight, terms=_PackedTerms(quadratic, start, stop, var))
+                elif family is not None:
+                    con = Window.__new__(Window)
+                    con.family = families[family]
+                    con.family.constraints.append(con)
+                    con.terms = _PackedTerms(linear, start, stop, var)
+                else:
+                    con = Linear.__new__(Linear)
+                    con.__dict__.update(weight=weight, terms=_PackedTerms(linear, start, stop, var))
+                con.__dict__.update(name=name, rhs=rhs, direction=direction, lhs=0)
+            model.constraints.append(con)
+        return model
+
+    def _stream(self, pipe, data, callback, trace, monitor=None):
+        """
+        pass data to the solver and read its output line by line,
+        appending every progress line to trace and calling callback(hard, soft, time, iteration)
+        (and monitor.progress(hard, soft) of a _StallMonitor);
+        return the whole output and None (stderr is not captured), like communicate()
+        The input is written by a thread while the output is read, as communicate() does,
+        so a solver writing more than the pipe buffer before reading all its input does not block.
+        """
+        def feed():
+            try:
+                pipe.stdin.write(data.encode())
+                pipe.stdin.close()
+            except (BrokenPipeError, OSError): #the solver stopped before reading the whole input
+                pass
+        writer = threading.Thread(target=feed, name="scop-stdin", daemon=True)
+        writer.start()
+        lines = []
+        for line in iter(pipe.stdout.readline, b""):
+            lines.append(line)
+            m = _progress.match(line.decode(errors="replace"))
+            if m:
+                hard, soft, time, iteration = int(m.group(1)), int(m.group(2)), float(m.group(3)), int(m.group(4))
+                trace.append(hard, soft, time, iteration)
+                if monitor is not None:
+                    monitor.progress(hard, soft)
+                callback(hard, soft, time, iteration)
+        pipe.stdout.close()
+        pipe.wait()
+        writer.join()
+        return b"".join(lines), None
+
 ##    def addConstraints(self,*cons):
 ##        for c in cons:
 ##            self.addConstraint(c)
 
-    def optimize(self):
+    def optimize(self, callback=None):
         """
-        optimize ()
+        optimize (callback=None)
         Optimize the model using scop.exe in the same directory.
 
+        Arguments:
+        - callback (optional): Function called as callback(hard, soft, time, iteration)
+            for every "penalty = ..." progress line while the solver is running.
+            When it is given the solver output is read line by line instead of all at once at the end.
+
+        Return value:
+        Dictionary of the solution (name -> value) and dictionary of the violated constraints (name -> violation).
+        The values of the variables of arrays are also kept in the arrays;
+        use VariableArray.codes() or VariableArray.frame() to get them without the names.
+
+        Example usage:
+        sol, violated = model.optimize()
+        schedule = x.codes()   # x = model.addVariableArray((n_staff, n_day), jobs)
+        sol, violated = model.optimize(callback=lambda hard, soft, time, iteration: print(hard, soft))
+        print(model.Runtime)   # time spent in each phase
+        """
+        rt = self.Runtime = Runtime(list(getattr(self, "_hooks", [])))
+        self.Trace = Trace(model=self.name, TimeLimit=self.Params.TimeLimit, RandomSeed=self.Params.RandomSeed)
+        profile = None
+        if getattr(self.Params, "Profile", False):
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+        start = _time.perf_counter()
+        try:
+            return self._optimize(callback, rt)
+        finally:
+            rt.stop()
+            rt.total = _time.perf_counter() - start
+            if profile is not None:
+                import pstats
+                profile.disable()
+                rt.profile = pstats.Stats(profile)
+            self._record(rt)
+
+    def _record(self, rt):
+        """
+        record the metrics of the solve in scop.metrics and emit the record of the solve to its sinks
+        """
+        metrics.inc("scop_solves_total", status=self.Status)
+        if rt.stopped:
+            metrics.inc("scop_early_stops_total", reason=rt.stopped)
+        metrics.observe("scop_solve_seconds", rt.total)
+        if "solver" in rt.phases:
+            metrics.observe("scop_solver_seconds", rt.phases["solver"])
+        if rt.penalty is not None:
+            metrics.set("scop_penalty_hard", rt.penalty[0])
+            metrics.set("scop_penalty_soft", rt.penalty[1])
+        if rt.size:
+            metrics.set("scop_model_variables", rt.size["variables"])
+            metrics.set("scop_model_constraints", rt.size["constraints"])
+            metrics.set("scop_model_terms", rt.size["terms"])
+            metrics.set("scop_model_input_bytes", rt.input_bytes)
+        record = rt.asDict()
+        record.update(event="optimize", time=dt.datetime.now().isoformat(), model=self.name, status=self.Status,
+                      TimeLimit=self.Params.TimeLimit, RandomSeed=self.Params.RandomSeed)
+        metrics.emit(record)
+
+    def addHook(self, hook):
+        """
+        addHook ( hook )
+        Add a function called as hook(phase, seconds, runtime) at the end of every phase of optimize()
+        (see Runtime.phases); e.g., to log the phases or to send them to a monitoring system.
+
         Example usage:
-        model.optimize()
+        model.addHook(lambda phase, seconds, runtime: print(phase, seconds))
         """
+        self._hooks.append(hook)
 
+    def _optimize(self, callback, rt):
+        """
+        body of optimize(); the phases are timed by rt
+        """
         time=self.Params.TimeLimit
         seed=self.Params.RandomSeed
         LOG=self.Params.OutputFlag
 
+        if self._unchecked:
+            rt.start("validate")
+            self.validate()
+        if self.Params.Presolve and self.template is None:
+            rt.start("presolve")
+            self.presolve()
+
+        rt.start("serialize")
         f = self.update()
+        rt.input_bytes = len(f.encode())
+        rt.size = self._size()
 
-        f3 = open("scop_input.txt","w")
+        rt.start("write")
+        work = self.Params.WorkDir or "."
+        f3 = open(os.path.join(work, "scop_input.txt"),"w")
         f3.write(f)
         f3.close()
+        rt.stop()
 
         if LOG>=100:
             print("scop input: \n")
@@ -246,14 +1978,33 @@ class Model(object):
 #             cmd = "./scop-linux -time "+str(time)+" -seed "+str(seed) #solver call for linux
 
 
+        solver = getattr(self.Params, "Solver", None) or os.environ.get("SCOP_SOLVER")
+        if solver:
+            #stand-in solver (e.g., benchmarks/scop_replay.py) with the same arguments
+            cmd = "{0} -time {1} -seed {2}".format(solver, time, seed)
+        elif self.Params.WorkDir is not None:
+            #the solver is in the current directory but runs in the work directory
+            exe, args = cmd.split(" ", 1)
+            cmd = '"{0}" {1}'.format(os.path.join(os.getcwd(), exe), args)
+
         if self.Params.Initial:
             cmd += " -initsolfile scop_best_data.txt"
 
+        stall = platform.system() != "Windows" and (
+            getattr(self.Params, "StallTime", None) is not None or getattr(self.Params, "StallFraction", None) is not None)
+        if stall and callback is None:
+            callback = lambda hard, soft, time, iteration: None #the output is streamed to watch the penalty
+
+        rt.start("spawn")
         try:
             if platform.system() == "Windows": #Winの場合にはコマンドをsplit!
-                pipe = subprocess.Popen(cmd.split(), stdout=subprocess.PIPE, stdin=subprocess.PIPE, shell=True)
+                pipe = subprocess.Popen(cmd.split(), stdout=subprocess.PIPE, stdin=subprocess.PIPE, shell=True, cwd=work)
+            elif stall:
+                #without a shell, so that the SIGINT of the early stop reaches the solver itself
+                import shlex
+                pipe = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stdin=subprocess.PIPE, cwd=work)
             else:
-                pipe = subprocess.Popen(cmd, stdout=subprocess.PIPE, stdin=subprocess.PIPE, shell=True)
+                pipe = subprocess.Popen(cmd, stdout=subprocess.PIPE, stdin=subprocess.PIPE, shell=True, cwd=work)
             print("\n ================ Now solving the problem ================ \n")
             #pipe = subprocess.Popen(cmd.split(), stdout=subprocess.PIPE,stdin=subprocess.PIPE)
         except OSError:
@@ -262,16 +2013,41 @@ class Model(object):
             self.Status = 7  #execution falied
             return None, None
 
-        out, err = pipe.communicate(f.encode()) #get the result
+        rt.start("solver")
+        metrics.inc("scop_solvers_running")
+        try:
+            if callback is None:
+                out, err = pipe.communicate(f.encode()) #get the result
+            elif not stall:
+                out, err = self._stream(pipe, f, callback, self.Trace)
+            else:
+                monitor = _StallMonitor(pipe, self.Params.StallTime, self.Params.StallFraction,
+                                        getattr(self.Params, "StallMinTime", 1))
+                try:
+                    out, err = self._stream(pipe, f, callback, self.Trace, monitor)
+                finally:
+                    monitor.close()
+                rt.stopped = monitor.reason
+        finally:
+            metrics.inc("scop_solvers_running", -1)
+        rt.stop()
+        rt.output_bytes = len(out)
         if err!=None:
             if int(sys.version_info[0])>=3:
                 err = str(err, encoding='utf-8')
-            f2 = open("scop_error.txt","w")
+            f2 = open(os.path.join(work, "scop_error.txt"),"w")
             f2.write(err)
             f2.close()
 
         if int(sys.version_info[0])>=3:
             out = str(out, encoding='utf-8')
+        m = _penalty.search(out)
+        if m:
+            rt.penalty = (int(m.group(1)), int(m.group(2)))
+        if callback is None:
+            self.Trace.extend(out)
+        self.Trace.meta["status"] = pipe.returncode
+        self.Trace.meta["stopped"] = rt.stopped
 
         if LOG:
             print (out, '\n')
@@ -279,19 +2055,45 @@ class Model(object):
         #print ("err=",err)
         #print("Return Code=",pipe.returncode)
 
-        f = open("scop_out.txt","w")
+        f = open(os.path.join(work, "scop_out.txt"),"w")
         f.write(out)
         f.close()
 
         #check the return code
         self.Status = pipe.returncode
+        if self.Status == 1 and rt.stopped and _incumbent in out:
+            #stopped by StallTime/StallFraction: the solver reports the interrupt (1) and its incumbent solution,
+            #which is the result of the solve like the best solution at the time limit
+            self.Status = 0
         if self.Status !=0: #if the return code is not "optimal", then return
             print("Status=",self.Status)
             print("Output=",out)
             return None, None
 
-        #extract the solution and the violated constraints
+        rt.start("parse")
+        sol, violated, best = self._parse(out)
+
+        #save the best solution
+        f3 = open(os.path.join(work, "scop_best_data.txt"),"w")
+        f3.write(best)
+        f3.close()
+
+        rt.start("assign")
+        self._assign(sol)
+        rt.start("evaluate")
+        self._evaluate()
+        rt.stop()
+        #return dictionaries containing the solution and the violated constraints
+        return sol,violated
+
+    def _parse(self, out):
+        """
+        extract the solution and the violated constraints from the solver output;
+        return the dictionaries and the text of the best solution (for scop_best_data.txt)
+        """
         s0 = "[best solution]"
+        if s0 not in out and _incumbent in out:
+            s0 = _incumbent  #the solver was interrupted (SIGINT)
         s1 = "penalty"
         s2 = "[Violated constraints]"
         i0 = out.find(s0) + len(s0)
@@ -299,11 +2101,7 @@ class Model(object):
         i2 = out.find(s2, i1) + len(s2)
 
         data = out[i0:i1].strip()
-
-        #save the best solution
-        f3 = open("scop_best_data.txt","w")
-        f3.write(data.lstrip())
-        f3.close()
+        best = data.lstrip()
 
         sol = {}
         if data != "":
@@ -326,45 +2124,174 @@ class Model(object):
                     violated[name] = value
                 else:
                     violated[name] = int(value)
+        return sol, violated, best
 
-        #set the optimal solution to the variable
+    def _assign(self, sol):
+        """
+        set the values of the solution to the variables (to the overlay of a clone);
+        the variables fixed by presolve are added to sol
+        """
+        if self.template is not None:
+            self._values, self._codes, self._lhs = {}, {}, {}
         for name in sol:
-            if name in self.varDict:
-                self.varDict[name].value = sol[name]
-            else:
+            if not self._setValue(name, sol[name]):
                 raise NameError("Solution {0} is not in variable list".format(name))
+        #variables fixed by presolve are not passed to the solver
+        for var in self.fixed:
+            sol[var.name] = var.value
+            if self.template is not None:
+                if isinstance(var, IndexedVariable):
+                    self._setValue(var.name, var.value)
+                else:
+                    self._values[var.name] = var.value
 
-        #evaluate the left hand sides of the constraints
+    def _evaluate(self):
+        """
+        evaluate the left hand sides of the constraints for the values of the solution
+        """
+        value = self.getValue
         for con in self.constraints:
 
             if isinstance(con,Linear):
                 lhs=0
                 for (coeff,var,domain) in con.terms:
-                    if var.value==domain:
+                    if value(var)==domain:
                         lhs+=coeff
 
-                con.lhs=lhs
             if isinstance(con,Quadratic):
                 lhs=0
                 #print con.terms
                 for (coeff,var1,domain1,var2,domain2) in con.terms:
-                    if var1.value==domain1 and var2.value==domain2:
+                    if value(var1)==domain1 and value(var2)==domain2:
                         lhs+=coeff
 
-                con.lhs=lhs
             if isinstance(con,Alldiff):
                 VarSet=set([])
                 lhs=0
                 for v in con.variables:
-                    index=v.domain.index(v.value)
+                    index=v.domain.index(value(v))
                     #print v,index
                     if index in VarSet:
                         lhs+=1
                     VarSet.add(index)
                 #print VarSet
+
+            if self.template is None:
                 con.lhs=lhs
-        #return dictionaries containing the solution and the violated constraints
-        return sol,violated
+            else:
+                self._lhs[id(con)]=lhs
+
+# Cell
+class Evaluator(object):
+    """
+    Evaluator ( model )
+    Stateful evaluator of the solution of a model for manual edits.
+    It starts from the last solution of the model (the values and left-hand sides evaluated by optimize())
+    and, when the value of one variable is changed, updates only the constraints that the variable appears in
+    (found by Model.invertedIndex), so one change costs O(degree of the variable).
+    Variables without a value count as taking none of their values (left-hand sides 0 without a solution).
+    The model itself is not changed.
+
+    Attributes:
+    - model: The model.
+    - hard, soft: Hard and soft penalties of the current values.
+    - violation: Dictionary that maps id(constraint) to its violation (0 if not violated).
+
+    Example usage:
+    sol, violated = model.optimize()
+    ev = Evaluator(model)
+    changed = ev.setValue(x, "1")   # [(constraint, old violation, new violation), ...]
+    print(ev.hard, ev.soft, ev.violated())
+    """
+    def __init__(self, model):
+        self.model = model
+        self.index = model.invertedIndex()
+        self.values = {}     #name -> value changed by setValue
+        self.lhs = {}
+        self.violation = {}
+        self.counts = {}     #id(Alldiff) -> Counter of the value indices
+        self.cons = {}       #id(constraint) -> constraint with the overrides of the model applied
+        self.hard, self.soft = 0, 0
+        for con in model.constraints:
+            effective = model._effective(con)
+            self.cons[id(con)] = effective
+            if isinstance(con, Alldiff):
+                #variables without a value (e.g., a fresh clone or a partial solution) are not counted
+                counts = self.counts[id(con)] = Counter(v.domain.index(model.getValue(v)) for v in con.variables
+                                                        if model.getValue(v) is not None)
+                lhs = sum(c - 1 for c in counts.values())
+            else:
+                lhs = model.getLhs(con) or 0
+            self.lhs[id(con)] = lhs
+            v = self.violation[id(con)] = _violation(effective, lhs)
+            self._add(effective, v)
+
+    def _add(self, con, violation):
+        if str(con.weight) == "inf":
+            self.hard += violation
+        else:
+            self.soft += int(con.weight) * violation
+
+    def getValue(self, var):
+        """
+        return the current value of the variable
+        """
+        if var.name in self.values:
+            return self.values[var.name]
+        return self.model.getValue(var)
+
+    def setValue(self, var, value):
+        """
+        setValue ( var, value )
+        Change the value of the variable and update the constraints that it appears in.
+
+        Return value:
+        List of (constraint, old violation, new violation) of the constraints whose violation changed.
+        """
+        value = str(value)
+        if value not in var.domain:
+            raise ValueError("value {0} is not in the domain of {1}".format(value, var.name))
+        old = self.getValue(var)
+        if old == value:
+            return []
+        self.values[var.name] = value
+        changed = []
+        for (con, entries) in self.index.get(var.name, []):
+            key = id(con)
+            if entries is None: #Alldiff
+                counts = self.counts[key]
+                j = var.domain.index(value)
+                delta = 1 if counts[j] >= 1 else 0
+                if old is not None:
+                    i = var.domain.index(old)
+                    delta -= 1 if counts[i] >= 2 else 0
+                    counts[i] -= 1
+                counts[j] += 1
+            elif isinstance(con, Quadratic):
+                delta = 0
+                for (coeff, v, other, w) in entries:
+                    if other.name == var.name: #both variables of the term are var
+                        delta += coeff * ((v == w == value) - (v == w == old))
+                    elif self.getValue(other) == w:
+                        delta += coeff * ((v == value) - (v == old))
+            else:
+                delta = sum(coeff * ((v == value) - (v == old)) for (coeff, v) in entries)
+            if delta == 0:
+                continue
+            self.lhs[key] += delta
+            effective = self.cons[key]
+            before = self.violation[key]
+            after = self.violation[key] = _violation(effective, self.lhs[key])
+            if after != before:
+                self._add(effective, after - before)
+                changed.append((con, before, after))
+        return changed
+
+    def violated(self):
+        """
+        return the dictionary of the violated constraints (name -> violation)
+        """
+        return {con.name: self.violation[id(con)] for con in self.model.constraints if self.violation[id(con)]}
 
 # Cell
 class Constraint(object):
@@ -372,6 +2299,7 @@ class Constraint(object):
      Constraint base class
     """
     ID=0
+    VERSION=0  #incremented by every change of a constraint; part of the key of Model.invertedIndex
     def __init__(self,name=None,weight=1):
         if name==None or name=="":
             name="__CON[{0}]".format(Constraint.ID)
@@ -384,6 +2312,7 @@ class Constraint(object):
 
     def setWeight(self,weight):
         self.weight = str(weight)
+        Constraint.VERSION += 1
 
 # Cell
 class Linear(Constraint):
@@ -449,6 +2378,10 @@ class Linear(Constraint):
             L.addTerms(1, y, "A")
             L.addTerms([2, 3, 1], [y, y, z], ["C", "D", "C"]) #2 X[y,"C"]+3 X[y,"D"]+1 X[z,"C"]
         """
+        if type(self.terms) != list:
+            #terms shared with other constraints (e.g. a window family or a snapshot); take a private copy
+            self.terms = list(self.terms)
+        Constraint.VERSION += 1
         if type(coeffs) !=type([]): #need a check whether coeffs is numeric ...
             #arguments are not a list; add a term
             if type(coeffs)==type(1):  #整数の場合だけ追加する．
@@ -468,10 +2401,12 @@ class Linear(Constraint):
             raise ValueError("Right-hand-side must be an integer.")
         else:
             self.rhs = rhs
+            Constraint.VERSION += 1
 
     def setDirection(self,direction="<="):
         if direction in ["<=",">=","="]:
             self.direction = direction
+            Constraint.VERSION += 1
         else:
             raise NameError(
                 "direction setting error; direction should be one of '<=', '>=', or '='"
@@ -482,12 +2417,98 @@ class Linear(Constraint):
         return True if the constraint is defined correctly
         """
         for (coeff,var,value) in self.terms:
-            if var.name not in allvars:
-                raise NameError("no variable in the problem instance named %r" % var.name)
-            if value not in allvars[var.name].domain:
+            if value not in _domainOf(var, allvars):
                 raise NameError("no value %r for the variable named %r" % (value, var.name))
         return True
 
+# Cell
+class _TermView(object):
+    """
+    Read-only view of the terms [start, stop) of a term list shared by several constraints.
+    """
+    __slots__ = ("base", "start", "stop")
+
+    def __init__(self, base, start, stop):
+        self.base = base
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        base = self.base
+        for k in range(self.start, self.stop):
+            yield base[k]
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return self.base[self.start:self.stop][k]
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError("term index out of range")
+        return self.base[self.start + k]
+
+class WindowFamily(object):
+    """
+    Family of sliding-window linear constraints generated by Model.addWindowConstraints.
+
+    Attributes:
+    - name: Name of the family.
+    - weight: Weight shared by all the constraints of the family.
+    - window: Length of the window.
+    - rhs: Right-hand-side constant of each constraint.
+    - direction: Direction (or sense) of each constraint; "<=", ">=" or "=".
+    - constraints: List of Window constraint objects.
+    """
+    def __init__(self, name, weight=1, window=1, rhs=0, direction="<="):
+        if type(name) != str or name == "":
+            raise ValueError("Constraint family name must be a non-empty string")
+        if type(rhs) != type(1):
+            raise ValueError("Right-hand-side must be an integer.")
+        if direction not in ["<=", ">=", "="]:
+            raise NameError("direction setting error;direction should be one of '<=', '>=', or '='")
+        self.name = name.translate( _trans )
+        self.weight = str(weight)
+        self.window = window
+        self.rhs = rhs
+        self.direction = direction
+        self.constraints = []
+
+    def __len__(self):
+        return len(self.constraints)
+
+    def __iter__(self):
+        return iter(self.constraints)
+
+    def setWeight(self, weight):
+        self.weight = str(weight)
+        Constraint.VERSION += 1
+
+    def __str__(self):
+        return "{0}: weight= {1} window= {2} {3}{4} ({5} constraints)".format(
+            self.name, self.weight, self.window, self.direction, self.rhs, len(self.constraints))
+
+class Window(Linear):
+    """
+    Linear constraint belonging to a WindowFamily.
+    The terms are a view of the term list of its row and the weight is the weight of the family;
+    setting the weight of one constraint sets the weight of the whole family.
+    """
+    def __init__(self, family, name, base, start, stop):
+        self.family = family
+        super(Window,self).__init__(name, family.weight, family.rhs, family.direction)
+        self.terms = _TermView(base, start, stop)
+
+    @property
+    def weight(self):
+        return self.family.weight
+
+    @weight.setter
+    def weight(self, weight):
+        self.family.weight = str(weight)
+
 # Cell
 class Quadratic(Constraint):
     """
@@ -558,6 +2579,10 @@ class Quadratic(Constraint):
                   #2 X[y,"C"] X[x,"A"]+3 X[y,"D"] X[x,"B"]+1 X[z,"C"] X[y,"C"]
 
         """
+        if type(self.terms) != list:
+            #terms of a loaded snapshot; take a private copy
+            self.terms = list(self.terms)
+        Constraint.VERSION += 1
         if type(coeffs) !=type([]):
             if type(coeffs)==type(1):  #整数の場合だけ追加する．
                 self.terms.append( (coeffs,vars,str(values),vars2,str(values2)))
@@ -578,10 +2603,12 @@ class Quadratic(Constraint):
             raise ValueError("Right-hand-side must be an integer.")
         else:
             self.rhs = rhs
+            Constraint.VERSION += 1
 
     def setDirection(self,direction="<="):
         if direction in ["<=", ">=", "="]:
             self.direction = direction
+            Constraint.VERSION += 1
         else:
             raise NameError(
                 "direction setting error;direction should be one of '<=', '>=', or '='"
@@ -592,13 +2619,11 @@ class Quadratic(Constraint):
           return True if the constraint is defined correctly
         """
         for (coeff,var1,value1,var2,value2) in self.terms:
-            if var1.name not in allvars:
-                raise NameError("no variable in the problem instance named %r" % var1.name)
-            if var2.name not in allvars:
-                raise NameError("no variable in the problem instance named %r" % var2.name)
-            if value1 not in allvars[var1.name].domain:
+            domain1 = _domainOf(var1, allvars)
+            domain2 = _domainOf(var2, allvars)
+            if value1 not in domain1:
                 raise NameError("no value %r for the variable named %r" % (value1, var1.name))
-            if value2 not in allvars[var2.name].domain:
+            if value2 not in domain2:
                 raise NameError("no value %r for the variable named %r" % (value2, var2.name))
         return True
 
@@ -662,6 +2687,7 @@ class Alldiff(Constraint):
             print("duplicate variable name error when adding variable %r" % var)
             return False
         self.variables.add(var)
+        Constraint.VERSION += 1
 
     def addVariables(self, varlist):
         """
@@ -686,25 +2712,244 @@ class Alldiff(Constraint):
            return True if the constraint is defined correctly
         """
         for var in self.variables:
-            if var.name not in allvars:
-                raise NameError("no variable in the problem instance named %r" % var.name)
+            _domainOf(var, allvars)
         return True
 
 # Cell
-def plot_scop(file_name: str="scop_out.txt"):
-    with open(file_name) as f:
-        out = f.readlines()
-    x, y1, y2 = [],[],[]
-    for l in out[5:]:
-        sep = re.split("[=()/]", l)
-        #print(sep)
-        if sep[0] == '# penalty ':
-            break
-        if sep[0] == 'penalty ':
-            hard, soft, cpu = map(float, [ sep[1], sep[2], sep[6]])
-            x.append(cpu)
-            y1.append(hard)
-            y2.append(soft)
+class _PackedTerms(object):
+    """
+    Read-only view of the rows [start, stop) of an integer term array of a snapshot (see Model.load).
+    Each row is (coeff, variable id, value index) for linear terms and
+    (coeff, variable id, value index, variable id, value index) for quadratic terms;
+    the terms are decoded into tuples when they are iterated.
+    """
+    __slots__ = ("base", "start", "stop", "var")
+
+    def __init__(self, base, start, stop, var):
+        self.base = base
+        self.start = start
+        self.stop = stop
+        self.var = var  #function that maps a variable id to the variable object
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def _term(self, row):
+        term = [row[0]]
+        for k in range(1, len(row), 2):
+            var = self.var(row[k])
+            domain = var.array.domain if isinstance(var, IndexedVariable) else var.domain
+            term.append(var)
+            term.append(domain[row[k+1]])
+        return tuple(term)
+
+    def __iter__(self):
+        for row in self.base[self.start:self.stop].tolist():
+            yield self._term(row)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self._term(row) for row in self.base[self.start:self.stop][k].tolist()]
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError("term index out of range")
+        return self._term(self.base[self.start + k].tolist())
+
+# Cell
+class Trace(object):
+    """
+    Penalty trajectory of a solve: one point per progress line of the solver
+    ("penalty = hard/soft (hard/soft), time = t(s), iteration = n"), recorded by Model.optimize() (Model.Trace).
+    The points are kept in compact typed arrays and returned as NumPy arrays.
+
+    Attributes:
+    - time: CPU time of the points (seconds; NumPy float64 array).
+    - hard, soft, iteration: Hard penalty, soft penalty and iteration of the points (NumPy int64 arrays).
+    - meta: Dictionary of the model name, TimeLimit, RandomSeed and status of the solve.
+
+    Example usage:
+    sol, violated = model.optimize()
+    model.Trace.save("run1.npz")
+    traces = [Trace.load(f) for f in ["run1.npz", "run2.npz"]]
+    stats = Trace.aggregate(traces, target=100)
+    """
+    def __init__(self, **meta):
+        self._time = carray("d")
+        self._hard = carray("q")
+        self._soft = carray("q")
+        self._iteration = carray("q")
+        self.meta = meta
+
+    def append(self, hard, soft, time, iteration):
+        """
+        append(hard, soft, time, iteration)
+        Add a point.
+        """
+        self._hard.append(hard)
+        self._soft.append(soft)
+        self._time.append(time)
+        self._iteration.append(iteration)
+
+    def extend(self, text):
+        """
+        extend(text)
+        Add the points of the progress lines in the solver output text (e.g., an old scop_out.txt).
+        """
+        for m in _progressLines.finditer(text):
+            self.append(int(m.group(1)), int(m.group(2)), float(m.group(3)), int(m.group(4)))
+
+    def __len__(self):
+        return len(self._time)
+
+    def _array(self, data, dtype):
+        import numpy as np
+        return np.frombuffer(data, dtype=dtype) if len(data) else np.zeros(0, dtype=dtype)
+
+    @property
+    def time(self):
+        return self._array(self._time, "float64")
+
+    @property
+    def hard(self):
+        return self._array(self._hard, "int64")
+
+    @property
+    def soft(self):
+        return self._array(self._soft, "int64")
+
+    @property
+    def iteration(self):
+        return self._array(self._iteration, "int64")
+
+    def final(self):
+        """
+        final()
+        Return the last (hard, soft) penalty; None if the trace is empty.
+        """
+        if not len(self):
+            return None
+        return (self._hard[-1], self._soft[-1])
+
+    def at(self, times):
+        """
+        at(times)
+        Return the hard and soft penalties at the given times as NumPy float arrays
+        (the penalty of the last point at or before each time; NaN before the first point).
+        """
+        import numpy as np
+        times = np.asarray(times, dtype=float)
+        k = np.searchsorted(self.time, times, side="right") - 1
+        hard = np.where(k >= 0, self.hard[np.maximum(k, 0)] if len(self) else 0, np.nan)
+        soft = np.where(k >= 0, self.soft[np.maximum(k, 0)] if len(self) else 0, np.nan)
+        return hard, soft
+
+    def timeToTarget(self, soft, hard=0):
+        """
+        timeToTarget(soft, hard=0)
+        Return the first time at which the hard penalty is at most hard and the soft penalty is at most soft
+        (inf if the target is not reached).
+        """
+        import numpy as np
+        reached = (self.hard <= hard) & (self.soft <= soft)
+        if not reached.any():
+            return float("inf")
+        return float(self.time[np.argmax(reached)])
+
+    def downsample(self, n=1000):
+        """
+        downsample(n=1000)
+        Return the indices of at most about n points spread evenly over the time range
+        (always including the first and the last point), for plotting long traces.
+        """
+        import numpy as np
+        if len(self) <= n:
+            return np.arange(len(self))
+        time = self.time
+        grid = np.linspace(time[0], time[-1], n)
+        k = np.searchsorted(time, grid, side="right") - 1
+        return np.unique(np.concatenate([[0], k, [len(self) - 1]]))
+
+    def save(self, path):
+        """
+        save(path)
+        Save the trace to a compressed NumPy file (.npz); path can also be a file object.
+        """
+        import numpy as np
+        np.savez_compressed(path, time=self.time, hard=self.hard, soft=self.soft, iteration=self.iteration,
+                            meta=np.array(json.dumps(self.meta, default=str)))
+
+    @classmethod
+    def load(cls, path):
+        """
+        load(path)
+        Load a trace saved by Trace.save(path).
+        """
+        import numpy as np
+        with np.load(path) as data:
+            trace = cls(**json.loads(str(data["meta"])))
+            trace._time.frombytes(data["time"].astype("float64").tobytes())
+            trace._hard.frombytes(data["hard"].astype("int64").tobytes())
+            trace._soft.frombytes(data["soft"].astype("int64").tobytes())
+            trace._iteration.frombytes(data["iteration"].astype("int64").tobytes())
+        return trace
+
+    @classmethod
+    def aggregate(cls, traces, times=None, target=None, hard=0):
+        """
+        aggregate(traces, times=None, target=None, hard=0)
+        Return statistics of several traces (e.g., runs with different seeds) as a dictionary:
+        - times: Time grid (times, or 100 points up to the longest trace).
+        - soft: Soft penalties of the traces on the grid (runs x times; NaN before the first point).
+        - median, q25, q75, best, worst: Soft penalty statistics on the grid (over the runs with a point).
+        - final: Final (hard, soft) penalties of the traces.
+        - ttt: Time-to-target of the traces (with target; inf if not reached).
+        - success: Fraction of the traces that reached the target (with target).
+        """
+        import numpy as np
+        if times is None:
+            end = max([t.time[-1] for t in traces if len(t)] or [0.])
+            times = np.linspace(0., end, 100)
+        times = np.asarray(times, dtype=float)
+        soft = np.array([t.at(times)[1] for t in traces]).reshape(len(traces), len(times))
+        defined = ~np.isnan(soft).all(axis=0)
+        def stat(func):
+            out = np.full(len(times), np.nan)
+            if defined.any():
+                out[defined] = func(soft[:, defined], axis=0)
+            return out
+        ret = {
+            "times": times, "soft": soft,
+            "median": stat(np.nanmedian), "best": stat(np.nanmin), "worst": stat(np.nanmax),
+            "q25": stat(lambda a, axis: np.nanpercentile(a, 25, axis=axis)),
+            "q75": stat(lambda a, axis: np.nanpercentile(a, 75, axis=axis)),
+            "final": [t.final() for t in traces],
+            }
+        if target is not None:
+            ttt = np.array([t.timeToTarget(target, hard) for t in traces])
+            ret["ttt"] = ttt
+            ret["success"] = float(np.isfinite(ttt).mean()) if len(ttt) else 0.
+        return ret
+
+# Cell
+def plot_scop(file_name="scop_out.txt", max_points=1000):
+    """
+    plot_scop(file_name="scop_out.txt", max_points=1000)
+    Return a plotly figure of the hard and soft penalties over the CPU time.
+
+    Arguments:
+    - file_name: Trace object (e.g., Model.Trace) or the name of a solver output file.
+    - max_points: Long traces are downsampled to about this number of points (see Trace.downsample).
+    """
+    import plotly.graph_objs as go
+
+    trace = file_name
+    if not isinstance(trace, Trace):
+        trace = Trace()
+        with open(file_name) as f:
+            trace.extend(f.read())
+    k = trace.downsample(max_points)
+    x, y1, y2 = trace.time[k], trace.hard[k], trace.soft[k]
 
     fig = go.Figure()
     fig.add_trace(go.Scatter(
@@ -0,0 +1,73 @@
+"""Isolation of clones (and clones of clones) from their template and from each other."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scop import Model, Linear
+
+
+def base_model():
+    m = Model("base")
+    x = m.addVariableArray((2, 6), [0, 1], "x")
+    L = Linear("L", weight=1, rhs=1, direction=">=")
+    L.addTerms(1, x[0, 0], 1)
+    m.addConstraint(L)
+    return m, x, L
+
+
+def names(m):
+    return [con.name for con in m.constraints]
+
+
+def test_clone_window_constraints_do_not_leak():
+    m, x, L = base_model()
+    c1, c2 = m.clone(), m.clone()
+    F = c1.addWindowConstraints("W", x[:, :], 0, 2, 1, direction=">=")
+    assert len(F) == 10
+    assert names(m) == ["L"]
+    assert names(c2) == ["L"]
+    assert len(c1.constraints) == 11
+    assert "W[0_0]:" in c1.update() and "W[0_0]:" not in m.update() and "W[0_0]:" not in c2.update()
+
+
+def test_clone_of_clone_weight_and_rhs():
+    m, x, L = base_model()
+    c1 = m.clone()
+    c1.setWeight(L, 5)
+    c1.setRhs(L, 2)
+    c2 = c1.clone()
+    assert (c2._effective(L).weight, c2._effective(L).rhs) == ("5", 2)  #inherited from the parent
+
+    c2.setWeight(L, 99)
+    c2.setRhs(L, 3)
+    assert (c1._effective(L).weight, c1._effective(L).rhs) == ("5", 2)
+    assert (c2._effective(L).weight, c2._effective(L).rhs) == ("99", 3)
+    assert (L.weight, L.rhs) == ("1", 1)
+
+
+def test_clone_of_clone_family_weight():
+    m, x, L = base_model()
+    F = m.addWindowConstraints("W", x[:, :], 0, 2, 1, direction=">=")
+    c1 = m.clone()
+    c1.setWeight(F, 7)
+    c2 = c1.clone()
+    c2.setWeight(F, 8)
+    assert c1._effective(F.constraints[0]).weight == "7"
+    assert c2._effective(F.constraints[0]).weight == "8"
+    assert F.weight == "1"
+
+
+def test_clone_of_clone_constraints():
+    m, x, L = base_model()
+    c3 = m.clone()
+    L2 = Linear("L2", weight=1, rhs=0, direction="<=")
+    L2.addTerms(1, x[1, 1], 1)
+    c3.addConstraint(L2)
+    c4 = c3.clone()
+    L3 = Linear("L3", weight=1, rhs=0, direction="<=")
+    L3.addTerms(1, x[1, 2], 1)
+    c4.addConstraint(L3)
+    assert names(m) == ["L"]
+    assert names(c3) == ["L", "L2"]
+    assert names(c4) == ["L", "L2", "L3"]
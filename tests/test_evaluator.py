@@ -0,0 +1,122 @@
+"""Randomized check of Evaluator (incremental deltas) against a full rescore of the model."""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scop import Model, Linear, Quadratic, Alldiff, Evaluator
+
+
+def random_model(rng):
+    """model with scalar and array variables and Linear, Quadratic and Alldiff constraints; values set"""
+    m = Model("random")
+    domain = ["0", "1", "2", "3"]
+    scalars = [m.addVariable("y{0}".format(k), domain) for k in range(6)]
+    x = m.addVariableArray((3, 4), domain, "x")
+    variables = scalars + [var for row in x[:, :] for var in row]
+
+    for k in range(30):
+        con = Linear("L{0}".format(k), weight=rng.choice(["inf", 1, 3, 7]), rhs=rng.randint(-2, 4),
+                     direction=rng.choice(["<=", ">=", "="]))
+        for _ in range(rng.randint(1, 6)):
+            con.addTerms(rng.randint(-3, 3), rng.choice(variables), rng.choice(domain))
+        m.addConstraint(con)
+    for k in range(10):
+        con = Quadratic("Q{0}".format(k), weight=rng.choice(["inf", 2, 5]), rhs=rng.randint(0, 3),
+                        direction=rng.choice(["<=", ">=", "="]))
+        for _ in range(rng.randint(1, 4)):
+            var1 = rng.choice(variables)
+            var2 = var1 if rng.random() < 0.2 else rng.choice(variables)  #terms of one variable, too
+            con.addTerms(rng.randint(-2, 3), var1, rng.choice(domain), var2, rng.choice(domain))
+        m.addConstraint(con)
+    for k in range(3):
+        con = Alldiff("A{0}".format(k), rng.sample(scalars, 3), weight=rng.choice(["inf", 4]))
+        m.addConstraint(con)
+
+    for var in variables:
+        set_value(m, var, rng.choice(domain))
+    m._evaluate()
+    return m, variables, domain
+
+
+def set_value(m, var, value):
+    if var.name in m.varDict:
+        var.value = value
+    else:
+        m._setValue(var.name, value)
+
+
+def rescore(m):
+    """hard and soft penalties of the current values, evaluated from scratch"""
+    m._evaluate()
+    hard = soft = 0
+    for con in m.constraints:
+        v = m.getViolation(con)
+        if con.weight == "inf":
+            hard += v
+        else:
+            soft += int(con.weight) * v
+    return hard, soft
+
+
+def test_evaluator_matches_rescore():
+    rng = random.Random(0)
+    for trial in range(5):
+        m, variables, domain = random_model(rng)
+        ev = Evaluator(m)
+        assert (ev.hard, ev.soft) == rescore(m)
+        for step in range(200):
+            var, value = rng.choice(variables), rng.choice(domain)
+            ev.setValue(var, value)
+            set_value(m, var, value)
+            assert (ev.hard, ev.soft) == rescore(m), (trial, step)
+        assert ev.violated() == {con.name: m.getViolation(con) for con in m.constraints if m.getViolation(con)}
+
+
+def test_inverted_index_follows_constraint_changes():
+    m = Model("index")
+    a = m.addVariable("a", [0, 1])
+    b = m.addVariable("b", [0, 1])
+    con = Linear("c", weight=1, rhs=0, direction="<=")
+    con.addTerms(1, a, 1)
+    m.addConstraint(con)
+    assert [c for c, _ in m.invertedIndex()["a"]] == [con]
+    assert "b" not in m.invertedIndex()
+
+    #terms added to an existing constraint
+    con.addTerms(2, b, 1)
+    assert m.invertedIndex()["b"] == [(con, [(2, "1")])]
+
+    #the right-hand side changed after the index was built
+    a.value, b.value = "1", "0"
+    m._evaluate()
+    index = m.invertedIndex()
+    con.setRhs(1)
+    assert m.invertedIndex() is not index
+    ev = Evaluator(m)
+    assert ev.soft == 0
+    ev.setValue(b, 1)
+    assert ev.soft == 2
+
+
+def test_evaluator_without_values():
+    #a fresh clone (no solution) with an Alldiff constraint: unassigned variables are not counted
+    m = Model("partial")
+    y = [m.addVariable("y{0}".format(k), ["0", "1", "2"]) for k in range(3)]
+    m.addConstraint(Alldiff("A", y, weight=5))
+    con = Linear("L", weight=2, rhs=1, direction=">=")
+    con.addTerms(1, y[0], "1")
+    m.addConstraint(con)
+    c = m.clone()
+    ev = Evaluator(c)
+    assert (ev.hard, ev.soft) == (0, 2)  #only L (lhs 0 < 1) is violated
+    ev.setValue(y[0], "1")
+    assert (ev.hard, ev.soft) == (0, 0)
+    ev.setValue(y[1], "1")
+    assert ev.violated() == {"A": 1}
+    ev.setValue(y[2], "1")
+    assert ev.violated() == {"A": 2}
+    ev.setValue(y[1], "2")
+    assert ev.violated() == {"A": 1}
+    assert ev.soft == 5